@@ -1,15 +1,23 @@
 # app/api/admin.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, class_mapper
-from sqlalchemy import inspect, func
-from typing import Dict, Any
+from sqlalchemy import Integer, String, false, inspect, func, or_, select
+from typing import Dict, Any, List, Optional
+from decimal import Decimal
+import json
 import math
 import time
 import traceback
 from datetime import date, time as dt_time
 
-from app.database import get_db
+from app.database import get_db, get_read_db, ReadSessionLocal
+from app.services.stop_patterns import refresh_stop_patterns
+from app.services.calendar_service import invalidate_calendar_cache
+from app.services.departure_board import departure_index
+from app.services.feed_snapshot import invalidate_feed_snapshot
+from app.services.spatial_index import invalidate_spatial_index
 from app.models import gtfs_models
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -63,26 +71,180 @@ async def inspect_table(table_name: str):
          traceback.print_exc()
          raise HTTPException(status_code=500, detail=f"Error interno al inspeccionar '{table_name}': {str(e)}")
 
-# --- ✅ Endpoint /{table_name} MODIFICADO (sin paginación) ---
+# --- Auxiliares de paginación / proyección / streaming ---
+STREAM_BATCH_SIZE = 5000
+MAX_PAGE_SIZE = 5000
+# Parámetros propios del endpoint (el resto se interpretan como filtros por columna)
+RESERVED_QUERY_PARAMS = {"limit", "offset", "cursor", "columns", "format", "include_total", "search"}
+
+def _indexed_columns(model) -> set:
+    """Columnas por las que se permite filtrar (PK, index=True, unique o primera columna de un índice)."""
+    table = model.__table__
+    names = {c.name for c in table.columns if c.primary_key or c.index or c.unique}
+    for idx in table.indexes:
+        cols = list(idx.columns)
+        if cols:
+            names.add(cols[0].name)
+    return names
+
+def _resolve_columns(model, pk_col: str, columns: Optional[str]) -> List[Any]:
+    """Proyección de columnas; la PK siempre se incluye porque es el cursor."""
+    table_columns = model.__table__.columns
+    if not columns:
+        return list(table_columns)
+    requested = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in requested if c not in table_columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Columnas inexistentes en '{model.__tablename__}': {unknown}")
+    if pk_col not in requested:
+        requested.insert(0, pk_col)
+    return [table_columns[c] for c in requested]
+
+def _build_filters(model, query_params) -> List[Any]:
+    """Convierte ?columna=valor en condiciones WHERE, solo sobre columnas indexadas."""
+    allowed = _indexed_columns(model)
+    conditions = []
+    for key, value in query_params.items():
+        if key in RESERVED_QUERY_PARAMS:
+            continue
+        col = model.__table__.columns.get(key)
+        if col is None:
+            raise HTTPException(status_code=400, detail=f"Filtro inválido: columna '{key}' no existe.")
+        if key not in allowed:
+            raise HTTPException(status_code=400, detail=f"Filtro no permitido: '{key}' no es una columna indexada. Indexadas: {sorted(allowed)}")
+        try:
+            conditions.append(col == _convert_value(value, col))
+        except ValueError as conversion_error:
+            raise HTTPException(status_code=400, detail=f"Filtro '{key}': {conversion_error}")
+    return conditions
+
+def _search_condition(model, search: Optional[str]) -> Optional[Any]:
+    """
+    ?search=texto del visor de tablas: subcadena sin distinguir mayúsculas en las
+    columnas de texto indexadas, o igualdad en las enteras indexadas si es un número.
+    """
+    term = (search or "").strip()
+    if not term:
+        return None
+    allowed = _indexed_columns(model)
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    clauses = []
+    for col in model.__table__.columns:
+        if col.name not in allowed:
+            continue
+        if isinstance(col.type, String):
+            clauses.append(col.ilike(f"%{escaped}%", escape="\\"))
+        elif isinstance(col.type, Integer) and term.lstrip("-").isdigit():
+            clauses.append(col == int(term))
+    # Sin columnas buscables para el texto: ninguna fila coincide
+    return or_(*clauses) if clauses else false()
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, dt_time)):
+        return value.isoformat()
+    return str(value)
+
+def _stream_ndjson(model, pk_col: str, selected_columns: List[Any], conditions: List[Any]):
+    """Genera el volcado completo en NDJSON recorriendo la tabla por keyset (lotes por PK)."""
+    pk_attr = model.__table__.columns[pk_col]
+    names = [c.name for c in selected_columns]
+    db = ReadSessionLocal()
+    try:
+        last_pk = None
+        while True:
+            stmt = select(*selected_columns).where(*conditions)
+            if last_pk is not None:
+                stmt = stmt.where(pk_attr > last_pk)
+            rows = db.execute(stmt.order_by(pk_attr).limit(STREAM_BATCH_SIZE)).all()
+            if not rows:
+                break
+            chunk = "".join(json.dumps(dict(zip(names, row)), default=_json_default) + "\n" for row in rows)
+            yield chunk
+            last_pk = getattr(rows[-1], pk_col)
+            if len(rows) < STREAM_BATCH_SIZE:
+                break
+    finally:
+        db.close()
+
+# --- ✅ Endpoint /{table_name} con paginación keyset opcional ---
 @router.get("/{table_name}")
 async def get_table_data(
-    table_name: str, 
-    db: Session = Depends(get_db)
+    table_name: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Tamaño de página. Sin limit se devuelve toda la tabla (modo legacy)."),
+    cursor: Optional[str] = Query(None, description="Última PK recibida (keyset). Devuelta como next_cursor."),
+    offset: Optional[int] = Query(None, ge=0, description="Desplazamiento legacy; preferir cursor."),
+    columns: Optional[str] = Query(None, description="Columnas a devolver, separadas por coma."),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="'ndjson' transmite la tabla completa en streaming."),
+    include_total: bool = Query(True, description="Incluye el total de registros (COUNT) en modo paginado."),
+    search: Optional[str] = Query(None, description="Texto a buscar en las columnas indexadas (visor de tablas)."),
+    db: Session = Depends(get_read_db)
 ):
-    """Obtiene TODOS los registros de una tabla."""
-    print(f"[Data API] Solicitud para TODOS los registros de: {table_name}")
+    """
+    Obtiene registros de una tabla.
+
+    - Sin parámetros: TODOS los registros (compatibilidad con clientes existentes).
+    - limit (+ cursor): página ordenada por PK con `next_cursor` para la siguiente.
+    - columns: proyección de columnas.
+    - ?<columna>=<valor>: filtros de igualdad sobre columnas indexadas.
+    - search: subcadena en columnas de texto indexadas (o igualdad si es un número entero).
+    - format=ndjson: volcado completo en streaming (una fila JSON por línea).
+    """
+    print(f"[Data API] Solicitud de registros de: {table_name} (limit={limit}, cursor={cursor}, format={format})")
     data_start_time = time.time()
     try:
         model, pk_col = get_model_and_pk(table_name)
-        
-        # Obtiene TODOS los datos, ordenados por la PK para consistencia
-        data = db.query(model).order_by(getattr(model, pk_col)).all()
-        
+        pk_attr = getattr(model, pk_col)
+        conditions = _build_filters(model, request.query_params)
+        search_condition = _search_condition(model, search)
+        if search_condition is not None:
+            conditions.append(search_condition)
+        selected_columns = _resolve_columns(model, pk_col, columns)
+
+        if format == "ndjson":
+            return StreamingResponse(
+                _stream_ndjson(model, pk_col, selected_columns, conditions),
+                media_type="application/x-ndjson",
+                headers={"Content-Disposition": f"attachment; filename={table_name}.ndjson"}
+            )
+
+        if limit is None and not conditions and not columns:
+            # Modo legacy: obtiene TODOS los datos, ordenados por la PK para consistencia
+            data = db.query(model).order_by(pk_attr).all()
+            total_request_time = time.time() - data_start_time
+            print(f"  -> Obtenidos {len(data)} registros ({table_name}). Total time: {total_request_time:.3f} s")
+            return data
+
+        stmt = select(*selected_columns).where(*conditions)
+        if cursor is not None:
+            try:
+                typed_cursor = _convert_value(cursor, model.__table__.columns[pk_col])
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Cursor '{cursor}' inválido.")
+            stmt = stmt.where(pk_attr > typed_cursor)
+        stmt = stmt.order_by(pk_attr)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+            if cursor is None and offset:
+                stmt = stmt.offset(offset)
+
+        rows = db.execute(stmt).all()
+        names = [c.name for c in selected_columns]
+        data = [dict(zip(names, row)) for row in rows]
+
         total_request_time = time.time() - data_start_time
         print(f"  -> Obtenidos {len(data)} registros ({table_name}). Total time: {total_request_time:.3f} s")
-        
-        # Devuelve la lista de datos directamente
-        return data
+
+        if limit is None:
+            return data
+
+        total = None
+        if include_total:
+            total = db.execute(select(func.count()).select_from(model.__table__).where(*conditions)).scalar()
+        next_cursor = data[-1][pk_col] if len(data) == limit else None
+        return {"data": data, "total": total, "next_cursor": next_cursor, "limit": limit}
         
     except HTTPException as http_exc:
         print(f"  -> Error HTTP al obtener datos de {table_name}: {http_exc.detail}")
@@ -119,7 +281,35 @@ def _convert_value(value: Any, col: Any) -> Any:
             raise ValueError(f"Valor '{value}'. No se pudo convertir a {error_type_guess}. ({conv_err})")
     return target_value
 
-# --- Endpoint POST /{table_name} (Sin cambios) ---
+# --- Patrones de paradas: los cambios en trips/stop_times recalculan las rutas afectadas ---
+PATTERN_SOURCE_TABLES = {"trips", "stop_times"}
+
+def _pattern_route_ids(db: Session, table_name: str, item: Any) -> set:
+    if table_name not in PATTERN_SOURCE_TABLES or item is None:
+        return set()
+    if table_name == "trips":
+        return {item.route_id}
+    return {db.query(gtfs_models.Trip.route_id).filter(gtfs_models.Trip.trip_id == item.trip_id).scalar()}
+
+CALENDAR_TABLES = {"calendar", "calendar_dates"}
+SNAPSHOT_TABLES = {"stops", "routes", "shapes", "trips", "stop_times"}
+SPATIAL_TABLES = {"stops", "shapes"}
+
+def _invalidate_caches(db: Session, table_name: str, affected_routes: set, stop_ids: set = frozenset()):
+    """Invalida cachés (calendario, tablero de salidas, snapshot del feed, índice espacial) tras un commit."""
+    if table_name in CALENDAR_TABLES:
+        invalidate_calendar_cache()
+    if table_name in PATTERN_SOURCE_TABLES:
+        departure_index.invalidate_routes(db, affected_routes)
+        departure_index.invalidate_stops(stop_ids)
+    if table_name == "frequencies":
+        departure_index.invalidate_all()
+    if table_name in SNAPSHOT_TABLES:
+        invalidate_feed_snapshot()
+    if table_name in SPATIAL_TABLES:
+        invalidate_spatial_index()
+
+# --- Endpoint POST /{table_name} ---
 @router.post("/{table_name}")
 async def create_table_item(table_name: str, item_data: Dict[str, Any], db: Session = Depends(get_db)):
     # ... (código igual) ...
@@ -135,13 +325,17 @@ async def create_table_item(table_name: str, item_data: Dict[str, Any], db: Sess
                 except ValueError as conversion_error: raise HTTPException(status_code=400, detail=f"Error conversión para '{col_name}': {conversion_error}")
         print(f"  -> Datos limpios: {cleaned_data}")
         new_item = model(**cleaned_data)
-        db.add(new_item); db.commit(); db.refresh(new_item)
+        db.add(new_item); db.flush()
+        affected_routes = _pattern_route_ids(db, table_name, new_item)
+        if affected_routes: refresh_stop_patterns(db, affected_routes)
+        db.commit(); db.refresh(new_item)
+        _invalidate_caches(db, table_name, affected_routes, {getattr(new_item, "stop_id", None)})
         print(f"  -> Éxito al crear en {table_name}.")
         return new_item
     except HTTPException as http_exc: db.rollback(); print(f"  -> Error HTTP: {http_exc.detail}"); raise http_exc
     except Exception as e: db.rollback(); print(f"  -> Error DB/inesperado: {e}"); traceback.print_exc(); raise HTTPException(status_code=400, detail=f"Error al crear en '{table_name}': {e}")
 
-# --- Endpoint PUT /{table_name}/{item_id} (Sin cambios) ---
+# --- Endpoint PUT /{table_name}/{item_id} ---
 @router.put("/{table_name}/{item_id}")
 async def update_table_item(table_name: str, item_id: Any, item_data: Dict[str, Any], db: Session = Depends(get_db)):
     # ... (código igual) ...
@@ -154,6 +348,8 @@ async def update_table_item(table_name: str, item_id: Any, item_data: Dict[str,
 
         item_to_update = db.query(model).filter(getattr(model, pk_column_name) == typed_item_id).first()
         if not item_to_update: raise HTTPException(status_code=404, detail="Registro no encontrado.")
+        affected_routes = _pattern_route_ids(db, table_name, item_to_update)
+        affected_stops = {getattr(item_to_update, "stop_id", None)}
         
         mapper = class_mapper(model); updated_fields = {}
         for key, value in item_data.items():
@@ -165,13 +361,19 @@ async def update_table_item(table_name: str, item_id: Any, item_data: Dict[str,
                  except ValueError as conversion_error: raise HTTPException(status_code=400, detail=f"Error conversión para '{key}': {conversion_error}")
              elif col is None: print(f"Warning: Columna inexistente '{key}' ignorada.")
         print(f"  -> Campos actualizados: {updated_fields}")
+        if table_name in PATTERN_SOURCE_TABLES:
+            db.flush()
+            affected_routes |= _pattern_route_ids(db, table_name, item_to_update)
+            affected_stops.add(getattr(item_to_update, "stop_id", None))
+            refresh_stop_patterns(db, affected_routes)
         db.commit(); db.refresh(item_to_update)
+        _invalidate_caches(db, table_name, affected_routes, affected_stops)
         print(f"  -> Éxito al actualizar {typed_item_id} en {table_name}.")
         return item_to_update
     except HTTPException as http_exc: db.rollback(); print(f"  -> Error HTTP: {http_exc.detail}"); raise http_exc
     except Exception as e: db.rollback(); print(f"  -> Error DB/inesperado: {e}"); traceback.print_exc(); raise HTTPException(status_code=400, detail=f"Error al actualizar en '{table_name}': {e}")
 
-# --- Endpoint DELETE /{table_name}/{item_id} (Sin cambios) ---
+# --- Endpoint DELETE /{table_name}/{item_id} ---
 @router.delete("/{table_name}/{item_id}")
 async def delete_table_item(table_name: str, item_id: Any, db: Session = Depends(get_db)):
     # ... (código igual) ...
@@ -185,7 +387,12 @@ async def delete_table_item(table_name: str, item_id: Any, db: Session = Depends
         item_to_delete = db.query(model).filter(getattr(model, pk_column_name) == typed_item_id).first()
         if not item_to_delete: raise HTTPException(status_code=404, detail="Registro no encontrado.")
         
-        db.delete(item_to_delete); db.commit()
+        affected_routes = _pattern_route_ids(db, table_name, item_to_delete)
+        affected_stops = {getattr(item_to_delete, "stop_id", None)}
+        db.delete(item_to_delete)
+        if affected_routes: db.flush(); refresh_stop_patterns(db, affected_routes)
+        db.commit()
+        _invalidate_caches(db, table_name, affected_routes, affected_stops)
         print(f"  -> Éxito al eliminar {typed_item_id} de {table_name}.")
         return {"status": "success", "message": "Registro eliminado."}
     except HTTPException as http_exc: db.rollback(); print(f"  -> Error HTTP: {http_exc.detail}"); raise http_exc
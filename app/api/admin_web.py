@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Request, UploadFile, File, Depends, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from app.database import get_db
 from app.models.gtfs_models import Agency, Calendar, FareAttribute, FareRule, FeedInfo, Route, Shape, StopTime, Stop, Trip
 from app.services.gtfs_importer import GTFSImporter
@@ -78,8 +79,9 @@ async function uploadGTFS() {{
 async function loadTable(table, page=1) {{
     currentTable = table;
     currentPage = page;
-    const res = await fetch(`/admin/${{table}}?skip=${{(page-1)*pageSize}}&limit=${{pageSize}}`);
-    const data = await res.json();
+    const res = await fetch(`/admin/${{table}}?offset=${{(page-1)*pageSize}}&limit=${{pageSize}}&include_total=false`);
+    const payload = await res.json();
+    const data = Array.isArray(payload) ? payload : (payload.data || []);
     if (!data.length) {{
         document.getElementById('table-container').innerHTML = '<p>No hay datos.</p>';
         return;
@@ -195,18 +197,11 @@ async def upload_gtfs(file: UploadFile = File(...), db: Session = Depends(get_db
     try:
         content = await file.read()
 
-        # 🔹 BORRAR TODAS LAS TABLAS ANTES DE IMPORTAR
-        db.execute("PRAGMA foreign_keys=OFF;")
-        db.commit()
-        for table in [Trip, StopTime, Stop, Shape, Route, FareRule, FareAttribute, Calendar, Agency, FeedInfo]:
-            db.query(table).delete(synchronize_session=False)
-        db.commit()
-        db.execute("PRAGMA foreign_keys=ON;")
-        db.commit()
-
-        # Importar nuevo GTFS
+        # Valida y carga en staging; las tablas vigentes se reemplazan de una vez al final
         importer = GTFSImporter(db)
-        result = importer.import_gtfs(content)
+        result = await run_in_threadpool(importer.import_gtfs, content)
+        if result.get("status") != "success":
+            return JSONResponse(content=result)
         return JSONResponse(content={"status": "success", "message": "GTFS importado correctamente", "details": result})
     except Exception as e:
         return JSONResponse(content={"status": "error", "message": str(e)})
@@ -2,21 +2,42 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
 from sqlalchemy.orm import Session
-from sqlalchemy import delete
-from typing import Optional
+from sqlalchemy import delete, func, select
+from typing import Dict, Optional
 import io
 
 from app.database import get_db
-from app.models.gtfs_models import Trip, StopTime
+from app.models.gtfs_models import Frequency, Trip, StopTime
 from app.services.excel_importer import ExcelImporter
+from app.services.stop_patterns import refresh_stop_patterns
+from app.services.departure_board import departure_index
+from app.services.feed_snapshot import invalidate_feed_snapshot
 
 router = APIRouter(prefix="/bulk", tags=["Bulk Operations"])
 
 
+def _matching_trip_ids(route_id: str, service_id: Optional[str]):
+    """Subconsulta con los trip_id afectados (evita listas IN con miles de parámetros)."""
+    stmt = select(Trip.trip_id).where(Trip.route_id == route_id)
+    if service_id:
+        stmt = stmt.where(Trip.service_id == service_id)
+    return stmt
+
+
+def _count_matches(db: Session, route_id: str, service_id: Optional[str]) -> Dict[str, int]:
+    """Cuenta trips y stop_times afectados en una sola consulta agregada."""
+    trip_ids = _matching_trip_ids(route_id, service_id)
+    trips_count = select(func.count()).select_from(trip_ids.subquery()).scalar_subquery()
+    stop_times_count = select(func.count(StopTime.id)).where(StopTime.trip_id.in_(trip_ids)).scalar_subquery()
+    row = db.execute(select(trips_count, stop_times_count)).one()
+    return {"trips_count": row[0] or 0, "stop_times_count": row[1] or 0}
+
+
 @router.delete("/delete-trips-and-stoptimes")
 async def delete_trips_and_stoptimes(
     route_id: str = Query(..., description="ID de la ruta"),
     service_id: Optional[str] = Query(None, description="ID del servicio/periodicidad (opcional)"),
+    dry_run: bool = Query(False, description="Solo cuenta lo que se eliminaría, sin borrar"),
     db: Session = Depends(get_db)
 ):
     """
@@ -25,6 +46,7 @@ async def delete_trips_and_stoptimes(
     **Parámetros:**
     - route_id: ID de la ruta (requerido)
     - service_id: ID del servicio/periodicidad (opcional, si no se proporciona borra TODOS los trips de la ruta)
+    - dry_run: si es true, devuelve los conteos sin eliminar nada
     
     **Retorna:**
     - trips_deleted: Número de trips eliminados
@@ -32,48 +54,67 @@ async def delete_trips_and_stoptimes(
     """
     
     print(f"\n{'='*70}")
-    print(f"🗑️  BORRADO MASIVO DE TRIPS Y STOP_TIMES")
+    print(f"🗑️  BORRADO MASIVO DE TRIPS Y STOP_TIMES{' (DRY-RUN)' if dry_run else ''}")
     print(f"{'='*70}")
     print(f"📍 Ruta: {route_id}")
     print(f"📅 Servicio: {service_id if service_id else 'TODOS'}")
     
     try:
-        # 1. Buscar trips que coincidan con los criterios
-        trip_query = db.query(Trip).filter(Trip.route_id == route_id)
-        
-        if service_id:
-            trip_query = trip_query.filter(Trip.service_id == service_id)
-        
-        trips_to_delete = trip_query.all()
-        
-        if not trips_to_delete:
-            print(f"⚠️  No se encontraron trips para eliminar")
+        if dry_run:
+            counts = _count_matches(db, route_id, service_id)
+            print(f"🔎 Se eliminarían {counts['trips_count']} trips y {counts['stop_times_count']} stop_times")
             return {
                 "success": True,
-                "message": "No se encontraron trips que coincidan con los criterios",
+                "dry_run": True,
+                "message": f"Se eliminarían {counts['trips_count']} trips y {counts['stop_times_count']} stop_times",
                 "trips_deleted": 0,
-                "stop_times_deleted": 0
+                "stop_times_deleted": 0,
+                **counts,
+                "route_id": route_id,
+                "service_id": service_id
             }
-        
-        trip_ids = [trip.trip_id for trip in trips_to_delete]
-        print(f"✅ Encontrados {len(trip_ids)} trips para eliminar")
-        
-        # 2. Eliminar stop_times asociados
+
+        trip_ids = _matching_trip_ids(route_id, service_id)
+
+        # 1. Eliminar stop_times asociados (DELETE ... WHERE trip_id IN (SELECT ...))
         stop_times_stmt = delete(StopTime).where(StopTime.trip_id.in_(trip_ids))
-        stop_times_result = db.execute(stop_times_stmt)
+        stop_times_result = db.execute(stop_times_stmt, execution_options={"synchronize_session": False})
         stop_times_deleted = stop_times_result.rowcount
         
         print(f"✅ Eliminados {stop_times_deleted} stop_times")
+
+        # Periodos de frequencies de los trips plantilla (llave foránea a trips)
+        db.execute(
+            delete(Frequency).where(Frequency.trip_id.in_(trip_ids)),
+            execution_options={"synchronize_session": False}
+        )
         
-        # 3. Eliminar trips
-        trips_stmt = delete(Trip).where(Trip.trip_id.in_(trip_ids))
-        trips_result = db.execute(trips_stmt)
+        # 2. Eliminar trips
+        trips_stmt = delete(Trip).where(Trip.route_id == route_id)
+        if service_id:
+            trips_stmt = trips_stmt.where(Trip.service_id == service_id)
+        trips_result = db.execute(trips_stmt, execution_options={"synchronize_session": False})
         trips_deleted = trips_result.rowcount
         
+        if not trips_deleted:
+            db.rollback()
+            print(f"⚠️  No se encontraron trips para eliminar")
+            return {
+                "success": True,
+                "message": "No se encontraron trips que coincidan con los criterios",
+                "trips_deleted": 0,
+                "stop_times_deleted": 0
+            }
+        
         print(f"✅ Eliminados {trips_deleted} trips")
         
+        # 3. Recalcular el patrón de paradas de la ruta
+        refresh_stop_patterns(db, [route_id])
+        
         # 4. Commit
         db.commit()
+        departure_index.invalidate_routes(db, [route_id])
+        invalidate_feed_snapshot()
         
         print(f"{'='*70}\n")
         
@@ -108,32 +149,11 @@ async def count_trips(
     Útil para confirmar antes de borrar.
     """
     try:
-        trip_query = db.query(Trip).filter(Trip.route_id == route_id)
-        
-        if service_id:
-            trip_query = trip_query.filter(Trip.service_id == service_id)
-        
-        trips = trip_query.all()
-        trip_count = len(trips)
-        
-        if trip_count == 0:
-            return {
-                "route_id": route_id,
-                "service_id": service_id,
-                "trips_count": 0,
-                "stop_times_count": 0
-            }
-        
-        trip_ids = [trip.trip_id for trip in trips]
-        stop_times_count = db.query(StopTime).filter(
-            StopTime.trip_id.in_(trip_ids)
-        ).count()
-        
+        counts = _count_matches(db, route_id, service_id)
         return {
             "route_id": route_id,
             "service_id": service_id,
-            "trips_count": trip_count,
-            "stop_times_count": stop_times_count
+            **counts
         }
         
     except Exception as e:
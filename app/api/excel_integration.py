@@ -9,6 +9,9 @@ import shutil
 from datetime import datetime
 import json
 
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
 from app.database import get_db
 from app.services.excel_processor import process_scheduling_parameters
 
@@ -56,10 +59,10 @@ async def upload_base_excel(file: UploadFile = File(...)):
 @router.post("/process-parameters")
 async def process_parameters(parameters: Dict[str, Any]):
     """
-    Procesa los parámetros de programación:
-    1. Escribe en el Excel
-    2. Recalcula fórmulas
-    3. Extrae resultados
+    Procesa los parámetros de programación y devuelve las tablas 4–7.
+
+    Con SCHEDULING_ENGINE="native" (por defecto) las fórmulas del libro se
+    evalúan en memoria; con "excel" se escribe, recalcula y lee el libro base.
     
     Body esperado:
     {
@@ -73,17 +76,20 @@ async def process_parameters(parameters: Dict[str, Any]):
         print("\n🚀 Endpoint /process-parameters llamado")
         print(f"📦 Parámetros recibidos: {json.dumps(parameters, indent=2, default=str)}")
         
-        # Verificar que existe el archivo base
-        base_excel_path = os.path.join(EXCEL_UPLOADS_DIR, "base_template.xlsx")
-        
-        if not os.path.exists(base_excel_path):
-            raise HTTPException(
-                status_code=404,
-                detail="No se encontró el archivo Excel base. Por favor, súbelo primero usando /upload-base-excel"
-            )
-        
-        # Procesar el Excel
-        results = process_scheduling_parameters(base_excel_path, parameters)
+        if settings.SCHEDULING_ENGINE == "excel":
+            # Verificar que existe el archivo base
+            base_excel_path = os.path.join(EXCEL_UPLOADS_DIR, "base_template.xlsx")
+            
+            if not os.path.exists(base_excel_path):
+                raise HTTPException(
+                    status_code=404,
+                    detail="No se encontró el archivo Excel base. Por favor, súbelo primero usando /upload-base-excel"
+                )
+            
+            # Procesar el Excel (bloqueante: fuera del event loop)
+            results = await run_in_threadpool(process_scheduling_parameters, parameters, base_excel_path)
+        else:
+            results = process_scheduling_parameters(parameters)
         
         if not results['success']:
             raise HTTPException(
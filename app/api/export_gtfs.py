@@ -4,15 +4,19 @@ import io
 import zipfile
 import pandas as pd
 import csv
-from fastapi import APIRouter, Depends
+import traceback
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from fastapi.responses import StreamingResponse
 
 from app.database import get_db
+from app.utils.gtfs_time import format_gtfs_time_series
+from app.services.metrics import stage_timer
+from app.services.frequencies import expand_frequencies as expand_frequency_trips
 # Importa todos tus modelos GTFS
 from app.models.gtfs_models import (
     Agency, Route, Trip, StopTime, Stop, Calendar, 
-    CalendarDate, Shape, FareAttribute, FareRule, FeedInfo
+    CalendarDate, Shape, FareAttribute, FareRule, FeedInfo, Frequency
 )
 
 router = APIRouter(prefix="/export-gtfs", tags=["Export GTFS"])
@@ -23,6 +27,7 @@ MODELS_TO_EXPORT = [
     (Route, "routes.txt"),
     (Trip, "trips.txt"),
     (StopTime, "stop_times.txt"),
+    (Frequency, "frequencies.txt"),
     (Stop, "stops.txt"),
     (Calendar, "calendar.txt"),
     (CalendarDate, "calendar_dates.txt"),
@@ -38,12 +43,18 @@ MODELS_TO_EXPORT = [
 NON_GTFS_ID_COLS = ['id', 'feed_info_id']
 # --- FIN DE LA MODIFICACIÓN ---
 
+# Columnas almacenadas en segundos y su nombre en el archivo GTFS
+SECONDS_COLUMNS = {
+    'arrival_seconds': 'arrival_time', 'departure_seconds': 'departure_time',
+    'start_seconds': 'start_time', 'end_seconds': 'end_time',
+}
+
 
-import numpy as np
 import pandas as pd
 
+@stage_timer("export_gtfs.format_dataframe")
 def format_dataframe_for_gtfs(df: pd.DataFrame, model) -> pd.DataFrame:
-    """Aplica formato GTFS a un DataFrame antes de guardarlo en CSV, con ajuste dinámico de horas 24/25."""
+    """Aplica formato GTFS a un DataFrame antes de guardarlo en CSV."""
 
     # --- Fechas ---
     date_columns = ['start_date', 'end_date', 'feed_start_date', 'feed_end_date', 'date']
@@ -64,85 +75,60 @@ def format_dataframe_for_gtfs(df: pd.DataFrame, model) -> pd.DataFrame:
                 lambda x: str(int(float(x))) if pd.notna(x) and str(x).strip() != '' else ''
             )
 
+    # --- Tiempos (almacenados en segundos; las horas >= 24 ya vienen resueltas) ---
+    for seconds_col, gtfs_col in SECONDS_COLUMNS.items():
+        if seconds_col in df.columns:
+            df[gtfs_col] = format_gtfs_time_series(df[seconds_col])
+
     # --- Columnas GTFS ---
-    all_model_columns = [c.name for c in model.__table__.columns]
+    all_model_columns = [SECONDS_COLUMNS.get(c.name, c.name) for c in model.__table__.columns]
     gtfs_columns = [col for col in all_model_columns if col not in NON_GTFS_ID_COLS]
     final_columns = [col for col in gtfs_columns if col in df.columns]
     df = df[final_columns]
 
-    # --- Función para ajustar tiempos dinámicamente por trip ---
-    def adjust_times_grouped(times, trip_ids=None):
-        """Ajusta horas dinámicamente: suma 24h si cruza medianoche por trip_id."""
-        adjusted = []
-        last_seconds = None
-        last_trip = None
-
-        for idx, t in enumerate(times):
-            current_trip = trip_ids[idx] if trip_ids is not None else None
-
-            # Reinicia contador al cambiar de trip
-            if current_trip != last_trip:
-                last_seconds = None
-                last_trip = current_trip
-
-            if pd.isna(t) or t == '':
-                adjusted.append('')
-                continue
-
-            # Convierte a h,m,s
-            if hasattr(t, 'hour'):
-                h, m, s = t.hour, t.minute, t.second
-            elif isinstance(t, (pd.Timestamp, np.datetime64)):
-                temp = pd.to_datetime(t).time()
-                h, m, s = temp.hour, temp.minute, temp.second
-            else:
-                parts = str(t).split(':')
-                h, m, s = map(int, (parts + ['0','0'])[:3])
-
-            total_seconds = h*3600 + m*60 + s
-
-            # Suma 24h si retrocede respecto al anterior
-            if last_seconds is not None and total_seconds < last_seconds:
-                total_seconds += 24*3600
-
-            last_seconds = total_seconds
-
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            adjusted.append(f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}")
-
-        return adjusted
-
-    # --- Tiempos dinámicos ---
-    time_columns = ['arrival_time', 'departure_time']
-    for col in time_columns:
-        if col in df.columns:
-            trip_ids = df['trip_id'].tolist() if 'trip_id' in df.columns else None
-            # Ordena por trip y stop_sequence si existen
-            if 'trip_id' in df.columns and 'stop_sequence' in df.columns:
-                df = df.sort_values(['trip_id', 'stop_sequence'])
-            df[col] = adjust_times_grouped(df[col].tolist(), trip_ids=trip_ids)
+    # Ordena stop_times por trip y secuencia
+    if 'arrival_time' in df.columns and 'trip_id' in df.columns and 'stop_sequence' in df.columns:
+        df = df.sort_values(['trip_id', 'stop_sequence'])
 
     return df
 
 
 
+@stage_timer("export_gtfs.expand_frequencies")
+def _expanded_frames(db: Session) -> dict:
+    """trips/stop_times con los trips plantilla expandidos; frequencies queda vacío."""
+    trips = pd.read_sql(db.query(Trip).statement, db.bind)
+    stop_times = pd.read_sql(db.query(StopTime).statement, db.bind)
+    frequencies = pd.read_sql(db.query(Frequency).statement, db.bind)
+    trips, stop_times = expand_frequency_trips(trips, stop_times, frequencies)
+    print(f"  -> {len(frequencies)} periodos de frequencies expandidos a {len(trips)} trips explícitos")
+    return {Trip: trips, StopTime: stop_times, Frequency: frequencies.iloc[0:0]}
+
+
 @router.get("/export-zip")
-async def export_gtfs_zip(db: Session = Depends(get_db)):
+async def export_gtfs_zip(
+    expand_frequencies: bool = Query(False, description="Expande frequencies.txt a trips explícitos"),
+    db: Session = Depends(get_db)
+):
     """
     Consulta todas las tablas GTFS, las convierte a CSV y las devuelve en un archivo .zip.
+    Con expand_frequencies=true los trips plantilla se exportan como trips
+    explícitos, para consumidores que no leen frequencies.txt.
     """
     print("Iniciando exportación de GTFS a .zip...")
     
     zip_buffer = io.BytesIO()
+    frames = _expanded_frames(db) if expand_frequencies else {}
     
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zip_file:
         for model, filename in MODELS_TO_EXPORT:
             print(f"  -> Procesando {filename} (Modelo: {model.__name__})...")
             try:
-                query = db.query(model)
-                df = pd.read_sql(query.statement, db.bind)
+                df = frames.get(model)
+                if df is None:
+                    query = db.query(model)
+                    with stage_timer("export_gtfs.read_sql"):
+                        df = pd.read_sql(query.statement, db.bind)
                 
                 if df.empty:
                     print(f"     ... Tabla {filename} está vacía, omitiendo.")
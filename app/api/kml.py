@@ -4,6 +4,7 @@ API Endpoints para importación de KML y gestión de shapes
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
 
 from app.database import get_db
@@ -425,6 +426,35 @@ async def import_kml_shape_only(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/import-document")
+async def import_kml_document(
+    kml_file: UploadFile = File(...),
+    shape_ids: Optional[str] = Form(None),
+    shape_id_prefix: str = Form("shape"),
+    replace_existing: bool = Form(True),
+    db: Session = Depends(get_db)
+):
+    """
+    Importa un KML con varios Placemarks (un LineString por ruta/sentido) en una sola llamada.
+    
+    - **shape_ids**: lista separada por comas, uno por LineString en orden; si se omite
+      se usa el nombre de cada Placemark (o "{shape_id_prefix}_{n}")
+    """
+    ids = [s.strip() for s in shape_ids.split(",") if s.strip()] if shape_ids else None
+    processor = KMLProcessor(db)
+    # El archivo se parsea en streaming desde el upload, fuera del event loop
+    result = await run_in_threadpool(
+        processor.import_kml_document,
+        kml_file.file,
+        shape_ids=ids,
+        shape_id_prefix=shape_id_prefix,
+        replace_existing=replace_existing
+    )
+    if not result['success']:
+        raise HTTPException(status_code=400, detail=result['error'])
+    return result
+
+
 @router.get("/shapes/{shape_id}")
 async def get_shape_info(
     shape_id: str,
@@ -0,0 +1,15 @@
+"""
+Endpoint de métricas en formato de texto de Prometheus
+"""
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.services.metrics import CONTENT_TYPE, render_metrics
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Latencias por ruta, etapas de servicios y sentencias SQL (se reinician al reiniciar el proceso)."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
@@ -3,15 +3,23 @@
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import delete
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import io
 import json
-from typing import Optional
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
 import traceback
 from datetime import date, time as dt_time
 
+from app.config import settings
 from app.database import get_db
-from app.models.gtfs_models import Route, Shape
-from app.services.kml_processor import KMLProcessor
+from app.models.gtfs_models import Route
+from app.services.kml_processor import build_shape_rows, compute_shape_rows, parse_kml_lines, replace_shape_rows
+from app.services.feed_snapshot import invalidate_feed_snapshot
+from app.services.spatial_index import invalidate_spatial_index
 
 router = APIRouter(prefix="/routes", tags=["Routes Custom"])
 
@@ -23,73 +31,29 @@ async def process_and_save_kml(db: Session, kml_file: UploadFile, shape_id: str,
         return 0, 0.0 # Puntos, distancia
 
     print(f"  -> [process_kml] Iniciando para shape_id '{shape_id}' (replace={replace_existing})...")
-    coordinates = []
     try:
         kml_content_bytes = await kml_file.read()
-        try: kml_content_str = kml_content_bytes.decode('utf-8')
-        except UnicodeDecodeError: kml_content_str = kml_content_bytes.decode('latin-1', errors='ignore')
         print(f"     -> [process_kml] KML leído.")
 
-        processor = KMLProcessor(db)
-        print(f"     -> [process_kml] KMLProcessor instanciado.")
-
-        # ✅ *** VERIFICA Y USA EL NOMBRE CORRECTO DEL MÉTODO ***
-        if not hasattr(processor, 'parse_kml_content'):
-             # Si este error persiste, el nombre del método en kml_processor.py ES OTRO
-             raise AttributeError("Método 'parse_kml_content' NO existe en KMLProcessor.")
-
-        # Llama al método correcto que SÍ existe en tu clase
-        coordinates = processor.parse_kml_content(kml_content_str)
-        print(f"     -> [process_kml] Coordenadas extraídas (vía parse_kml_content): {len(coordinates)}")
-
-        if not coordinates: raise ValueError("No se encontraron coordenadas válidas en KML.")
-
-        # --- Lógica de Reemplazo ---
-        existing_shape_count = db.query(Shape).filter(Shape.shape_id == shape_id).count()
-        if existing_shape_count > 0:
-            if replace_existing:
-                print(f"     -> [process_kml] Eliminando {existing_shape_count} puntos para shape '{shape_id}'...")
-                stmt = delete(Shape).where(Shape.shape_id == shape_id)
-                db.execute(stmt); db.flush()
-                print(f"     -> [process_kml] Puntos anteriores eliminados.")
-            else:
-                raise ValueError(f"Shape ID '{shape_id}' ya existe y no se permite reemplazar.")
-        # --- Fin Reemplazo ---
-
-        shape_points_to_add = []; valid_points_count = 0; cumulative_distance_meters = 0.0; last_coord = None
-        # Asegúrate que KMLProcessor tenga calculate_distance
-        if not hasattr(processor, 'calculate_distance'):
-             raise AttributeError("Método 'calculate_distance' NO existe en KMLProcessor.")
-
-        # Asume que coordinates es [(lon, lat)] o [(lat, lon)], ajusta si es necesario
-        # TU CÓDIGO de kml_processor devuelve (lat, lon)
-        for i, (lat, lon) in enumerate(coordinates):
-            try:
-                lat_float = float(lat); lon_float = float(lon)
-                if not (-90 <= lat_float <= 90 and -180 <= lon_float <= 180): raise ValueError("Coords fuera de rango")
-
-                if i > 0 and last_coord:
-                    # calculate_distance espera (lat1, lon1, lat2, lon2)
-                    segment_distance = processor.calculate_distance(last_coord[1], last_coord[0], lat_float, lon_float)
-                    cumulative_distance_meters += segment_distance
-
-                shape_point = Shape(
-                    shape_id=shape_id, shape_pt_lat=round(lat_float, 8), shape_pt_lon=round(lon_float, 8),
-                    shape_pt_sequence=i + 1, shape_dist_traveled=round(cumulative_distance_meters, 3) )
-                shape_points_to_add.append(shape_point)
-                valid_points_count += 1
-                # Guarda (lon, lat) para la siguiente iteración
-                last_coord = (lon_float, lat_float)
-
-            except (ValueError, TypeError) as coord_err:
-                 print(f"     -> Warning: Coordenada inválida ({lat}, {lon}) ignorada. Error: {coord_err}")
-                 continue
-
-        if not shape_points_to_add: raise ValueError("No se pudieron extraer puntos válidos del KML.")
-
-        db.add_all(shape_points_to_add)
-        print(f"   -> [process_kml] {valid_points_count} puntos válidos preparados. Dist: {cumulative_distance_meters:.2f} m.")
-        return valid_points_count, cumulative_distance_meters
+        # Los bytes van directo al parser (respeta la codificación declarada en el XML)
+        lines = parse_kml_lines(kml_content_bytes)
+        line = lines[0] if lines else None
+        print(f"     -> [process_kml] Coordenadas extraídas: {len(line.lats) if line else 0}")
+
+        if not line: raise ValueError("No se encontraron coordenadas válidas en KML.")
+
+        # Reemplazo en bloque: un DELETE por shape_id y un INSERT masivo (sin commit, lo hace el endpoint)
+        shape_rows = build_shape_rows(shape_id, line.lats, line.lons, precision=8)
+        try:
+            previous = replace_shape_rows(db, {shape_id: shape_rows}, replace_existing)
+        except ValueError:
+            raise ValueError(f"Shape ID '{shape_id}' ya existe y no se permite reemplazar.")
+        if previous[shape_id]:
+            print(f"     -> [process_kml] Eliminados {previous[shape_id]} puntos anteriores de shape '{shape_id}'.")
+
+        cumulative_distance_meters = shape_rows[-1]['shape_dist_traveled']
+        print(f"   -> [process_kml] {len(shape_rows)} puntos válidos preparados. Dist: {cumulative_distance_meters:.2f} m.")
+        return len(shape_rows), cumulative_distance_meters
 
     except (ValueError, AttributeError) as ve:
          print(f"Error procesando KML '{shape_id}': {ve}")
@@ -168,6 +132,8 @@ async def create_or_update_route_with_kml(
 
         # Commit final
         db.commit()
+        invalidate_feed_snapshot()
+        invalidate_spatial_index()
         db.refresh(route_to_process) # Carga datos actualizados/creados
         print(f"✅ Transacción completa. Ruta '{route_to_process.route_short_name}' {action_performed}. Shapes procesados: {len(shapes_processed_info)}")
         
@@ -199,4 +165,185 @@ async def create_or_update_route_with_kml(
     except Exception as e:
          db.rollback(); print(f"Error Inesperado: {e}")
          traceback.print_exc()
-         raise HTTPException(status_code=500, detail=f"Error interno: {e}")
\ No newline at end of file
+         raise HTTPException(status_code=500, detail=f"Error interno: {e}")
+
+
+# --- Importación por lote: zip de KMLs + manifiesto de rutas ---
+
+ROUTE_COLUMNS = {column.name for column in Route.__table__.columns}
+MANIFEST_NAME = "manifest.json"
+
+
+def _read_batch_archive(archive_bytes: bytes, manifest_text: Optional[str]):
+    """
+    Abre el zip y valida el manifiesto (parámetro o manifest.json dentro del zip).
+
+    Formato: [{"route": {route_id, route_short_name, agency_id, ...},
+               "shapes": [{"shape_id": "...", "file": "ruta/en/el/zip.kml"}, ...]}, ...]
+    Devuelve (items, {archivo: bytes}).
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    except zipfile.BadZipFile:
+        raise ValueError("El archivo no es un zip válido.")
+
+    with archive:
+        names = set(archive.namelist())
+        if manifest_text is None:
+            if MANIFEST_NAME not in names:
+                raise ValueError(f"Falta el manifiesto (parámetro 'manifest' o {MANIFEST_NAME} en el zip).")
+            manifest_text = archive.read(MANIFEST_NAME).decode("utf-8")
+        try:
+            items = json.loads(manifest_text)
+        except json.JSONDecodeError:
+            raise ValueError("JSON inválido en el manifiesto.")
+        if not isinstance(items, list) or not items:
+            raise ValueError("El manifiesto debe ser una lista no vacía de rutas.")
+
+        files: Dict[str, bytes] = {}
+        for item in items:
+            for shape in (item.get("shapes") or []) if isinstance(item, dict) else []:
+                file_name = shape.get("file") if isinstance(shape, dict) else None
+                if file_name in names and file_name not in files:
+                    files[file_name] = archive.read(file_name)
+    return items, files
+
+
+def _validate_batch_item(item: Any, seen_shape_ids: set) -> Optional[str]:
+    """Error de validación del ítem del manifiesto, o None si es válido."""
+    if not isinstance(item, dict) or not isinstance(item.get("route"), dict):
+        return "Cada ítem necesita un objeto 'route'."
+    route = item["route"]
+    for field in ('route_id', 'route_short_name', 'agency_id'):
+        if not route.get(field):
+            return f"Falta '{field}' en route."
+    unknown = set(route) - ROUTE_COLUMNS
+    if unknown:
+        return f"Campos desconocidos en route: {', '.join(sorted(unknown))}"
+    for shape in item.get("shapes") or []:
+        if not isinstance(shape, dict) or not shape.get("shape_id") or not shape.get("file"):
+            return "Cada shape necesita 'shape_id' y 'file'."
+        shape_id = str(shape["shape_id"]).strip()
+        if shape_id in seen_shape_ids:
+            return f"Shape ID '{shape_id}' repetido en el lote."
+        seen_shape_ids.add(shape_id)
+    return None
+
+
+def _apply_batch(db: Session, ready: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Upsert de rutas + reemplazo de shapes en una sola transacción corta."""
+    route_ids = [item["route"]["route_id"] for item in ready]
+    existing = {r.route_id: r for r in db.query(Route).filter(Route.route_id.in_(route_ids)).all()}
+
+    created = updated = 0
+    for item in ready:
+        route_dict = item["route"]
+        route = existing.get(route_dict["route_id"])
+        if route is not None:
+            for key, value in route_dict.items():
+                setattr(route, key, value)
+            item["result"]["action"] = "actualizada"
+            updated += 1
+        else:
+            route = Route(**route_dict)
+            db.add(route)
+            existing[route.route_id] = route
+            item["result"]["action"] = "creada"
+            created += 1
+    db.flush()
+
+    rows_by_shape = {shape_id: rows for item in ready for shape_id, rows in item["rows"].items()}
+    replace_shape_rows(db, rows_by_shape, replace_existing=True)
+    db.commit()
+    return {"routes_created": created, "routes_updated": updated}
+
+
+@router.post("/batch-import", status_code=200)
+async def batch_import_routes_with_kml(
+    archive: UploadFile = File(..., description="Zip con los KML (y opcionalmente manifest.json)"),
+    manifest: Optional[str] = Form(None, description="Manifiesto JSON; si se omite se lee manifest.json del zip"),
+    db: Session = Depends(get_db)
+):
+    """
+    Crea/actualiza muchas rutas con sus shapes en una sola llamada.
+
+    1. Los KML se parsean y se calcula su geometría en un pool de procesos, sin transacción abierta.
+    2. Las rutas y shapes válidos se aplican en una única transacción masiva.
+    Los ítems con errores (manifiesto o KML) se reportan y no se aplican.
+    """
+    archive_bytes = await archive.read()
+    try:
+        items, files = await run_in_threadpool(_read_batch_archive, archive_bytes, manifest)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"[batch-import] {len(items)} rutas, {len(files)} KML en el zip")
+
+    # Validación del manifiesto
+    seen_shape_ids: set = set()
+    results: List[Dict[str, Any]] = []
+    jobs = []  # (ítem, shape_id, archivo)
+    candidates = []
+    for item in items:
+        route_id = item.get("route", {}).get("route_id") if isinstance(item, dict) and isinstance(item.get("route"), dict) else None
+        result = {"route_id": route_id, "status": "ok", "shapes": []}
+        results.append(result)
+        error = _validate_batch_item(item, seen_shape_ids)
+        if error is None:
+            missing = [s["file"] for s in item.get("shapes") or [] if s["file"] not in files]
+            if missing:
+                error = f"Archivos no encontrados en el zip: {', '.join(missing)}"
+        if error:
+            result.update(status="error", error=error)
+            continue
+        candidate = {"route": item["route"], "rows": {}, "result": result}
+        candidates.append(candidate)
+        for shape in item.get("shapes") or []:
+            jobs.append((candidate, str(shape["shape_id"]).strip(), shape["file"]))
+
+    # Parseo + geometría en paralelo, fuera de cualquier transacción
+    if jobs:
+        loop = asyncio.get_running_loop()
+        workers = min(settings.KML_PARSE_WORKERS or os.cpu_count() or 1, len(jobs))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = await asyncio.gather(
+                *(loop.run_in_executor(pool, compute_shape_rows, shape_id, files[file_name]) for _, shape_id, file_name in jobs),
+                return_exceptions=True
+            )
+        for (candidate, shape_id, file_name), rows in zip(jobs, parsed):
+            result = candidate["result"]
+            if isinstance(rows, Exception):
+                result.update(status="error", error=f"KML '{file_name}' ({shape_id}): {rows}")
+                continue
+            candidate["rows"][shape_id] = rows
+            result["shapes"].append({
+                "shape_id": shape_id,
+                "points": len(rows),
+                "distance_m": round(rows[-1]["shape_dist_traveled"], 2)
+            })
+
+    ready = [c for c in candidates if c["result"]["status"] == "ok"]
+    summary = {"routes_created": 0, "routes_updated": 0}
+    if ready:
+        try:
+            summary = await run_in_threadpool(_apply_batch, db, ready)
+        except IntegrityError as e:
+            db.rollback(); print(f"Error Integridad: {e}")
+            raise HTTPException(status_code=400, detail=f"Error DB (no se aplicó ningún ítem): {e.orig}")
+        except Exception as e:
+            db.rollback(); print(f"Error Inesperado: {e}")
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=f"Error interno: {e}")
+        invalidate_feed_snapshot()
+        invalidate_spatial_index()
+
+    for candidate in candidates:
+        if candidate["result"]["status"] != "ok":
+            candidate["result"]["shapes"] = []
+    print(f"✅ [batch-import] {len(ready)}/{len(items)} rutas aplicadas")
+    return {
+        **summary,
+        "shapes_imported": sum(len(c["rows"]) for c in ready),
+        "points_imported": sum(len(rows) for c in ready for rows in c["rows"].values()),
+        "failed": len(items) - len(ready),
+        "items": results
+    }
@@ -12,6 +12,8 @@ API actualizada para programación de rutas con:
 # --- Imports existentes ---
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 from pydantic import BaseModel, field_validator
@@ -24,7 +26,7 @@ import json
 import io
 import pandas as pd
 
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models.scheduling_models import SchedulingParameters
 from app.services.interval_processor import process_intervals
 
@@ -144,7 +146,7 @@ async def calculate_intervals(request: CalculateIntervalsRequest):
         }
         
         # Procesar intervalos
-        result = process_intervals(parameters)
+        result = await run_in_threadpool(process_intervals, parameters)
         
         if not result.get('success'):
             raise HTTPException(
@@ -240,7 +242,7 @@ async def save_parameters(request: SaveParametersRequest, db: Session = Depends(
 @router.get("/parameters")
 async def list_parameters(
     route_id: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db = Depends(get_async_db)
 ):
     """
     Lista todos los escenarios guardados
@@ -248,14 +250,14 @@ async def list_parameters(
     print(f"\n📋 Listando escenarios (route_id: {route_id})")
     
     try:
-        query = db.query(SchedulingParameters)
+        query = select(SchedulingParameters)
         
         if route_id:
-            query = query.filter(SchedulingParameters.route_id == route_id)
+            query = query.where(SchedulingParameters.route_id == route_id)
         
-        params_list = query\
-            .order_by(SchedulingParameters.updated_at.desc())\
-            .all()
+        params_list = (await db.execute(
+            query.order_by(SchedulingParameters.updated_at.desc())
+        )).scalars().all()
         
         result = []
         for params in params_list:
@@ -279,16 +281,14 @@ async def list_parameters(
 
 
 @router.get("/parameters/{param_id}")
-async def get_parameters_by_id(param_id: int, db: Session = Depends(get_db)):
+async def get_parameters_by_id(param_id: int, db = Depends(get_async_db)):
     """
     Obtiene un escenario específico por ID
     """
     print(f"\n📄 Obteniendo escenario ID: {param_id}")
     
     try:
-        params = db.query(SchedulingParameters)\
-            .filter(SchedulingParameters.id == param_id)\
-            .first()
+        params = await db.get(SchedulingParameters, param_id)
         
         if not params:
             raise HTTPException(status_code=404, detail="Escenario no encontrado")
@@ -315,7 +315,7 @@ async def get_parameters_by_id(param_id: int, db: Session = Depends(get_db)):
 async def get_parameters_by_name(
     name: str,
     route_id: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db = Depends(get_async_db)
 ):
     """
     Obtiene un escenario por nombre
@@ -323,13 +323,13 @@ async def get_parameters_by_name(
     print(f"\n📄 Buscando escenario: '{name}' (route: {route_id})")
     
     try:
-        query = db.query(SchedulingParameters)\
-            .filter(SchedulingParameters.name == name)
+        query = select(SchedulingParameters)\
+            .where(SchedulingParameters.name == name)
         
         if route_id:
-            query = query.filter(SchedulingParameters.route_id == route_id)
+            query = query.where(SchedulingParameters.route_id == route_id)
         
-        params = query.first()
+        params = (await db.execute(query.limit(1))).scalars().first()
         
         if not params:
             raise HTTPException(status_code=404, detail=f"Escenario '{name}' no encontrado")
@@ -389,7 +389,7 @@ async def delete_parameters(param_id: int, db: Session = Depends(get_db)):
 # ==================== ENDPOINT AUXILIAR: SHAPES (Existente) ====================
 
 @router.get("/shapes-distances/{route_id}")
-async def get_shapes_distances(route_id: str, db: Session = Depends(get_db)):
+async def get_shapes_distances(route_id: str, db = Depends(get_async_db)):
     """
     Obtiene las distancias máximas de los shapes de una ruta
     """
@@ -398,15 +398,19 @@ async def get_shapes_distances(route_id: str, db: Session = Depends(get_db)):
     try:
         from app.models.gtfs_models import Shape
         
-        shape_cb = db.query(Shape)\
-            .filter(Shape.shape_id == f"{route_id}.1")\
-            .order_by(Shape.shape_dist_traveled.desc())\
-            .first()
+        shape_cb = (await db.execute(
+            select(Shape)
+            .where(Shape.shape_id == f"{route_id}.1")
+            .order_by(Shape.shape_dist_traveled.desc())
+            .limit(1)
+        )).scalars().first()
         
-        shape_bc = db.query(Shape)\
-            .filter(Shape.shape_id == f"{route_id}.2")\
-            .order_by(Shape.shape_dist_traveled.desc())\
-            .first()
+        shape_bc = (await db.execute(
+            select(Shape)
+            .where(Shape.shape_id == f"{route_id}.2")
+            .order_by(Shape.shape_dist_traveled.desc())
+            .limit(1)
+        )).scalars().first()
         
         distance_cb = float(shape_cb.shape_dist_traveled)/1000 if shape_cb and shape_cb.shape_dist_traveled else 0.0
         distance_bc = float(shape_bc.shape_dist_traveled)/1000 if shape_bc and shape_bc.shape_dist_traveled else 0.0
@@ -459,12 +463,13 @@ async def api_generate_sheet_from_intervals(
         if route_file:
             print(f"  → Leyendo archivo de arcos: {route_file.filename}")
             contents = await route_file.read()
-            route_data_df = pd.read_excel(io.BytesIO(contents))
+            route_data_df = await run_in_threadpool(pd.read_excel, io.BytesIO(contents))
             # (Aquí podrías usar route_data_df para recalcular tiempos)
         
         # 1. Generar viajes crudos (como Timetables_Variable)
         # 
-        raw_trips = generate_sheet_from_tables(
+        raw_trips = await run_in_threadpool(
+            generate_sheet_from_tables,
             tabla1_data,
             headways_centro,
             headways_barrio,
@@ -478,7 +483,7 @@ async def api_generate_sheet_from_intervals(
         # 2. Consolidar los viajes (como TimetableFinal)
         # 
         max_wait = int(tabla1_data.get('max_wait_minutes_pairing', 15))
-        final_sheet = consolidate_sheet(raw_trips, max_wait_minutes=max_wait)
+        final_sheet = await run_in_threadpool(consolidate_sheet, raw_trips, max_wait_minutes=max_wait)
         
         print(f"✅ Sábana generada con {len(final_sheet)} viajes consolidados.")
 
@@ -502,10 +507,11 @@ async def generate_gtfs_from_sheet_endpoint(
     shape_id_s2: str = Form(...),
     bikes_allowed: int = Form(0),
     use_existing_route: bool = Form(False),
+    use_frequencies: bool = Form(False),
     stops_file: UploadFile = File(None),
     db: Session = Depends(get_db)
 ):
-    """Genera trips y stop_times desde sábana consolidada"""
+    """Genera trips y stop_times desde sábana consolidada (use_frequencies: plantillas + frequencies.txt)"""
     print(f"\n🚀 Generando GTFS para Ruta: {route_id}, Servicio: {service_id}")
     try:
         import json
@@ -552,7 +558,7 @@ async def generate_gtfs_from_sheet_endpoint(
                 raise HTTPException(400, "Falta archivo de paradas (stops_file)")
             
             content = await stops_file.read()
-            df = pd.read_excel(io.BytesIO(content))
+            df = await run_in_threadpool(pd.read_excel, io.BytesIO(content))
            
             required = ['route_id', 'stop_id', 'direction_id', 'sequence']
             if not all(c in df.columns for c in required):
@@ -585,7 +591,8 @@ async def generate_gtfs_from_sheet_endpoint(
         from app.services.gtfs_from_sheet import GTFSFromSheetGenerator
         
         generator = GTFSFromSheetGenerator(db)
-        result = generator.generate(
+        result = await run_in_threadpool(
+            generator.generate,
             sheet_data=sheet_data,
             route_id=route_id,
             route_name=route_name,
@@ -594,7 +601,8 @@ async def generate_gtfs_from_sheet_endpoint(
             shape_id_s1=shape_id_s1, # Manual (desde modal)
             shape_id_s2=shape_id_s2, # Manual (desde modal)
             stops_data=stops_data,   # Datos de paradas (ya filtrados y con shape_id)
-            bikes_allowed=bikes_allowed
+            bikes_allowed=bikes_allowed,
+            use_frequencies=use_frequencies  # Periodos de headway constante -> frequencies.txt
         )
         
         if not result.get('success'):
@@ -602,6 +610,8 @@ async def generate_gtfs_from_sheet_endpoint(
             raise HTTPException(500, f"Error en el generador: {result.get('errors', 'Error desconocido')}")
 
         print(f"  → ✅ GTFS generado: {result.get('trips_created')} trips.")
+        if result.get('frequencies_created'):
+            print(f"  → 🔁 {result['frequencies_created']} periodos en frequencies ({result.get('trips_represented')} salidas)")
         return result
         
     except Exception as e:
@@ -1,13 +1,27 @@
 # VERSIÓN FINAL CORRECTA - S1 y S2 como sentidos INDEPENDIENTES
 # app/api/timetables.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+from app.database import get_async_db
 from app.models import gtfs_models
+from app.services.timetable_engine import (
+    pivot_stop_times,
+    build_column_layout,
+    build_timetable_matrix,
+    format_matrix,
+    build_corridas,
+    export_timetables,
+)
+from app.services.stop_patterns import route_stops_pattern_query, route_stops_fallback_query
+from app.services.calendar_service import get_calendar_index_async, parse_service_date
+from app.services.departure_board import departure_index
+from app.services.frequencies import expand_timetable_rows, template_first_departures
+from app.services.spatial_index import get_spatial_index_async
+from app.utils.gtfs_time import parse_gtfs_time, format_gtfs_time
+from datetime import datetime
 from collections import defaultdict
-import re
 from typing import List, Dict, Any, Optional
 
 router = APIRouter(
@@ -15,73 +29,35 @@ router = APIRouter(
     tags=["timetables"],
 )
 
-def parse_time_to_seconds(time_str: Optional[str]) -> Optional[int]:
-    if time_str is None:
-        return None
-    try:
-        parts = list(map(int, str(time_str).split(':')))
-        if len(parts) == 3:
-            return parts[0] * 3600 + parts[1] * 60 + parts[2]
-        elif len(parts) == 2:
-            return parts[0] * 3600 + parts[1] * 60
-        return None
-    except:
-        return None
-
-def format_time_from_seconds(total_seconds: Optional[int]) -> Optional[str]:
-    if total_seconds is None:
-        return None
-    try:
-        total_seconds = int(total_seconds)
-        if total_seconds < 0:
-            return None
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        return f"{hours:02d}:{minutes:02d}"
-    except:
-        return None
-
-def get_bus_number_from_block(block_id: Optional[str]) -> Optional[int]:
-    if not block_id:
-        return None
-    try:
-        block_str = str(block_id)
-        
-        # Buscar patrón: número después de punto (.) o guión bajo (_)
-        # Ejemplos: "block_1.5" -> 5, "block_1_5" -> 5, "R1_05" -> 5
-        
-        # Primero intenta con punto
-        match_dot = re.search(r'\.(\d+)$', block_str)
-        if match_dot:
-            return int(match_dot.group(1))
-        
-        # Si no hay punto, intenta con guión bajo
-        match_underscore = re.search(r'_(\d+)$', block_str)
-        if match_underscore:
-            return int(match_underscore.group(1))
-        
-        # Si no encuentra ninguno, devolver None
-        return None
-    except:
-        return None
-
 @router.get("/available_services/")
 async def get_available_services(
     route_id: str = Query(...),
-    db: Session = Depends(get_db)
+    service_date: Optional[str] = Query(None, description="Solo servicios que operan en esta fecha (YYYY-MM-DD)"),
+    db = Depends(get_async_db)
 ):
     try:
-        trips = db.query(gtfs_models.Trip.service_id).filter(
-            gtfs_models.Trip.route_id == route_id
-        ).distinct().all()
+        trips = (await db.execute(
+            select(gtfs_models.Trip.service_id).where(
+                gtfs_models.Trip.route_id == route_id
+            ).distinct()
+        )).all()
 
         service_ids = [trip.service_id for trip in trips]
+        if service_date:
+            try:
+                day = parse_service_date(service_date)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            active = (await get_calendar_index_async(db)).services_on(day)
+            service_ids = [sid for sid in service_ids if sid in active]
         if not service_ids:
             return []
 
-        calendars = db.query(gtfs_models.Calendar).filter(
-            gtfs_models.Calendar.service_id.in_(service_ids)
-        ).all()
+        calendars = (await db.execute(
+            select(gtfs_models.Calendar).where(
+                gtfs_models.Calendar.service_id.in_(service_ids)
+            )
+        )).scalars().all()
 
         result = []
         for calendar in calendars:
@@ -111,316 +87,380 @@ async def get_available_services(
                 })
 
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/route_stops/")
-async def get_route_stops(
-    route_id: str = Query(...),
-    direction_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db)
+@router.get("/timetables/services-on/{service_date}")
+async def get_services_on_date(
+    service_date: str,
+    route_id: Optional[str] = Query(None, description="Limitar a servicios con trips en esta ruta"),
+    db = Depends(get_async_db)
 ):
+    """service_ids que operan en la fecha, aplicando calendar y las excepciones de calendar_dates."""
     try:
-        trip_query = db.query(gtfs_models.Trip).filter(
-            gtfs_models.Trip.route_id == route_id
-        )
-        
-        if direction_id is not None:
-            trip_query = trip_query.filter(gtfs_models.Trip.direction_id == direction_id)
-        
-        trips = trip_query.all()
-        if not trips:
-            return []
+        day = parse_service_date(service_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        trip_ids = [trip.trip_id for trip in trips]
-        
-        stop_counts = db.query(
-            gtfs_models.StopTime.trip_id,
-            func.count(gtfs_models.StopTime.stop_id).label('count')
-        ).filter(
-            gtfs_models.StopTime.trip_id.in_(trip_ids)
-        ).group_by(gtfs_models.StopTime.trip_id).order_by(
-            func.count(gtfs_models.StopTime.stop_id).desc()
-        ).first()
-
-        if not stop_counts:
-            return []
+    try:
+        index = await get_calendar_index_async(db)
+        service_ids = sorted(index.services_on(day))
+
+        if route_id and service_ids:
+            route_services = (await db.execute(
+                select(gtfs_models.Trip.service_id).where(
+                    gtfs_models.Trip.route_id == route_id,
+                    gtfs_models.Trip.service_id.in_(service_ids)
+                ).distinct()
+            )).scalars().all()
+            service_ids = sorted(route_services)
+
+        return {
+            "date": day.isoformat(),
+            "route_id": route_id,
+            "service_ids": service_ids,
+            "services": [
+                {"service_id": sid, "days": index.describe_days(sid)} for sid in service_ids
+            ]
+        }
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        longest_trip_id = stop_counts.trip_id
-        stop_times = db.query(gtfs_models.StopTime).filter(
-            gtfs_models.StopTime.trip_id == longest_trip_id
-        ).order_by(gtfs_models.StopTime.stop_sequence).all()
 
-        stop_ids = [st.stop_id for st in stop_times]
-        stops = db.query(gtfs_models.Stop).filter(
-            gtfs_models.Stop.stop_id.in_(stop_ids)
-        ).all()
+@router.get("/stops/nearby")
+async def get_nearby_stops(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(500, gt=0, le=20000),
+    limit: int = Query(20, ge=1, le=200),
+    db = Depends(get_async_db)
+):
+    """Paradas dentro de radius_m metros del punto, ordenadas por distancia."""
+    try:
+        index = await get_spatial_index_async(db)
+        return {
+            "lat": lat,
+            "lon": lon,
+            "radius_m": radius_m,
+            "stops": index.stops_nearby(lat, lon, radius_m, limit)
+        }
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        stops_dict = {stop.stop_id: stop for stop in stops}
 
-        result = []
-        for st in stop_times:
-            stop = stops_dict.get(st.stop_id)
-            if stop:
-                result.append({
-                    "stop_id": str(stop.stop_id),
-                    "stop_name": stop.stop_name,
-                    "stop_sequence": st.stop_sequence,
-                    "stop_lat": float(stop.stop_lat) if stop.stop_lat else None,
-                    "stop_lon": float(stop.stop_lon) if stop.stop_lon else None
-                })
+@router.get("/stops/{stop_id}/snap")
+async def snap_stop_to_shape(
+    stop_id: int,
+    shape_id: Optional[str] = Query(None, description="Shape destino; si se omite, el más cercano de todos"),
+    db = Depends(get_async_db)
+):
+    """Vértice de shape más cercano a una parada."""
+    index = await get_spatial_index_async(db)
+    coords = index.stop_coords(stop_id)
+    if coords is None:
+        raise HTTPException(status_code=404, detail=f"Parada {stop_id} no encontrada o sin coordenadas")
+    if shape_id is not None:
+        vertex = index.snap_to_shape(shape_id, *coords)
+        if vertex is None:
+            raise HTTPException(status_code=404, detail=f"Shape {shape_id} no encontrado")
+    else:
+        vertex = index.nearest_shape_vertex(*coords)
+        if vertex is None:
+            raise HTTPException(status_code=404, detail="No hay shapes cargados")
+    return {"stop_id": stop_id, "stop_lat": coords[0], "stop_lon": coords[1], "vertex": vertex}
+
+
+@router.get("/stops/{stop_id}/departures")
+async def get_stop_departures(
+    stop_id: int,
+    after: Optional[str] = Query(None, description="Hora HH:MM[:SS]; por defecto, ahora"),
+    service_date: Optional[str] = Query(None, description="Fecha YYYY-MM-DD; por defecto, hoy"),
+    limit: int = Query(10, ge=1, le=100),
+    route_id: Optional[str] = Query(None),
+    db = Depends(get_async_db)
+):
+    """Próximas salidas desde una parada (tablero de salidas)."""
+    now = datetime.now()
+    try:
+        day = parse_service_date(service_date) if service_date else now.date()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if after:
+        after_seconds = parse_gtfs_time(after)
+        if after_seconds is None:
+            raise HTTPException(status_code=400, detail=f"Hora inválida '{after}' (use HH:MM)")
+    else:
+        after_seconds = now.hour * 3600 + now.minute * 60 + now.second
 
-        return result
+    try:
+        calendar_index = await get_calendar_index_async(db)
+        entry = await departure_index.get_stop_async(db, stop_id)
+        departures = departure_index.next_departures(
+            entry, day, after_seconds, calendar_index, limit=limit, route_id=route_id
+        )
+        return {
+            "stop_id": stop_id,
+            "service_date": day.isoformat(),
+            "after": format_gtfs_time(after_seconds),
+            "departures": departures
+        }
     except Exception as e:
         print(f"❌ Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/generate_chained_timetable/")
-async def generate_chained_timetable(
+@router.get("/route_stops/")
+async def get_route_stops(
     route_id: str = Query(...),
-    service_id: str = Query(...),
-    selected_stop_ids: List[str] = Query(...),
-    db: Session = Depends(get_db)
+    direction_id: Optional[int] = Query(None),
+    db = Depends(get_async_db)
 ):
+    try:
+        # Patrón materializado (route_stop_patterns); si aún no existe, una sola consulta con ventana
+        rows = (await db.execute(route_stops_pattern_query(route_id, direction_id))).all()
+        if not rows:
+            rows = (await db.execute(route_stops_fallback_query(route_id, direction_id))).all()
+
+        result = []
+        for stop in rows:
+            result.append({
+                "stop_id": str(stop.stop_id),
+                "stop_name": stop.stop_name,
+                "stop_sequence": stop.stop_sequence,
+                "stop_lat": float(stop.stop_lat) if stop.stop_lat else None,
+                "stop_lon": float(stop.stop_lon) if stop.stop_lon else None
+            })
+
+        return result
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def compute_chained_timetables(
+    db,
+    route_id: str,
+    service_ids: List[str],
+    selected_stop_ids: List[str]
+) -> List[Dict[str, Any]]:
     """
     VERSIÓN FINAL CORRECTA:
     - S1 y S2 son INDEPENDIENTES (diferentes directions)
     - Cada sentido tiene sus propias paradas y secuencias
     - Solo se muestran las seleccionadas de cada sentido
+
+    Todos los service_id se resuelven en una sola pasada (mismas consultas);
+    devuelve un horario por servicio.
     """
-    
+
     print(f"\n{'='*70}")
     print(f"🚀 GENERANDO HORARIO - S1 Y S2 INDEPENDIENTES")
     print(f"{'='*70}")
     print(f"📍 Ruta: {route_id}")
-    print(f"📅 Servicio: {service_id}")
+    print(f"📅 Servicio(s): {', '.join(service_ids)}")
     print(f"🚏 Paradas seleccionadas: {len(selected_stop_ids)}")
     
     if len(selected_stop_ids) < 2:
         raise HTTPException(status_code=400, detail="Mínimo 2 paradas")
 
     try:
-        # 1. Obtener trip de SENTIDO 1 (direction_id=0)
-        trip_s1 = db.query(gtfs_models.Trip).filter(
-            gtfs_models.Trip.route_id == route_id,
-            gtfs_models.Trip.service_id == service_id,
-            gtfs_models.Trip.direction_id == 0
-        ).first()
-        
-        # 2. Obtener trip de SENTIDO 2 (direction_id=1)
-        trip_s2 = db.query(gtfs_models.Trip).filter(
-            gtfs_models.Trip.route_id == route_id,
-            gtfs_models.Trip.service_id == service_id,
-            gtfs_models.Trip.direction_id == 1
-        ).first()
-        
-        if not trip_s1 or not trip_s2:
-            raise HTTPException(status_code=404, detail="No hay trips para ambos sentidos")
-        
-        # 3. Obtener TODAS las paradas de S1 ordenadas
-        stop_times_s1 = db.query(gtfs_models.StopTime).filter(
-            gtfs_models.StopTime.trip_id == trip_s1.trip_id
-        ).order_by(gtfs_models.StopTime.stop_sequence).all()
-        
-        all_stops_s1 = [str(st.stop_id) for st in stop_times_s1]
-        
-        # 4. Obtener TODAS las paradas de S2 ordenadas
-        stop_times_s2 = db.query(gtfs_models.StopTime).filter(
-            gtfs_models.StopTime.trip_id == trip_s2.trip_id
-        ).order_by(gtfs_models.StopTime.stop_sequence).all()
-        
-        all_stops_s2 = [str(st.stop_id) for st in stop_times_s2]
-        
-        print(f"✅ Paradas totales S1: {len(all_stops_s1)}")
-        print(f"✅ Paradas totales S2: {len(all_stops_s2)}")
-        
-        # 5. Obtener nombres de todas las paradas
-        all_stop_ids_combined = list(set(all_stops_s1 + all_stops_s2))
-        stops_query = db.query(gtfs_models.Stop).filter(
-            gtfs_models.Stop.stop_id.in_(all_stop_ids_combined)
-        ).all()
+        # 1. Todos los trips de la ruta para los servicios pedidos (una sola consulta)
+        trip_rows = (await db.execute(
+            select(
+                gtfs_models.Trip.trip_id,
+                gtfs_models.Trip.service_id,
+                gtfs_models.Trip.direction_id,
+                gtfs_models.Trip.block_id
+            ).where(
+                gtfs_models.Trip.route_id == route_id,
+                gtfs_models.Trip.service_id.in_(service_ids)
+            )
+        )).all()
+        trips_by_service = defaultdict(list)
+        for row in trip_rows:
+            trips_by_service[row.service_id].append({
+                "trip_id": row.trip_id,
+                "service_id": row.service_id,
+                "direction_id": row.direction_id,
+                "block_id": row.block_id,
+            })
+
+        print(f"✅ Total trips: {len(trip_rows)}")
+
+        # 2. Trip representativo de cada sentido por servicio (define paradas y secuencias)
+        representative = {}
+        for sid in service_ids:
+            for trip in trips_by_service.get(sid, []):
+                key = (sid, trip["direction_id"])
+                if trip["direction_id"] in (0, 1) and key not in representative:
+                    representative[key] = trip["trip_id"]
+            if (sid, 0) not in representative or (sid, 1) not in representative:
+                raise HTTPException(status_code=404, detail=f"No hay trips para ambos sentidos (servicio {sid})")
+
+        # 3. Paradas ordenadas de los trips representativos (una sola consulta)
+        pattern_rows = (await db.execute(
+            select(gtfs_models.StopTime.trip_id, gtfs_models.StopTime.stop_id).where(
+                gtfs_models.StopTime.trip_id.in_(set(representative.values()))
+            ).order_by(gtfs_models.StopTime.trip_id, gtfs_models.StopTime.stop_sequence)
+        )).all()
+        patterns = defaultdict(list)
+        for trip_id, stop_id in pattern_rows:
+            patterns[trip_id].append(str(stop_id))
+
+        # 4. Nombres de todas las paradas involucradas
+        all_stop_ids_combined = {stop_id for stops in patterns.values() for stop_id in stops}
+        stops_query = (await db.execute(
+            select(gtfs_models.Stop.stop_id, gtfs_models.Stop.stop_name).where(
+                gtfs_models.Stop.stop_id.in_(all_stop_ids_combined)
+            )
+        )).all()
         stops_dict = {str(stop.stop_id): stop.stop_name for stop in stops_query}
         
         # Validar paradas seleccionadas
         for stop_id in selected_stop_ids:
             if stop_id not in stops_dict:
                 raise HTTPException(status_code=404, detail=f"Parada {stop_id} no existe")
+
+        # 5. stop_times de paradas seleccionadas (solo tuplas, tiempos en segundos)
+        stop_times = (await db.execute(
+            select(
+                gtfs_models.StopTime.trip_id,
+                gtfs_models.StopTime.stop_id,
+                func.coalesce(
+                    gtfs_models.StopTime.departure_seconds,
+                    gtfs_models.StopTime.arrival_seconds
+                ).label('seconds')
+            ).join(
+                gtfs_models.Trip, gtfs_models.Trip.trip_id == gtfs_models.StopTime.trip_id
+            ).where(
+                gtfs_models.Trip.route_id == route_id,
+                gtfs_models.Trip.service_id.in_(service_ids),
+                gtfs_models.StopTime.stop_id.in_(selected_stop_ids)
+            ).order_by(
+                gtfs_models.StopTime.trip_id,
+                gtfs_models.StopTime.stop_sequence
+            )
+        )).all()
         
+        print(f"✅ Stop times: {len(stop_times)}")
+
+        # 6. Trips plantilla (frequencies): una corrida explícita por salida, con su block_id
+        first_departure = template_first_departures()
+        frequency_rows = (await db.execute(
+            select(
+                gtfs_models.Frequency.trip_id,
+                gtfs_models.Frequency.start_seconds,
+                gtfs_models.Frequency.end_seconds,
+                gtfs_models.Frequency.headway_secs,
+                first_departure.c.first_seconds
+            ).join(
+                gtfs_models.Trip, gtfs_models.Trip.trip_id == gtfs_models.Frequency.trip_id
+            ).join(
+                first_departure, first_departure.c.trip_id == gtfs_models.Frequency.trip_id
+            ).where(
+                gtfs_models.Trip.route_id == route_id,
+                gtfs_models.Trip.service_id.in_(service_ids)
+            )
+        )).all()
+        if frequency_rows:
+            trips, stop_times = expand_timetable_rows(
+                [trip for sid in service_ids for trip in trips_by_service.get(sid, [])],
+                stop_times,
+                frequency_rows
+            )
+            trips_by_service = defaultdict(list)
+            for trip in trips:
+                trips_by_service[trip["service_id"]].append(trip)
+            print(f"✅ Frequencies: {len(frequency_rows)} periodos expandidos ({len(stop_times)} stop times)")
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-    # 6. CREAR HEADERS - Filtrar solo seleccionadas
-    headers = ["Corridas", "Bus"]
-    column_keys = []
-    
-    print(f"\n📋 Columnas S1 (solo seleccionadas):")
-    # S1: Solo paradas seleccionadas que existen en S1
-    for stop_id in all_stops_s1:
-        if stop_id in selected_stop_ids:
-            name = stops_dict[stop_id]
-            headers.append(f"{name} (S1)")
-            column_keys.append(f"s1_{stop_id}")
-            print(f"  s1_{stop_id}: {name}")
-    
-    print(f"\n📋 Columnas S2 (solo seleccionadas):")
-    # S2: Solo paradas seleccionadas que existen en S2
-    for stop_id in all_stops_s2:
-        if stop_id in selected_stop_ids:
-            name = stops_dict[stop_id]
-            headers.append(f"{name} (S2)")
-            column_keys.append(f"s2_{stop_id}")
-            print(f"  s2_{stop_id}: {name}")
-    
-    print(f"\n✅ Total columnas: {len(headers)}")
+    # 7. Matriz trips × paradas (segundos), construida una sola vez para todos los servicios
+    wide, first_times = await run_in_threadpool(pivot_stop_times, stop_times)
+
+    # 8. Un horario por servicio
+    timetables = []
+    for sid in service_ids:
+        all_stops_s1 = patterns[representative[(sid, 0)]]
+        all_stops_s2 = patterns[representative[(sid, 1)]]
+        headers, column_keys = build_column_layout(all_stops_s1, all_stops_s2, selected_stop_ids, stops_dict)
+        print(f"\n📋 Servicio {sid}: {len(headers)} columnas")
+
+        pairs, matrix = build_timetable_matrix(trips_by_service[sid], wide, first_times, column_keys)
+        all_corridas = build_corridas(pairs, format_matrix(matrix))
+        print(f"✅ Corridas: {len(all_corridas)}")
+
+        timetables.append({
+            "headers": headers,
+            "corridas": all_corridas,
+            "stop_ids_ordered": column_keys,
+            "total_corridas": len(all_corridas),
+            "route_id": route_id,
+            "service_id": sid
+        })
 
-    # 7. Obtener TODOS los trips
-    try:
-        trips = db.query(gtfs_models.Trip).filter(
-            gtfs_models.Trip.route_id == route_id,
-            gtfs_models.Trip.service_id == service_id
-        ).all()
-        
-        print(f"✅ Total trips: {len(trips)}")
-        
-        if not trips:
-            return {
-                "headers": headers,
-                "corridas": [],
-                "stop_ids_ordered": column_keys,
-                "total_corridas": 0,
-                "route_id": route_id,
-                "service_id": service_id
-            }
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error trips: {e}")
+    print(f"{'='*70}\n")
+    return timetables
 
-    trip_ids = [trip.trip_id for trip in trips]
 
-    # 8. Obtener stop_times de paradas seleccionadas
-    try:
-        stop_times = db.query(gtfs_models.StopTime).filter(
-            gtfs_models.StopTime.trip_id.in_(trip_ids),
-            gtfs_models.StopTime.stop_id.in_(selected_stop_ids)
-        ).all()
-        
-        print(f"✅ Stop times: {len(stop_times)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error stop_times: {e}")
-
-    # 9. Organizar por trip
-    stop_times_by_trip = defaultdict(lambda: {})
-    trip_first_time = {}
-
-    for st in stop_times:
-        time_str = st.departure_time or st.arrival_time
-        if time_str:
-            time_seconds = parse_time_to_seconds(str(time_str))
-            if time_seconds is not None:
-                stop_times_by_trip[st.trip_id][str(st.stop_id)] = time_seconds
-                
-                if st.trip_id not in trip_first_time:
-                    trip_first_time[st.trip_id] = time_seconds
-
-    # 10. Separar por dirección
-    trips_ida = []
-    trips_vuelta = []
-
-    for trip in trips:
-        if trip.trip_id in trip_first_time:
-            trip.start_time = trip_first_time[trip.trip_id]
-            if trip.direction_id == 0:
-                trips_ida.append(trip)
-            else:
-                trips_vuelta.append(trip)
-
-    trips_ida.sort(key=lambda t: t.start_time)
-    trips_vuelta.sort(key=lambda t: t.start_time)
-
-    print(f"✅ IDA: {len(trips_ida)}, VUELTA: {len(trips_vuelta)}")
-
-    # 11. EMPALMADO
-    all_corridas = []
-    used_vuelta = set()
-    
-    for ida_trip in trips_ida:
-        bus_number = get_bus_number_from_block(ida_trip.block_id)
-        block_id = ida_trip.block_id
-        
-        corrida = {
-            "id": f"ida_{ida_trip.trip_id}",
-            "bus": bus_number,
-            "times": {key: None for key in column_keys},
-            "sort_time": ida_trip.start_time,
-        }
-        
-        # Llenar S1 según orden de all_stops_s1
-        ida_times = stop_times_by_trip[ida_trip.trip_id]
-        for stop_id in all_stops_s1:
-            if stop_id in selected_stop_ids and stop_id in ida_times:
-                corrida["times"][f"s1_{stop_id}"] = format_time_from_seconds(ida_times[stop_id])
-        
-        # Buscar VUELTA del mismo block
-        vuelta_trip = None
-        for vtrip in trips_vuelta:
-            if (vtrip.block_id == block_id and 
-                vtrip.trip_id not in used_vuelta and
-                vtrip.start_time > ida_trip.start_time):
-                vuelta_trip = vtrip
-                break
-        
-        if vuelta_trip:
-            # Llenar S2 según orden de all_stops_s2
-            vuelta_times = stop_times_by_trip[vuelta_trip.trip_id]
-            for stop_id in all_stops_s2:
-                if stop_id in selected_stop_ids and stop_id in vuelta_times:
-                    corrida["times"][f"s2_{stop_id}"] = format_time_from_seconds(vuelta_times[stop_id])
-            
-            used_vuelta.add(vuelta_trip.trip_id)
-        
-        all_corridas.append(corrida)
-    
-    # VUELTA sin IDA
-    for vuelta_trip in trips_vuelta:
-        if vuelta_trip.trip_id in used_vuelta:
-            continue
-        
-        bus_number = get_bus_number_from_block(vuelta_trip.block_id)
-        
-        corrida = {
-            "id": f"vuelta_{vuelta_trip.trip_id}",
-            "bus": bus_number,
-            "times": {key: None for key in column_keys},
-            "sort_time": vuelta_trip.start_time,
-        }
-        
-        vuelta_times = stop_times_by_trip[vuelta_trip.trip_id]
-        for stop_id in all_stops_s2:
-            if stop_id in selected_stop_ids and stop_id in vuelta_times:
-                corrida["times"][f"s2_{stop_id}"] = format_time_from_seconds(vuelta_times[stop_id])
-        
-        all_corridas.append(corrida)
+@router.get("/generate_chained_timetable/")
+async def generate_chained_timetable(
+    route_id: str = Query(...),
+    service_id: List[str] = Query(..., description="Uno o varios service_id (se repite el parámetro)"),
+    selected_stop_ids: List[str] = Query(...),
+    db = Depends(get_async_db)
+):
+    """
+    Horario empalmado IDA/VUELTA. Con un solo service_id devuelve el horario;
+    con varios, {"route_id", "service_ids", "timetables": [...]}.
+    """
+    service_ids = list(dict.fromkeys(service_id))
+    timetables = await compute_chained_timetables(db, route_id, service_ids, selected_stop_ids)
 
-    print(f"✅ Corridas: {len(all_corridas)}")
+    if len(timetables) == 1:
+        return timetables[0]
+    return {
+        "route_id": route_id,
+        "service_ids": service_ids,
+        "timetables": timetables
+    }
 
-    # 12. Ordenar
-    all_corridas.sort(key=lambda c: c["sort_time"])
-    
-    for idx, corrida in enumerate(all_corridas):
-        corrida["corrida_num"] = idx + 1
-        del corrida["sort_time"]
 
-    print(f"{'='*70}\n")
+@router.get("/chained_timetable/download")
+async def download_chained_timetable(
+    route_id: str = Query(...),
+    service_id: List[str] = Query(...),
+    selected_stop_ids: List[str] = Query(...),
+    format: str = Query("xlsx", pattern="^(csv|xlsx)$"),
+    db = Depends(get_async_db)
+):
+    """Descarga el horario empalmado como CSV o XLSX (una hoja por servicio) para impresión."""
+    service_ids = list(dict.fromkeys(service_id))
+    timetables = await compute_chained_timetables(db, route_id, service_ids, selected_stop_ids)
 
-    return {
-        "headers": headers,
-        "corridas": all_corridas,
-        "stop_ids_ordered": column_keys,
-        "total_corridas": len(all_corridas),
-        "route_id": route_id,
-        "service_id": service_id
-    }
\ No newline at end of file
+    try:
+        content = await run_in_threadpool(export_timetables, timetables, format)
+    except Exception as e:
+        print(f"❌ Error al exportar horario: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al exportar horario: {str(e)}")
+
+    filename = f"horario_{route_id}_{'_'.join(service_ids)}.{format}"
+    media_type = (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        if format == "xlsx" else "text/csv; charset=utf-8"
+    )
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
@@ -3,6 +3,34 @@ from typing import Optional
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # Réplica / URL de solo lectura (opcional; por defecto la misma BD)
+    DATABASE_READ_URL: Optional[str] = None
+    # Pool (backends cliente-servidor)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    # Perfil SQLite
+    SQLITE_BUSY_TIMEOUT_MS: int = 30000
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 268435456
+    # Snapshot compilado del feed (arreglos .npy mapeados en memoria por cada worker)
+    FEED_SNAPSHOT_ENABLED: bool = True
+    FEED_SNAPSHOT_DIR: str = "data/feed_snapshot"
+    # Cachés en memoria por worker: segundos que se reutiliza la versión compartida leída de la BD (0 = en cada petición)
+    CACHE_VERSION_CHECK_SECONDS: float = 1.0
+    # Procesos para parsear KML en importaciones por lote (0 = núcleos disponibles)
+    KML_PARSE_WORKERS: int = 0
+    # Cálculo de /excel/process-parameters: "native" (en memoria) o "excel" (libro vía xlwings, solo Windows)
+    SCHEDULING_ENGINE: str = "native"
+    # Middleware de latencias, temporizadores SQL y endpoint /metrics
+    METRICS_ENABLED: bool = True
+    # Arranque en frío: importar cada router con su primera petición
+    LAZY_ROUTERS: bool = False
+    # Importar GTFS en tablas de staging y publicarlo de una vez (False = borrar y recargar en vivo)
+    GTFS_IMPORT_STAGED: bool = True
+    # Aplicar migraciones pendientes de Alembic al arrancar (en producción: python migrate.py)
+    AUTO_MIGRATE: bool = True
     API_TITLE: str = "Transit Scheduler API"
     API_VERSION: str = "1.0.0"
     API_DESCRIPTION: str = "Sistema de programación de rutas de transporte público"
@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 from app.config import settings
 import logging
 
@@ -8,15 +9,152 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = settings.DATABASE_URL
+READ_DATABASE_URL = settings.DATABASE_READ_URL or DATABASE_URL
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
 logger.info(f"Connecting to database with URL: {DATABASE_URL}")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+
+def _engine_options(url: str) -> dict:
+    """Perfil de pool según el backend."""
+    if url.startswith("sqlite"):
+        # SQLite usa un pool por archivo; timeout = espera a nivel driver ante bloqueos
+        return {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            },
+        }
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _apply_sqlite_pragmas(engine, read_only: bool = False) -> None:
+    """Aplica los PRAGMA de rendimiento en cada conexión nueva."""
+    in_memory = _is_sqlite_memory(str(engine.url))
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if not in_memory:
+                # WAL: los lectores no bloquean al escritor (ni viceversa) durante las importaciones
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+            # Valor negativo = tamaño en KiB
+            cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+
+
+def _apply_postgres_read_only(engine) -> None:
+    @event.listens_for(engine, "connect")
+    def _set_read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+        finally:
+            cursor.close()
+        dbapi_connection.commit()
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+if IS_SQLITE:
+    _apply_sqlite_pragmas(engine)
+
+# Engine de solo lectura para endpoints de consulta intensiva (listados, exportaciones).
+# En SQLite en memoria cada conexión es una BD distinta, así que se reutiliza el engine principal.
+if IS_SQLITE and _is_sqlite_memory(READ_DATABASE_URL):
+    read_engine = engine
+else:
+    read_engine = create_engine(READ_DATABASE_URL, **_engine_options(READ_DATABASE_URL))
+    if READ_DATABASE_URL.startswith("sqlite"):
+        _apply_sqlite_pragmas(read_engine, read_only=True)
+    elif READ_DATABASE_URL.startswith("postgresql"):
+        _apply_postgres_read_only(read_engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+# --- Acceso asíncrono para endpoints de lectura ---
+
+def _async_url(url: str) -> str:
+    """Traduce la URL síncrona al driver async equivalente (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    return url
+
+
+def _create_async_read_engine():
+    if IS_SQLITE and _is_sqlite_memory(READ_DATABASE_URL):
+        # Una BD en memoria no es compartible entre engines: se usa el sustituto con hilos
+        return None
+    try:
+        import greenlet  # noqa: F401  (requerido por sqlalchemy.ext.asyncio)
+        from sqlalchemy.ext.asyncio import create_async_engine
+        options = _engine_options(READ_DATABASE_URL)
+        if READ_DATABASE_URL.startswith("postgres"):
+            options["connect_args"] = {"server_settings": {"default_transaction_read_only": "on"}}
+        async_engine = create_async_engine(_async_url(READ_DATABASE_URL), **options)
+    except ImportError as e:
+        logger.warning(f"Driver async no disponible ({e}); las lecturas async usarán el pool de hilos")
+        return None
+    if READ_DATABASE_URL.startswith("sqlite"):
+        _apply_sqlite_pragmas(async_engine.sync_engine, read_only=True)
+    return async_engine
+
+
+class ThreadedAsyncSession:
+    """
+    Sustituto local de AsyncSession (tests, SQLite en memoria o sin driver async):
+    ejecuta la sesión síncrona de solo lectura en el pool de hilos para no
+    bloquear el event loop. Solo expone lo que usan los endpoints de lectura.
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    async def execute(self, statement, params=None):
+        # freeze() materializa las filas dentro del hilo; el Result resultante ya está en memoria
+        frozen = await run_in_threadpool(lambda: self._session.execute(statement, params).freeze())
+        return frozen()
+
+    async def scalar(self, statement, params=None):
+        return await run_in_threadpool(self._session.scalar, statement, params)
+
+    async def get(self, entity, ident):
+        return await run_in_threadpool(self._session.get, entity, ident)
+
+    async def close(self):
+        await run_in_threadpool(self._session.close)
+
+
+async_read_engine = _create_async_read_engine()
+if async_read_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+else:
+    AsyncReadSessionLocal = None
 Base = declarative_base()
 
 def get_db():
@@ -24,4 +162,24 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """Sesión de solo lectura: no compite con las escrituras de las importaciones."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    """Sesión async de solo lectura (AsyncSession o, si no hay driver, ThreadedAsyncSession)."""
+    if AsyncReadSessionLocal is not None:
+        async with AsyncReadSessionLocal() as db:
+            yield db
+        return
+    db = ThreadedAsyncSession(ReadSessionLocal())
+    try:
+        yield db
+    finally:
+        await db.close()
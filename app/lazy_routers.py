@@ -0,0 +1,83 @@
+# app/lazy_routers.py
+
+"""
+Registro diferido de routers para arranques en frío rápidos.
+
+Cada router se declara por módulo y prefijo, sin importarlo. En modo diferido
+(LAZY_ROUTERS) el módulo —y con él pandas, numpy, openpyxl, lxml...— se importa
+con la primera petición cuyo path cae bajo su prefijo; /docs y /openapi.json
+cargan todos. La importación corre en el pool de hilos, así que el event loop
+sigue atendiendo /health mientras tanto.
+"""
+
+import importlib
+import threading
+from typing import Iterable, List, NamedTuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.metrics import stage_timer
+
+
+class RouterSpec(NamedTuple):
+    module: str  # módulo que expone `router`
+    prefix: str  # prefijo de sus rutas
+
+
+class LazyRouterRegistry:
+    """Routers pendientes de importar; cada uno se incluye en la app una sola vez."""
+
+    def __init__(self, app, specs: Iterable[RouterSpec]):
+        self.app = app
+        self._pending = {spec.module: spec for spec in specs}
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> List[str]:
+        return list(self._pending)
+
+    def load(self, module_name: str) -> None:
+        with self._lock:
+            spec = self._pending.get(module_name)
+            if spec is None:
+                return
+            with stage_timer(f"router_load.{module_name.rsplit('.', 1)[-1]}") as timer:
+                module = importlib.import_module(spec.module)
+                self.app.include_router(module.router)
+                # El esquema OpenAPI en caché no incluiría las rutas nuevas
+                self.app.openapi_schema = None
+            del self._pending[module_name]
+        print(f"📦 Router {module_name} cargado en {timer.elapsed * 1000:.0f}ms")
+
+    def load_for_path(self, path: str) -> None:
+        for spec in list(self._pending.values()):
+            if path == spec.prefix or path.startswith(spec.prefix + "/"):
+                self.load(spec.module)
+
+    def load_all(self) -> None:
+        for module_name in list(self._pending):
+            self.load(module_name)
+
+
+def include_routers(app, specs: Iterable[RouterSpec]) -> None:
+    """Modo normal: importa e incluye todos los routers al arrancar."""
+    for spec in specs:
+        app.include_router(importlib.import_module(spec.module).router)
+
+
+class LazyRouterMiddleware:
+    """Middleware ASGI que carga el router correspondiente antes de enrutar la petición."""
+
+    def __init__(self, app, registry: LazyRouterRegistry, load_all_paths: Iterable[str] = ()):
+        self.app = app
+        self.registry = registry
+        self.load_all_paths = set(load_all_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and self.registry.pending:
+            path = scope["path"]
+            if path in self.load_all_paths:
+                await run_in_threadpool(self.registry.load_all)
+            else:
+                await run_in_threadpool(self.registry.load_for_path, path)
+        await self.app(scope, receive, send)
@@ -1,28 +1,49 @@
 # app/main.py
 
+import time
+
+_startup_started = time.perf_counter()
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import os
 
 from app.config import settings
-from app.database import engine
-from app.api import bulk_operations
-from app.models import gtfs_models, scheduling_models
-
-# Importar todos los routers
-from app.api import (
-    gtfs,
-    kml,
-    csv,
-    admin_web,
-    admin,
-    routes_api,
-    export_gtfs,
-    scheduling,
-    timetables,
-    excel_integration  # ✅ NUEVO: Router para integración con Excel
-)
+from app.database import engine, read_engine, async_read_engine
+from app.lazy_routers import LazyRouterMiddleware, LazyRouterRegistry, RouterSpec, include_routers
+from app.schema_version import current_revision, head_revision, upgrade_schema
+from app.services.metrics import STAGE_SECONDS, MetricsMiddleware, instrument_engine, stage_timer
+
+# Routers (módulo y prefijo); en modo diferido se importan con su primera petición
+ROUTERS = [
+    RouterSpec("app.api.gtfs", "/gtfs"),
+    RouterSpec("app.api.kml", "/kml"),
+    RouterSpec("app.api.csv", "/csv"),
+    RouterSpec("app.api.admin_web", "/admin-web"),
+    RouterSpec("app.api.admin", "/admin"),
+    RouterSpec("app.api.routes_api", "/routes"),
+    RouterSpec("app.api.export_gtfs", "/export-gtfs"),
+    RouterSpec("app.api.scheduling", "/scheduling"),
+    RouterSpec("app.api.timetables", "/api"),
+    RouterSpec("app.api.bulk_operations", "/bulk"),
+    RouterSpec("app.api.excel_integration", "/excel"),  # ✅ NUEVO: Router para integración con Excel
+]
+if settings.METRICS_ENABLED:
+    ROUTERS.append(RouterSpec("app.api.metrics", "/metrics"))
+
+# Duración de cada fase del arranque (segundos)
+STARTUP_TIMINGS = {}
+
+
+def _record_startup_phase(phase: str, started: float) -> float:
+    now = time.perf_counter()
+    STARTUP_TIMINGS[phase] = round(now - started, 4)
+    STAGE_SECONDS.observe(now - started, f"startup.{phase}")
+    return now
+
+
+_phase_started = _record_startup_phase("imports", _startup_started)
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -48,33 +69,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas: latencia por ruta y sentencias SQL por engine
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine, "primary")
+    instrument_engine(read_engine, "read")
+    if async_read_engine is not None:
+        instrument_engine(async_read_engine.sync_engine, "read_async")
+
 # Incluir routers
-logger.info("Including API routers...")
-app.include_router(gtfs.router)
-app.include_router(kml.router)
-app.include_router(csv.router)
-app.include_router(admin_web.router)
-app.include_router(admin.router)
-app.include_router(routes_api.router)
-app.include_router(export_gtfs.router)
-app.include_router(scheduling.router)
-app.include_router(timetables.router)
-app.include_router(bulk_operations.router)
-app.include_router(excel_integration.router)  # ✅ NUEVO
-logger.info("All API routers included.")
+if settings.LAZY_ROUTERS:
+    logger.info("Registering API routers (lazy)...")
+    router_registry = LazyRouterRegistry(app, ROUTERS)
+    app.add_middleware(
+        LazyRouterMiddleware,
+        registry=router_registry,
+        load_all_paths=(app.docs_url, app.redoc_url, app.openapi_url),
+    )
+else:
+    logger.info("Including API routers...")
+    router_registry = None
+    include_routers(app, ROUTERS)
+logger.info("All API routers registered.")
+_phase_started = _record_startup_phase("routers", _phase_started)
 
 # Evento Startup
 @app.on_event("startup")
 def create_tables():
-    """Verifica y crea las tablas de la base de datos al iniciar."""
-    try:
-        logger.info("Verificando/creando tablas GTFS...")
-        gtfs_models.Base.metadata.create_all(bind=engine)
-        logger.info("Verificando/creando tablas Scheduling...")
-        scheduling_models.Base.metadata.create_all(bind=engine)
-        logger.info("Tablas OK.")
-    except Exception as e:
-        logger.error(f"Error al verificar/crear tablas: {e}", exc_info=True)
+    """Compara la revisión del esquema con la head de Alembic; migra si AUTO_MIGRATE está activo."""
+    with stage_timer("startup.schema") as timer:
+        try:
+            head = head_revision()
+            current = current_revision(engine)
+            if current == head:
+                logger.info(f"Esquema al día (revisión {head}).")
+            elif settings.AUTO_MIGRATE:
+                logger.info(f"Migrando esquema {current or 'sin versión'} -> {head}...")
+                upgrade_schema(engine)
+                logger.info("Tablas OK.")
+            else:
+                logger.warning(
+                    f"Esquema en revisión {current or 'sin versión'}, se esperaba {head}: ejecute python migrate.py"
+                )
+        except Exception as e:
+            logger.error(f"Error al verificar/migrar el esquema: {e}", exc_info=True)
+    STARTUP_TIMINGS["schema"] = round(timer.elapsed, 4)
+    STARTUP_TIMINGS["total"] = round(time.perf_counter() - _startup_started, 4)
+    phases = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in STARTUP_TIMINGS.items())
+    logger.info(f"⏱️ Arranque: {phases}")
 
 # Ruta Raíz
 @app.get("/")
@@ -82,4 +124,13 @@ async def read_root():
     """Ruta raíz simple para verificar que el backend está activo."""
     return {"message": f"Welcome to {settings.API_TITLE} v{settings.API_VERSION}"}
 
-logger.info("FastAPI application setup complete.")
\ No newline at end of file
+# Health check (healthCheckPath de Render): no toca la BD ni carga routers
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "startup": STARTUP_TIMINGS,
+        "routers_pending": router_registry.pending if router_registry else [],
+    }
+
+logger.info("FastAPI application setup complete.")
@@ -0,0 +1,17 @@
+# app/models/cache_models.py
+
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+from app.database import Base
+
+class CacheVersion(Base):
+    """
+    Versión compartida de un caché en memoria (índice de calendario, tablero de
+    salidas, índice espacial). Cada worker recuerda con qué versión construyó
+    su caché y lo descarta cuando la fila cambia (ver app/services/cache_versions.py).
+    """
+    __tablename__ = "cache_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
@@ -1,8 +1,9 @@
 # app/models/gtfs_models.py
 
-from sqlalchemy import Column, Integer, String, Boolean, Date, Time, Float, ForeignKey, DECIMAL
+from sqlalchemy import Column, Integer, String, Boolean, Date, Float, ForeignKey, DECIMAL, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.utils.gtfs_time import parse_gtfs_time, format_gtfs_time
 
 # -------------------------------
 # Agency
@@ -43,6 +44,11 @@ class CalendarDate(Base):
     # 1 = Servicio añadido, 2 = Servicio removido
     exception_type = Column(Integer, nullable=False, default=1)
 
+    __table_args__ = (
+        # Excepciones de un servicio en una fecha (calendario activo)
+        Index("ix_calendar_dates_service_date", "service_id", "date"),
+    )
+
 
 # -------------------------------
 # FeedInfo
@@ -120,6 +126,11 @@ class Shape(Base):
     shape_pt_lon = Column(DECIMAL(11, 8), nullable=True)
     shape_dist_traveled = Column(Float, nullable=True)
 
+    __table_args__ = (
+        # Lecturas de shapes ordenadas por (shape_id, shape_pt_sequence)
+        Index("ix_shapes_shape_sequence", "shape_id", "shape_pt_sequence"),
+    )
+
 
 # -------------------------------
 # Stop
@@ -141,7 +152,7 @@ class Stop(Base):
 class Trip(Base):
     __tablename__ = "trips"
     trip_id = Column(String(50), primary_key=True, index=True)
-    route_id = Column(String(50), ForeignKey("routes.route_id"))
+    route_id = Column(String(50), ForeignKey("routes.route_id"), index=True)
     service_id = Column(String(50), ForeignKey("calendar.service_id"))
     trip_headsign = Column(String(255), nullable=True)
     direction_id = Column(Integer, nullable=True)
@@ -153,6 +164,13 @@ class Trip(Base):
     route = relationship("Route", back_populates="trips")
     calendar = relationship("Calendar", back_populates="trips")
     stop_times = relationship("StopTime", back_populates="trip")
+    frequencies = relationship("Frequency", back_populates="trip")
+
+    __table_args__ = (
+        # Patrones por (ruta, sentido) y filtros por servicio
+        Index("ix_trips_route_direction", "route_id", "direction_id"),
+        Index("ix_trips_service_id", "service_id"),
+    )
 
 
 # -------------------------------
@@ -161,13 +179,68 @@ class Trip(Base):
 class StopTime(Base):
     __tablename__ = "stop_times"
     id = Column(Integer, primary_key=True, index=True)
-    trip_id = Column(String(50), ForeignKey("trips.trip_id"))
-    stop_id = Column(Integer, ForeignKey("stops.stop_id"))
-    arrival_time = Column(Time, nullable=True)
-    departure_time = Column(Time, nullable=True)
+    trip_id = Column(String(50), ForeignKey("trips.trip_id"), index=True)
+    stop_id = Column(Integer, ForeignKey("stops.stop_id"), index=True)
+    # Tiempos en segundos desde el inicio del día de servicio (admite >= 24:00:00)
+    arrival_seconds = Column(Integer, nullable=True)
+    departure_seconds = Column(Integer, nullable=True, index=True)
     timepoint = Column(Integer, nullable=True)
     stop_sequence = Column(Integer, nullable=True)
     shape_dist_traveled = Column(Float, nullable=True)
 
     trip = relationship("Trip", back_populates="stop_times")
-    stop = relationship("Stop", back_populates="stop_times")
\ No newline at end of file
+    stop = relationship("Stop", back_populates="stop_times")
+
+    __table_args__ = (
+        # Paradas de un trip en orden (exportación, patrones, snapshot)
+        Index("ix_stop_times_trip_sequence", "trip_id", "stop_sequence"),
+        # Tablero de salidas: una parada ordenada por hora
+        Index("ix_stop_times_stop_departure", "stop_id", "departure_seconds"),
+    )
+
+    # Accesores legacy: leen/escriben el formato GTFS "HH:MM:SS" sobre las columnas en segundos
+    @property
+    def arrival_time(self):
+        return format_gtfs_time(self.arrival_seconds)
+
+    @arrival_time.setter
+    def arrival_time(self, value):
+        self.arrival_seconds = parse_gtfs_time(value)
+
+    @property
+    def departure_time(self):
+        return format_gtfs_time(self.departure_seconds)
+
+    @departure_time.setter
+    def departure_time(self, value):
+        self.departure_seconds = parse_gtfs_time(value)
+
+
+# -------------------------------
+# Frequency
+# -------------------------------
+class Frequency(Base):
+    """
+    Periodo de headway constante de un trip plantilla (frequencies.txt).
+
+    Con exact_times=1 el trip se repite a start + k * headway_secs mientras la
+    salida sea < end; sus stop_times definen los tiempos relativos a la salida.
+    """
+    __tablename__ = "frequencies"
+    id = Column(Integer, primary_key=True, index=True)
+    trip_id = Column(String(50), ForeignKey("trips.trip_id"), index=True, nullable=False)
+    # Segundos desde el inicio del día de servicio (admite >= 24:00:00), igual que stop_times
+    start_seconds = Column(Integer, nullable=False)
+    end_seconds = Column(Integer, nullable=False)
+    headway_secs = Column(Integer, nullable=False)
+    exact_times = Column(Integer, nullable=True, default=0)
+
+    trip = relationship("Trip", back_populates="frequencies")
+
+    @property
+    def start_time(self):
+        return format_gtfs_time(self.start_seconds)
+
+    @property
+    def end_time(self):
+        return format_gtfs_time(self.end_seconds)
@@ -0,0 +1,26 @@
+# app/models/pattern_models.py
+
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from datetime import datetime
+from app.database import Base
+
+class RouteStopPattern(Base):
+    """
+    Patrón canónico de paradas por (ruta, sentido): las paradas del trip más
+    largo, en orden de stop_sequence. Se recalcula al escribir trips/stop_times
+    (ver app/services/stop_patterns.py).
+    """
+    __tablename__ = "route_stop_patterns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    route_id = Column(String(50), nullable=False)
+    direction_id = Column(Integer, nullable=True)
+    trip_id = Column(String(50), nullable=False)  # Trip del que se tomó el patrón
+    stop_count = Column(Integer, nullable=False)  # Largo del patrón (para elegir entre sentidos)
+    stop_sequence = Column(Integer, nullable=True)
+    stop_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_route_stop_patterns_route_direction", "route_id", "direction_id", "stop_sequence"),
+    )
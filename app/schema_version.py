@@ -0,0 +1,86 @@
+# app/schema_version.py
+
+"""
+Versión del esquema gestionada con Alembic (migrations/).
+
+El arranque solo compara la revisión guardada en alembic_version con la
+revisión head de los scripts: una consulta de una fila en lugar de reflejar
+cada tabla. Las migraciones se aplican con upgrade_schema(), desde
+`python migrate.py` (despliegue) o desde el arranque si AUTO_MIGRATE está activo.
+
+Para convivir con la app en marcha:
+- En PostgreSQL un advisory lock serializa a varios workers/instancias que
+  intenten migrar a la vez; quien llega segundo ya encuentra el esquema en head.
+- lock_timeout acota la espera por locks de tabla: un ALTER que no consigue su
+  lock falla rápido en vez de encolar detrás suyo todas las consultas.
+- Los índices se crean con CREATE INDEX CONCURRENTLY (ver migrations/versions).
+"""
+
+from pathlib import Path
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+from app.database import engine
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+# Clave arbitraria del advisory lock de migraciones (PostgreSQL)
+MIGRATION_LOCK_KEY = 741_852_963
+LOCK_TIMEOUT = "5s"
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(ALEMBIC_INI.parent / "migrations"))
+    if connection is not None:
+        config.attributes["connection"] = connection
+        # El logging lo configura la app, no alembic.ini
+        config.attributes["configure_logger"] = False
+    return config
+
+
+def head_revision() -> Optional[str]:
+    """Revisión head de los scripts de migración."""
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def current_revision(bind=engine) -> Optional[str]:
+    """Revisión guardada en la BD, o None si aún no está bajo Alembic."""
+    with bind.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+def schema_is_current(bind=engine) -> bool:
+    return current_revision(bind) == head_revision()
+
+
+def upgrade_schema(bind=engine, revision: str = "head") -> Optional[str]:
+    """Aplica las migraciones pendientes y devuelve la revisión resultante."""
+    with bind.connect() as conn:
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            # Advisory lock de sesión: sobrevive a los commits de cada migración
+            conn.exec_driver_sql(f"SELECT pg_advisory_lock({MIGRATION_LOCK_KEY})")
+            conn.exec_driver_sql(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+            conn.commit()
+        try:
+            before = MigrationContext.configure(conn).get_current_revision()
+            # Sin transacción abierta: Alembic debe controlarla para los bloques autocommit
+            conn.commit()
+            command.upgrade(alembic_config(conn), revision)
+            conn.commit()
+            after = MigrationContext.configure(conn).get_current_revision()
+        finally:
+            if is_postgres:
+                conn.rollback()
+                conn.exec_driver_sql("RESET lock_timeout")
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_KEY})")
+                conn.commit()
+
+    if before != after:
+        print(f"✅ Esquema migrado: {before or 'sin versión'} -> {after}")
+    return after
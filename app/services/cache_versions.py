@@ -0,0 +1,95 @@
+# app/services/cache_versions.py
+
+"""
+Versión compartida de los cachés en memoria.
+
+Cada worker de uvicorn tiene su propia copia del índice de calendario, del
+tablero de salidas y del índice espacial; invalidar en el worker que atendió
+la escritura no basta. Cada caché tiene una fila en cache_versions:
+
+- la escritura (tras su commit) incrementa la versión con bump()
+- al consultar, el caché compara la versión con la que se construyó y se
+  reconstruye si cambió
+
+La versión se lee antes que los datos: un caché construido mientras otro
+worker escribía queda con la versión anterior y se reconstruye en la
+siguiente comprobación, nunca al revés. Para no sumar una consulta a cada
+petición, la versión leída se reutiliza CACHE_VERSION_CHECK_SECONDS.
+"""
+
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.models.cache_models import CacheVersion
+
+CALENDAR_CACHE = "calendar"
+DEPARTURES_CACHE = "departures"
+SPATIAL_CACHE = "spatial"
+
+
+class SharedCacheVersion:
+    """Versión de un caché guardada en la BD (fila de cache_versions)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._value: Optional[int] = None
+        self._checked_at = 0.0
+
+    def _query(self):
+        return select(CacheVersion.version).where(CacheVersion.name == self.name)
+
+    def _recent(self) -> Optional[int]:
+        if self._value is not None and time.monotonic() - self._checked_at < settings.CACHE_VERSION_CHECK_SECONDS:
+            return self._value
+        return None
+
+    def _remember(self, value) -> int:
+        value = int(value or 0)
+        self._value, self._checked_at = value, time.monotonic()
+        return value
+
+    def current(self, db) -> int:
+        """Versión vigente (sesión síncrona)."""
+        recent = self._recent()
+        if recent is not None:
+            return recent
+        return self._remember(db.execute(self._query()).scalar())
+
+    async def current_async(self, db) -> int:
+        """Versión vigente (sesión async de lectura)."""
+        recent = self._recent()
+        if recent is not None:
+            return recent
+        return self._remember((await db.execute(self._query())).scalar())
+
+    def bump(self) -> Optional[int]:
+        """
+        Incrementa la versión en su propia transacción (llamar tras el commit de
+        la escritura) y devuelve la nueva. Si falla solo se avisa: la escritura
+        ya está hecha y este worker ya invalidó su copia.
+        """
+        from app.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(CacheVersion)
+                .where(CacheVersion.name == self.name)
+                .values(version=CacheVersion.version + 1, updated_at=datetime.now())
+            )
+            version = db.execute(self._query()).scalar()
+            if version is None:
+                db.add(CacheVersion(name=self.name, version=1, updated_at=datetime.now()))
+                version = 1
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ No se pudo publicar la versión del caché '{self.name}': {e}")
+            return None
+        finally:
+            db.close()
+        return self._remember(version)
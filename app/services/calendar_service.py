@@ -0,0 +1,196 @@
+# app/services/calendar_service.py
+
+"""
+Resolución de calendarios GTFS: ¿qué service_id operan en la fecha D?
+
+Calendar + CalendarDate se expanden una vez a un bitset por servicio
+(un bit por día desde la fecha base), de modo que consultar un servicio en
+una fecha es O(1). El índice se cachea en memoria de cada worker y se
+invalida al escribir calendar / calendar_dates (importación GTFS, admin); los
+demás workers lo reconstruyen al cambiar la versión compartida (cache_versions).
+"""
+
+import asyncio
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.models.gtfs_models import Calendar, CalendarDate
+from app.services.cache_versions import CALENDAR_CACHE, SharedCacheVersion
+
+WEEKDAY_FIELDS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+WEEKDAY_LABELS = ("Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom")
+
+EXCEPTION_ADDED = 1
+EXCEPTION_REMOVED = 2
+
+
+def parse_service_date(value: str) -> date:
+    """Acepta 'YYYY-MM-DD' o 'YYYYMMDD' (formato GTFS)."""
+    value = str(value).strip()
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida '{value}' (use YYYY-MM-DD o YYYYMMDD)")
+
+
+class ServiceCalendarIndex:
+    """Índice inmutable servicio → bitset de días activos."""
+
+    def __init__(self, calendars: Iterable, calendar_dates: Iterable):
+        calendars = list(calendars)
+        calendar_dates = list(calendar_dates)
+
+        known_dates = [c.start_date for c in calendars if c.start_date] + [cd.date for cd in calendar_dates if cd.date]
+        self.base_date: Optional[date] = min(known_dates) if known_dates else None
+
+        self.weekdays: Dict[str, Tuple[bool, ...]] = {}
+        # Servicios sin start/end: solo aplican los días de la semana
+        self.unbounded: set = set()
+        self.bits: Dict[str, int] = {}
+
+        for cal in calendars:
+            flags = tuple(bool(getattr(cal, field)) for field in WEEKDAY_FIELDS)
+            self.weekdays[cal.service_id] = flags
+            if not cal.start_date or not cal.end_date:
+                self.unbounded.add(cal.service_id)
+                self.bits[cal.service_id] = 0
+                continue
+            self.bits[cal.service_id] = self._expand_range(cal.start_date, cal.end_date, flags)
+
+        # Excepciones: las que quitan servicio se guardan aparte para los servicios sin rango
+        self.removed: Dict[str, set] = {}
+        for cd in calendar_dates:
+            if not cd.date:
+                continue
+            mask = 1 << self._offset(cd.date)
+            current = self.bits.get(cd.service_id, 0)
+            if cd.exception_type == EXCEPTION_REMOVED:
+                self.bits[cd.service_id] = current & ~mask
+                self.removed.setdefault(cd.service_id, set()).add(cd.date)
+            else:
+                self.bits[cd.service_id] = current | mask
+
+        self._by_date: Dict[date, FrozenSet[str]] = {}
+
+    def _offset(self, day: date) -> int:
+        return (day - self.base_date).days
+
+    def _expand_range(self, start: date, end: date, flags: Tuple[bool, ...]) -> int:
+        """Bitset de los días entre start y end (inclusive) cuyo día de la semana está activo."""
+        if end < start or not any(flags):
+            return 0
+        # Patrón semanal a partir de start, replicado por semanas completas
+        week = 0
+        for i in range(7):
+            if flags[(start.weekday() + i) % 7]:
+                week |= 1 << i
+        total_days = (end - start).days + 1
+        weeks = (total_days + 6) // 7
+        pattern = 0
+        for w in range(weeks):
+            pattern |= week << (7 * w)
+        pattern &= (1 << total_days) - 1
+        return pattern << self._offset(start)
+
+    def is_active(self, service_id: str, day: date) -> bool:
+        if service_id in self.unbounded:
+            if day in self.removed.get(service_id, ()):
+                return False
+            if self.weekdays[service_id][day.weekday()]:
+                return True
+        bits = self.bits.get(service_id)
+        if not bits or self.base_date is None:
+            return False
+        offset = self._offset(day)
+        return offset >= 0 and bool((bits >> offset) & 1)
+
+    def services_on(self, day: date) -> FrozenSet[str]:
+        """service_ids que operan en la fecha (memorizado por fecha)."""
+        cached = self._by_date.get(day)
+        if cached is None:
+            cached = frozenset(sid for sid in self.bits if self.is_active(sid, day))
+            self._by_date[day] = cached
+        return cached
+
+    def active_dates(self, service_id: str) -> List[date]:
+        """Fechas activas de un servicio con rango definido (para depuración / exportación)."""
+        bits = self.bits.get(service_id, 0)
+        result = []
+        offset = 0
+        while bits:
+            if bits & 1:
+                result.append(self.base_date + timedelta(days=offset))
+            bits >>= 1
+            offset += 1
+        return result
+
+    def describe_days(self, service_id: str) -> str:
+        flags = self.weekdays.get(service_id)
+        if flags is None:
+            return "Sin calendario"
+        days = [label for label, active in zip(WEEKDAY_LABELS, flags) if active]
+        return ", ".join(days) if days else "Sin días"
+
+
+# --- Caché del índice ---
+
+# (versión compartida con la que se construyó, índice)
+_index: Optional[Tuple[int, ServiceCalendarIndex]] = None
+# Se incrementa en cada invalidación: un índice construido antes no se publica
+_generation = 0
+_index_lock = threading.Lock()
+_async_lock: Optional[asyncio.Lock] = None
+_shared_version = SharedCacheVersion(CALENDAR_CACHE)
+
+
+def invalidate_calendar_cache() -> None:
+    """Llamar tras el commit que escribe calendar / calendar_dates (avisa también a los demás workers)."""
+    global _index, _generation
+    with _index_lock:
+        _index = None
+        _generation += 1
+    _shared_version.bump()
+
+
+def get_calendar_index(db) -> ServiceCalendarIndex:
+    """Índice cacheado usando una sesión síncrona."""
+    global _index
+    version = _shared_version.current(db)
+    with _index_lock:
+        if _index is None or _index[0] != version:
+            calendars = db.execute(select(Calendar)).scalars().all()
+            calendar_dates = db.execute(select(CalendarDate)).scalars().all()
+            _index = (version, ServiceCalendarIndex(calendars, calendar_dates))
+            print(f"📅 Índice de calendario construido ({len(_index[1].bits)} servicios)")
+        return _index[1]
+
+
+async def get_calendar_index_async(db) -> ServiceCalendarIndex:
+    """Índice cacheado usando la sesión async de lectura."""
+    global _index, _async_lock
+    version = await _shared_version.current_async(db)
+    cached = _index
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    if _async_lock is None:
+        _async_lock = asyncio.Lock()
+    async with _async_lock:
+        cached = _index
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        generation = _generation
+        calendars = (await db.execute(select(Calendar))).scalars().all()
+        calendar_dates = (await db.execute(select(CalendarDate))).scalars().all()
+        index = ServiceCalendarIndex(calendars, calendar_dates)
+        with _index_lock:
+            # Si hubo una invalidación durante las consultas el índice puede
+            # estar desactualizado: se usa para esta petición pero no se cachea
+            if _generation == generation:
+                _index = (version, index)
+        print(f"📅 Índice de calendario construido ({len(index.bits)} servicios)")
+        return index
@@ -4,13 +4,35 @@ Procesa archivos CSV y XLSX con información de paradas (stops)
 y los inserta o actualiza en la base de datos.
 """
 
-import csv
+import codecs
 import io
 from typing import Dict, Union, Tuple, List
+import pandas as pd
+from sqlalchemy import insert, select, update
 from sqlalchemy.orm import Session
 from app.models.gtfs_models import Stop
+from app.services.feed_snapshot import invalidate_feed_snapshot
+from app.services.spatial_index import invalidate_spatial_index
 import openpyxl
 
+REQUIRED_STOP_COLUMNS = {"stop_id", "stop_name", "stop_lat", "stop_lon", "wheelchair_boarding"}
+# Parámetros por sentencia: por debajo del límite de SQLite antiguo (999)
+ID_CHUNK_SIZE = 900
+
+
+def detect_encoding(content: bytes) -> str:
+    """
+    Codificación del archivo en una sola pasada: BOM UTF-8, UTF-8 válido o latin-1
+    (que acepta cualquier byte, igual que el orden de prueba anterior).
+    """
+    if content.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(content, final=True)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
 
 class FileProcessor:
     """Procesador de archivos CSV y XLSX para paradas (stops)"""
@@ -36,77 +58,46 @@ class FileProcessor:
         else:
             raise ValueError(f"Extensión de archivo no soportada: {filename}")
 
-    def read_csv_content(self, csv_content: bytes) -> Tuple[List[Dict], List[str]]:
+    def read_csv_frame(self, csv_content: bytes) -> pd.DataFrame:
         """
-        Lee contenido CSV con soporte para UTF-8.
-        
-        Args:
-            csv_content: Contenido del archivo CSV como bytes
-            
-        Returns:
-            Tupla con (lista de diccionarios con las filas, lista de nombres de campos)
+        Lee contenido CSV a un DataFrame de texto (todas las columnas como str).
+        El índice es el número de línea del archivo (encabezado = 1).
         """
         try:
-            # Intentar decodificar con diferentes encodings
-            csv_text = None
-            encodings = ['utf-8-sig', 'utf-8', 'latin-1', 'cp1252']
-            
-            for encoding in encodings:
-                try:
-                    csv_text = csv_content.decode(encoding)
-                    break
-                except (UnicodeDecodeError, AttributeError):
-                    continue
-            
-            if csv_text is None:
-                raise ValueError("No se pudo decodificar el archivo CSV con ninguna codificación conocida")
-            
-            # Leer el CSV
-            reader = csv.DictReader(io.StringIO(csv_text))
-            rows = list(reader)
-            fieldnames = list(reader.fieldnames) if reader.fieldnames else []
-            
-            return rows, fieldnames
-            
+            encoding = detect_encoding(csv_content)
+            frame = pd.read_csv(
+                io.BytesIO(csv_content), encoding=encoding, dtype=str,
+                keep_default_na=False, skip_blank_lines=False
+            ).fillna("")
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
         except Exception as e:
             raise ValueError(f"Error al leer CSV: {str(e)}")
 
-    def read_xlsx_content(self, xlsx_content: bytes) -> Tuple[List[Dict], List[str]]:
+        frame.columns = [str(c).strip() for c in frame.columns]
+        frame.index = frame.index + 2
+        # Saltar líneas vacías (conservando la numeración original)
+        return frame[(frame != "").any(axis=1)]
+
+    def read_xlsx_frame(self, xlsx_content: bytes) -> pd.DataFrame:
         """
-        Lee contenido XLSX.
-        
-        Args:
-            xlsx_content: Contenido del archivo XLSX como bytes
-            
-        Returns:
-            Tupla con (lista de diccionarios con las filas, lista de nombres de campos)
+        Lee la hoja activa de un XLSX en modo read-only (streaming por filas) a un
+        DataFrame de texto. El índice es el número de fila de la hoja.
         """
         workbook = None
         try:
-            # Cargar el workbook desde bytes
             workbook = openpyxl.load_workbook(io.BytesIO(xlsx_content), read_only=True, data_only=True)
             sheet = workbook.active
             
             if sheet is None:
                 raise ValueError("El archivo XLSX no contiene hojas válidas")
             
-            # Convertir el generador a lista para poder iterar múltiples veces
-            all_rows = list(sheet.iter_rows(values_only=True))
-            
-            if not all_rows:
+            rows = sheet.iter_rows(values_only=True)
+            header_row = next(rows, None)
+            if header_row is None:
                 raise ValueError("El archivo XLSX está vacío")
             
-            # Obtener encabezados (primera fila)
-            header_row = all_rows[0]
-            headers = []
-            for cell_value in header_row:
-                if cell_value is not None:
-                    # Convertir a string y limpiar espacios
-                    header = str(cell_value).strip()
-                    headers.append(header)
-                else:
-                    headers.append("")
-            
+            headers = [str(value).strip() if value is not None else "" for value in header_row]
             # Filtrar encabezados vacíos al final
             while headers and not headers[-1]:
                 headers.pop()
@@ -115,34 +106,23 @@ class FileProcessor:
                 raise ValueError("El archivo XLSX no contiene encabezados válidos en la primera fila")
             
             print(f"DEBUG - Encabezados encontrados: {headers}")
-            print(f"DEBUG - Número de columnas: {len(headers)}")
-            
-            # Leer todas las filas de datos (desde la segunda fila)
-            rows = []
-            for row_idx, row_values in enumerate(all_rows[1:], start=2):
-                # Saltar filas completamente vacías
-                if not row_values or all(cell is None or str(cell).strip() == "" for cell in row_values):
-                    continue
-                
-                row_dict = {}
-                for col_idx, value in enumerate(row_values):
-                    if col_idx < len(headers) and headers[col_idx]:
-                        # Convertir el valor a string y limpiar
-                        if value is not None:
-                            row_dict[headers[col_idx]] = str(value).strip()
-                        else:
-                            row_dict[headers[col_idx]] = ""
-                
-                if row_dict:  # Solo agregar si tiene datos
-                    rows.append(row_dict)
-                    
-                    # DEBUG: Imprimir primera fila de datos
-                    if row_idx == 2:
-                        print(f"DEBUG - Primera fila de datos: {row_dict}")
             
-            print(f"DEBUG - Total de filas leídas: {len(rows)}")
+            width = len(headers)
+            # dtype=object: las celdas quedan tal cual (sin NaN ni enteros convertidos a float)
+            frame = pd.DataFrame(
+                [tuple(row[:width]) + (None,) * (width - len(row)) for row in rows],
+                columns=range(width), dtype=object
+            )
+            frame.index = frame.index + 2
+            # Solo columnas con encabezado; valores como texto sin espacios (celda vacía = "")
+            frame = frame[[i for i, h in enumerate(headers) if h]]
+            frame.columns = [h for h in headers if h]
+            frame = frame.where(frame.notna(), "")
+            frame = frame.apply(lambda col: col.map(str).str.strip())
+            frame = frame[(frame != "").any(axis=1)]
             
-            return rows, headers
+            print(f"DEBUG - Total de filas leídas: {len(frame)}")
+            return frame
             
         except Exception as e:
             raise ValueError(f"Error al leer archivo XLSX: {str(e)}")
@@ -150,6 +130,67 @@ class FileProcessor:
             if workbook:
                 workbook.close()
 
+    def read_csv_content(self, csv_content: bytes) -> Tuple[List[Dict], List[str]]:
+        """Compatibilidad: filas como diccionarios + nombres de campos."""
+        frame = self.read_csv_frame(csv_content)
+        return frame.to_dict('records'), list(frame.columns)
+
+    def read_xlsx_content(self, xlsx_content: bytes) -> Tuple[List[Dict], List[str]]:
+        """Compatibilidad: filas como diccionarios + nombres de campos."""
+        frame = self.read_xlsx_frame(xlsx_content)
+        return frame.to_dict('records'), list(frame.columns)
+
+    def validate_stops_frame(self, frame: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], int]:
+        """
+        Valida en bloque ids, coordenadas y accesibilidad.
+
+        Devuelve (paradas válidas normalizadas, errores por fila, omitidas sin error).
+        Las filas sin stop_id y los stop_id repetidos en el archivo se omiten (gana la primera).
+        """
+        data = frame[list(REQUIRED_STOP_COLUMNS)].apply(lambda col: col.astype(str).str.strip())
+        has_id = data["stop_id"] != ""
+        duplicated = has_id & data["stop_id"].duplicated(keep="first")
+        skipped = int((~has_id).sum() + duplicated.sum())
+        data = data[has_id & ~duplicated]
+
+        stop_id = pd.to_numeric(data["stop_id"], errors="coerce")
+        lat = pd.to_numeric(data["stop_lat"], errors="coerce")
+        lon = pd.to_numeric(data["stop_lon"], errors="coerce")
+        wheelchair = pd.to_numeric(data["wheelchair_boarding"].mask(data["wheelchair_boarding"] == ""), errors="coerce")
+
+        checks = [
+            (stop_id.isna() | (stop_id % 1 != 0), "stop_id '{stop_id}' no es un entero"),
+            (lat.isna() | (lat < -90) | (lat > 90), "stop_lat '{stop_lat}' inválida (debe estar entre -90 y 90)"),
+            (lon.isna() | (lon < -180) | (lon > 180), "stop_lon '{stop_lon}' inválida (debe estar entre -180 y 180)"),
+            ((data["wheelchair_boarding"] != "") & ~wheelchair.isin([0, 1, 2]),
+             "wheelchair_boarding '{wheelchair_boarding}' inválido (0, 1 o 2)"),
+        ]
+        invalid = pd.Series(False, index=data.index)
+        row_errors = []
+        for mask, template in checks:
+            # Un solo error por fila (el primero que falla)
+            for row_num, row in data[mask & ~invalid].iterrows():
+                row_errors.append((row_num, f"Error en fila {row_num}: " + template.format(**row)))
+            invalid |= mask
+        errors = [msg for _, msg in sorted(row_errors, key=lambda item: item[0])]
+
+        valid = ~invalid
+        stops = pd.DataFrame({
+            "stop_id": stop_id[valid].astype("int64"),
+            "stop_name": data.loc[valid, "stop_name"],
+            "stop_lat": lat[valid],
+            "stop_lon": lon[valid],
+            "wheelchair_boarding": wheelchair[valid].astype("Int64"),
+        })
+        return stops, errors, skipped
+
+    def _existing_stop_ids(self, stop_ids: List[int]) -> set:
+        existing = set()
+        for i in range(0, len(stop_ids), ID_CHUNK_SIZE):
+            chunk = stop_ids[i:i + ID_CHUNK_SIZE]
+            existing.update(self.db.execute(select(Stop.stop_id).where(Stop.stop_id.in_(chunk))).scalars().all())
+        return existing
+
     def import_file_to_stops(
         self, 
         file_content: bytes, 
@@ -182,9 +223,10 @@ class FileProcessor:
             
             # Leer contenido según el tipo
             if file_type == 'xlsx':
-                rows, fieldnames = self.read_xlsx_content(file_content)
+                frame = self.read_xlsx_frame(file_content)
             else:  # csv
-                rows, fieldnames = self.read_csv_content(file_content)
+                frame = self.read_csv_frame(file_content)
+            fieldnames = list(frame.columns)
             
             # Validar que se pudieron leer datos
             if not fieldnames:
@@ -193,81 +235,51 @@ class FileProcessor:
                     "error": "No se pudieron leer los encabezados del archivo"
                 }
             
-            if not rows:
+            if frame.empty:
                 return {
                     "success": False,
                     "error": "El archivo no contiene datos (solo encabezados)"
                 }
             
             # Validar columnas requeridas
-            required = {"stop_id", "stop_name", "stop_lat", "stop_lon", "wheelchair_boarding"}
             fieldnames_set = set(fieldnames)
             
-            if not required.issubset(fieldnames_set):
-                missing = required - fieldnames_set
+            if not REQUIRED_STOP_COLUMNS.issubset(fieldnames_set):
+                missing = REQUIRED_STOP_COLUMNS - fieldnames_set
                 return {
                     "success": False,
                     "error": f"El archivo no contiene las columnas requeridas. Faltan: {', '.join(missing)}. "
                            f"Columnas encontradas: {', '.join(fieldnames)}"
                 }
 
-            inserted = 0
-            updated = 0
-            skipped = 0
-            errors = []
-            processed_ids = set()
-
-            for row_num, row in enumerate(rows, start=2):
-                try:
-                    stop_id = str(row.get("stop_id", "")).strip()
-                    stop_name = str(row.get("stop_name", "")).strip()
-                    stop_lat = row.get("stop_lat", "").strip() if row.get("stop_lat") else ""
-                    stop_lon = row.get("stop_lon", "").strip() if row.get("stop_lon") else ""
-                    wheelchair_boarding = row.get("wheelchair_boarding", "").strip() if row.get("wheelchair_boarding") else ""
-
-                    # Validar que stop_id no esté vacío
-                    if not stop_id:
-                        skipped += 1
-                        continue
-                    
-                    # Evitar duplicados en el mismo archivo
-                    if stop_id in processed_ids:
-                        skipped += 1
-                        continue
-
-                    processed_ids.add(stop_id)
+            stops, errors, skipped = self.validate_stops_frame(frame)
+            skipped += len(errors)
+            for error_msg in errors[:10]:
+                print(error_msg)
 
-                    # Buscar si existe la parada
-                    existing_stop = self.db.query(Stop).filter(Stop.stop_id == stop_id).first()
+            # Upsert en bloque: un SELECT por lote de ids, un INSERT y un UPDATE masivos
+            records = [
+                {key: (None if pd.isna(value) else value) for key, value in record.items()}
+                for record in stops.astype(object).to_dict('records')
+            ]
+            existing_ids = self._existing_stop_ids(stops["stop_id"].tolist())
+            new_rows = [r for r in records if r["stop_id"] not in existing_ids]
+            existing_rows = [r for r in records if r["stop_id"] in existing_ids]
 
-                    if existing_stop:
-                        if replace_existing:
-                            existing_stop.stop_name = stop_name
-                            existing_stop.stop_lat = stop_lat
-                            existing_stop.stop_lon = stop_lon
-                            existing_stop.wheelchair_boarding = wheelchair_boarding
-                            updated += 1
-                        else:
-                            skipped += 1
-                    else:
-                        new_stop = Stop(
-                            stop_id=stop_id,
-                            stop_name=stop_name,
-                            stop_lat=stop_lat,
-                            stop_lon=stop_lon,
-                            wheelchair_boarding=wheelchair_boarding
-                        )
-                        self.db.add(new_stop)
-                        inserted += 1
-                        
-                except Exception as row_error:
-                    error_msg = f"Error en fila {row_num}: {str(row_error)}"
-                    print(error_msg)
-                    errors.append(error_msg)
-                    skipped += 1
-                    continue
+            if new_rows:
+                self.db.execute(insert(Stop), new_rows)
+            if replace_existing:
+                if existing_rows:
+                    self.db.execute(update(Stop), existing_rows)
+                updated = len(existing_rows)
+            else:
+                updated = 0
+                skipped += len(existing_rows)
+            inserted = len(new_rows)
 
             self.db.commit()
+            invalidate_feed_snapshot()
+            invalidate_spatial_index()
 
             result = {
                 "success": True,
@@ -280,6 +292,7 @@ class FileProcessor:
             
             if errors:
                 result["warnings"] = errors[:10]  # Solo primeros 10 errores
+                result["rows_with_errors"] = len(errors)
             
             return result
 
@@ -0,0 +1,240 @@
+# app/services/departure_board.py
+
+"""
+Índice de salidas por parada para pantallas de información al pasajero.
+
+Por cada parada se guarda en memoria un arreglo ordenado de salidas
+(segundos, trip_id, route_id, headsign, service_id), construido de forma
+perezosa desde la BD la primera vez que se consulta. "Próximas N salidas
+después de T" es un bisect + recorrido filtrando por los servicios activos
+en la fecha. Las escrituras invalidan solo las paradas afectadas en el worker
+que las atiende; los demás workers descartan su índice completo al cambiar la
+versión compartida (cache_versions).
+
+Los trips plantilla de frequencies se expanden aquí a una salida por periodo
+(start + k * headway + tiempo de la parada relativo a la salida del trip).
+"""
+
+import threading
+from bisect import bisect_left
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from sqlalchemy import func, select
+
+from app.models.gtfs_models import Frequency, StopTime, Trip
+from app.services.cache_versions import DEPARTURES_CACHE, SharedCacheVersion
+from app.services.frequencies import expand_departures, template_first_departures
+from app.utils.gtfs_time import SECONDS_PER_DAY, format_gtfs_time
+
+
+class Departure(NamedTuple):
+    seconds: int
+    trip_id: str
+    route_id: str
+    headsign: Optional[str]
+    service_id: str
+
+
+class StopDepartures:
+    """Salidas de una parada ordenadas por hora (arreglo paralelo de segundos para bisect)."""
+
+    __slots__ = ("times", "departures", "route_ids")
+
+    def __init__(self, departures: List[Departure]):
+        self.departures = departures
+        self.times = [d.seconds for d in departures]
+        self.route_ids = {d.route_id for d in departures}
+
+    def scan(self, after_seconds: int, active_services, route_id: Optional[str] = None):
+        """Recorre en orden las salidas >= after_seconds de los servicios activos."""
+        for i in range(bisect_left(self.times, after_seconds), len(self.departures)):
+            departure = self.departures[i]
+            if departure.service_id in active_services and (route_id is None or departure.route_id == route_id):
+                yield departure
+
+
+def departures_query(stop_id: int):
+    seconds = func.coalesce(StopTime.departure_seconds, StopTime.arrival_seconds)
+    return (
+        select(seconds.label("seconds"), StopTime.trip_id, Trip.route_id, Trip.trip_headsign, Trip.service_id)
+        .join(Trip, Trip.trip_id == StopTime.trip_id)
+        .where(
+            StopTime.stop_id == stop_id,
+            seconds.isnot(None),
+            StopTime.trip_id.notin_(select(Frequency.trip_id)),
+        )
+        .order_by(seconds)
+    )
+
+
+def frequency_departures_query(stop_id: int):
+    """Trips plantilla que pasan por la parada: (offset, start, end, headway, trip_id, route_id, headsign, service_id)."""
+    seconds = func.coalesce(StopTime.departure_seconds, StopTime.arrival_seconds)
+    first_departure = template_first_departures()
+    return (
+        select(
+            (seconds - first_departure.c.first_seconds).label("offset"),
+            Frequency.start_seconds, Frequency.end_seconds, Frequency.headway_secs,
+            StopTime.trip_id, Trip.route_id, Trip.trip_headsign, Trip.service_id,
+        )
+        .join(Trip, Trip.trip_id == StopTime.trip_id)
+        .join(Frequency, Frequency.trip_id == StopTime.trip_id)
+        .join(first_departure, first_departure.c.trip_id == StopTime.trip_id)
+        .where(StopTime.stop_id == stop_id, seconds.isnot(None))
+    )
+
+
+def stops_of_routes_query(route_ids: Iterable[str]):
+    return (
+        select(StopTime.stop_id)
+        .join(Trip, Trip.trip_id == StopTime.trip_id)
+        .where(Trip.route_id.in_(list(route_ids)))
+        .distinct()
+    )
+
+
+class DepartureIndex:
+    def __init__(self):
+        self._stops: Dict[int, StopDepartures] = {}
+        self._lock = threading.Lock()
+        # Versión compartida con la que se construyeron las entradas de _stops
+        self._version: Optional[int] = None
+        self._shared_version = SharedCacheVersion(DEPARTURES_CACHE)
+
+    # --- Construcción perezosa ---
+
+    def _sync_version(self, version: int) -> None:
+        """Otro worker escribió: se descarta todo lo construido con la versión anterior."""
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._stops.clear()
+                    self._version = version
+
+    def _store(self, stop_id: int, version: int, rows, frequency_rows=()) -> StopDepartures:
+        departures = [Departure(*row) for row in rows]
+        if frequency_rows:
+            departures.extend(Departure(*row) for row in expand_departures(frequency_rows))
+            departures.sort(key=lambda d: d.seconds)
+        entry = StopDepartures(departures)
+        with self._lock:
+            # Si la versión cambió mientras se consultaba, la entrada sirve a esta petición pero no se cachea
+            if self._version == version:
+                self._stops[stop_id] = entry
+        return entry
+
+    async def get_stop_async(self, db, stop_id: int) -> StopDepartures:
+        version = await self._shared_version.current_async(db)
+        self._sync_version(version)
+        entry = self._stops.get(stop_id)
+        if entry is None:
+            rows = (await db.execute(departures_query(stop_id))).all()
+            frequency_rows = (await db.execute(frequency_departures_query(stop_id))).all()
+            entry = self._store(stop_id, version, rows, frequency_rows)
+        return entry
+
+    def get_stop(self, db, stop_id: int) -> StopDepartures:
+        version = self._shared_version.current(db)
+        self._sync_version(version)
+        entry = self._stops.get(stop_id)
+        if entry is None:
+            entry = self._store(
+                stop_id,
+                version,
+                db.execute(departures_query(stop_id)).all(),
+                db.execute(frequency_departures_query(stop_id)).all(),
+            )
+        return entry
+
+    # --- Consultas ---
+
+    @staticmethod
+    def next_departures(
+        entry: StopDepartures,
+        service_day: date,
+        after_seconds: int,
+        calendar_index,
+        limit: int = 10,
+        route_id: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Próximas salidas tras after_seconds en service_day. Incluye los viajes del
+        día de servicio anterior que pasan de medianoche (tiempos >= 24:00:00).
+        """
+        today = calendar_index.services_on(service_day)
+        yesterday = calendar_index.services_on(service_day - timedelta(days=1))
+
+        results = []
+        current = entry.scan(after_seconds, today, route_id)
+        overnight = entry.scan(after_seconds + SECONDS_PER_DAY, yesterday, route_id)
+        next_current = next(current, None)
+        next_overnight = next(overnight, None)
+
+        while len(results) < limit and (next_current or next_overnight):
+            overnight_seconds = next_overnight.seconds - SECONDS_PER_DAY if next_overnight else None
+            if next_current and (overnight_seconds is None or next_current.seconds <= overnight_seconds):
+                departure, effective, day = next_current, next_current.seconds, service_day
+                next_current = next(current, None)
+            else:
+                departure, effective, day = next_overnight, overnight_seconds, service_day - timedelta(days=1)
+                next_overnight = next(overnight, None)
+            results.append({
+                "departure_time": format_gtfs_time(effective % SECONDS_PER_DAY),
+                "departure_seconds": effective,
+                "trip_id": departure.trip_id,
+                "route_id": departure.route_id,
+                "trip_headsign": departure.headsign,
+                "service_id": departure.service_id,
+                "service_date": day.isoformat(),
+            })
+        return results
+
+    # --- Invalidación incremental ---
+
+    def _publish(self) -> None:
+        """
+        Avisa a los demás workers. Si nadie más escribió desde la última versión
+        vista, este worker la adopta y conserva las paradas no afectadas.
+        """
+        previous = self._version
+        version = self._shared_version.bump()
+        if version is not None and previous is not None and version == previous + 1:
+            with self._lock:
+                if self._version == previous:
+                    self._version = version
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self._stops.clear()
+        self._publish()
+
+    def _drop(self, stop_ids: Iterable[int]) -> None:
+        with self._lock:
+            for stop_id in stop_ids:
+                self._stops.pop(stop_id, None)
+
+    def invalidate_stops(self, stop_ids: Iterable[int]) -> None:
+        stop_ids = set(stop_ids)
+        if stop_ids:
+            self._drop(stop_ids)
+            self._publish()
+
+    def invalidate_routes(self, db, route_ids: Iterable[str]) -> None:
+        """
+        Descarta las paradas con salidas de esas rutas: las que ya estaban en el
+        índice (datos previos) y las que la BD tiene ahora (datos nuevos).
+        """
+        route_ids = {str(r) for r in route_ids if r is not None}
+        if not route_ids:
+            return
+        with self._lock:
+            cached: Set[int] = {sid for sid, entry in self._stops.items() if entry.route_ids & route_ids}
+        # Aunque este worker no tenga nada que descartar, los demás sí deben enterarse
+        if self._stops:
+            current = set(db.execute(stops_of_routes_query(route_ids)).scalars().all())
+            self._drop(cached | current)
+        self._publish()
+
+
+departure_index = DepartureIndex()
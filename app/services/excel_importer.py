@@ -1,15 +1,28 @@
 # app/services/excel_importer.py
 
+import numpy as np
 import pandas as pd
-import openpyxl
-import io
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
-from datetime import time, timedelta
 import traceback
 
 from app.models.gtfs_models import Trip, StopTime, Stop, Shape
 from app.services.kml_processor import KMLProcessor
+from app.services.stop_patterns import refresh_stop_patterns
+from app.services.departure_board import departure_index
+from app.services.feed_snapshot import refresh_feed_snapshot
+from app.services.spatial_index import nearest_point_index
+from app.utils.xlsx_reader import read_xlsx_columns
+from app.utils.gtfs_time import (
+    format_gtfs_time,
+    parse_gtfs_time,
+    parse_gtfs_time_series,
+    unwrap_midnight_series,
+)
+
+# Parámetros por sentencia IN: por debajo del límite de SQLite antiguo (999)
+ID_CHUNK_SIZE = 900
 
 
 class ExcelImporter:
@@ -35,17 +48,17 @@ class ExcelImporter:
             print(f"📥 IMPORTACIÓN DE TRIPS Y STOP_TIMES DESDE EXCEL")
             print(f"{'='*70}")
 
-            # Leer archivo de trips
-            trips_df = pd.read_excel(io.BytesIO(trips_content), dtype=str)
-            print(f"✅ Trips leídos: {len(trips_df)} registros")
-            print(f"   Columnas encontradas: {list(trips_df.columns)}")
-
             # Validar que TODAS las columnas requeridas estén presentes (sin importar el orden)
             required_trips_cols = [
                 'route_id', 'service_id', 'trip_id', 'trip_headsign', 'direction_id',
                 'block_id', 'shape_id', 'wheelchair_accessible', 'bikes_allowed'
             ]
 
+            # Leer archivo de trips (streaming, solo columnas requeridas)
+            trips_df = read_xlsx_columns(trips_content, required_trips_cols)
+            print(f"✅ Trips leídos: {len(trips_df)} registros")
+            print(f"   Columnas encontradas: {list(trips_df.columns)}")
+
             missing_trips_cols = set(required_trips_cols) - set(trips_df.columns)
             if missing_trips_cols:
                 raise ValueError(f"Faltan columnas REQUERIDAS en archivo de trips: {missing_trips_cols}")
@@ -54,11 +67,6 @@ class ExcelImporter:
             trips_df = trips_df[required_trips_cols]
             print(f"✅ Columnas de trips reordenadas al formato GTFS estándar")
 
-            # Leer archivo de stop_times
-            stoptimes_df = pd.read_excel(io.BytesIO(stoptimes_content), dtype=str)
-            print(f"✅ Stop_times leídos: {len(stoptimes_df)} registros")
-            print(f"   Columnas encontradas: {list(stoptimes_df.columns)}")
-
             # Validar columnas stop_times
             required_stoptimes_cols = [
                 'trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence',
@@ -66,6 +74,11 @@ class ExcelImporter:
                 'continuous_drop_off', 'shape_dist_traveled', 'timepoint'
             ]
 
+            # Leer archivo de stop_times (streaming, solo columnas requeridas)
+            stoptimes_df = read_xlsx_columns(stoptimes_content, required_stoptimes_cols)
+            print(f"✅ Stop_times leídos: {len(stoptimes_df)} registros")
+            print(f"   Columnas encontradas: {list(stoptimes_df.columns)}")
+
             missing_stoptimes_cols = set(required_stoptimes_cols) - set(stoptimes_df.columns)
             if missing_stoptimes_cols:
                 raise ValueError(f"Faltan columnas REQUERIDAS en archivo de stop_times: {missing_stoptimes_cols}")
@@ -105,8 +118,13 @@ class ExcelImporter:
             stop_times_imported = self._import_stop_times(stoptimes_df)
             print(f"✅ Importados {stop_times_imported} stop_times")
 
+            # 6. Recalcular patrones de paradas de las rutas afectadas
+            refresh_stop_patterns(self.db, trips_df['route_id'].dropna().unique())
+
             # Commit
             self.db.commit()
+            departure_index.invalidate_routes(self.db, trips_df['route_id'].dropna().unique())
+            refresh_feed_snapshot(self.db)
 
             print(f"{'='*70}\n")
 
@@ -128,32 +146,36 @@ class ExcelImporter:
             }
 
     def _import_trips(self, df: pd.DataFrame) -> int:
-        """Importa trips desde DataFrame"""
-        count = 0
-
-        for _, row in df.iterrows():
-            try:
-                trip = Trip(
-                    trip_id=str(row.get('trip_id', '')).strip(),
-                    route_id=str(row.get('route_id', '')).strip(),
-                    service_id=str(row.get('service_id', '')).strip(),
-                    trip_headsign=str(row.get('trip_headsign', '')).strip() or None,
-                    direction_id=self._safe_int(row.get('direction_id')),
-                    block_id=str(row.get('block_id', '')).strip() or None,
-                    shape_id=str(row.get('shape_id', '')).strip() or None,
-                    wheelchair_accessible=self._safe_int(row.get('wheelchair_accessible')),
-                    bikes_allowed=self._safe_int(row.get('bikes_allowed'))
-                )
-
-                self.db.add(trip)
-                count += 1
-
-            except Exception as e:
-                print(f"⚠️  Error en trip {row.get('trip_id')}: {e}")
-                continue
-
+        """Importa trips desde DataFrame (un INSERT masivo)"""
+        def text(column, required=False):
+            values = df[column].astype(object).where(df[column].notna(), None)
+            values = values.map(lambda v: str(v).strip() if v is not None else None)
+            return values if required else values.where(values != "", None)
+
+        def integer(column):
+            numbers = pd.to_numeric(df[column], errors='coerce').astype('float64')
+            return np.trunc(numbers).astype('Int64').astype(object).where(numbers.notna(), None)
+
+        trips = pd.DataFrame({
+            'trip_id': text('trip_id', required=True),
+            'route_id': text('route_id', required=True),
+            'service_id': text('service_id', required=True),
+            'trip_headsign': text('trip_headsign'),
+            'direction_id': integer('direction_id'),
+            'block_id': text('block_id'),
+            'shape_id': text('shape_id'),
+            'wheelchair_accessible': integer('wheelchair_accessible'),
+            'bikes_allowed': integer('bikes_allowed'),
+        })
+
+        missing_id = trips['trip_id'].isna() | (trips['trip_id'] == "")
+        if missing_id.any():
+            print(f"⚠️  Omitiendo {int(missing_id.sum())} trips sin trip_id")
+        rows = trips[~missing_id].to_dict('records')
+        if rows:
+            self.db.execute(insert(Trip), rows)
         self.db.flush()
-        return count
+        return len(rows)
 
     def _calculate_shape_distances(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -165,33 +187,47 @@ class ExcelImporter:
         df['stop_id'] = df['stop_id'].astype(str).str.strip()
         df['trip_id'] = df['trip_id'].astype(str).str.strip()
 
-        # Cargar stops con coordenadas
-        stops = self.db.query(Stop).all()
+        # Prefetch: trip -> shape_id, stops y shapes en una consulta cada uno
+        trip_ids = df['trip_id'].unique().tolist()
+        trip_shapes = {}
+        for i in range(0, len(trip_ids), ID_CHUNK_SIZE):
+            chunk = trip_ids[i:i + ID_CHUNK_SIZE]
+            trip_shapes.update(self.db.execute(
+                select(Trip.trip_id, Trip.shape_id).where(Trip.trip_id.in_(chunk))
+            ).all())
+
         stops_dict = {}
-        for stop in stops:
-            sid = str(stop.stop_id).strip()
+        for stop_id, lat, lon in self.db.execute(select(Stop.stop_id, Stop.stop_lat, Stop.stop_lon)):
             try:
-                stops_dict[sid] = (float(stop.stop_lat), float(stop.stop_lon))
-            except:
+                stops_dict[str(stop_id).strip()] = (float(lat), float(lon))
+            except (TypeError, ValueError):
                 continue
 
-        # Cargar shapes (ordenados por shape_id y sequence)
-        shapes = self.db.query(Shape).order_by(Shape.shape_id, Shape.shape_pt_sequence).all()
+        needed_shapes = sorted({str(sid) for sid in trip_shapes.values() if sid})
         shapes_dict = {}
-        for shp in shapes:
-            sid = str(shp.shape_id)
-            if sid not in shapes_dict:
-                shapes_dict[sid] = []
-            shapes_dict[sid].append({
-                'lat': float(shp.shape_pt_lat),
-                'lon': float(shp.shape_pt_lon),
-                'dist': float(shp.shape_dist_traveled or 0.0)
-            })
+        if needed_shapes:
+            shape_rows = self.db.execute(
+                select(Shape.shape_id, Shape.shape_pt_lat, Shape.shape_pt_lon, Shape.shape_dist_traveled)
+                .where(Shape.shape_id.in_(needed_shapes))
+                .order_by(Shape.shape_id, Shape.shape_pt_sequence)
+            )
+            for sid, lat, lon, dist in shape_rows:
+                shapes_dict.setdefault(str(sid), []).append({
+                    'lat': float(lat),
+                    'lon': float(lon),
+                    'dist': float(dist or 0.0)
+                })
 
         # Asegurar orden por distancia
         for sid, pts in shapes_dict.items():
             pts.sort(key=lambda x: x['dist'])
 
+        # Coordenadas por shape como arreglos para la búsqueda vectorizada del vértice más cercano
+        shape_coords = {
+            sid: (np.array([p['lat'] for p in pts]), np.array([p['lon'] for p in pts]))
+            for sid, pts in shapes_dict.items()
+        }
+
         # Procesar por trip (similar a MatchStopsAndShapesForTrip)
         df = df.sort_values(['trip_id', 'stop_sequence']).reset_index(drop=True)
         result_shape_dist = [0.0] * len(df)
@@ -205,14 +241,14 @@ class ExcelImporter:
             if len(indices) == 0:
                 continue
 
-            trip = self.db.query(Trip).filter(Trip.trip_id == trip_id).first()
-            if not trip or not trip.shape_id:
+            shape_id = trip_shapes.get(trip_id)
+            if not shape_id:
                 for idx in indices:
                     result_shape_dist[idx] = 0.0
                 print(f" - Trip {trip_id}: sin shape_id -> asignando 0 a {len(indices)} paradas")
                 continue
 
-            shape_id = str(trip.shape_id)
+            shape_id = str(shape_id)
             if shape_id not in shapes_dict or len(shapes_dict[shape_id]) == 0:
                 for idx in indices:
                     result_shape_dist[idx] = 0.0
@@ -220,6 +256,7 @@ class ExcelImporter:
                 continue
 
             shape_points = shapes_dict[shape_id]
+            shape_lats, shape_lons = shape_coords[shape_id]
             last_matched_idx = 0
             last_matched_dist = float(shape_points[0]['dist']) if len(shape_points) > 0 else 0.0
 
@@ -243,27 +280,14 @@ class ExcelImporter:
                 stop_lat, stop_lon = stops_dict[stop_id]
 
                 # 1) punto globalmente más cercano
-                min_dist = float('inf')
-                min_idx = None
-                for i_p, pt in enumerate(shape_points):
-                    d = self.kml_processor.calculate_distance(stop_lat, stop_lon, pt['lat'], pt['lon'])
-                    if d < min_dist:
-                        min_dist = d
-                        min_idx = i_p
+                min_idx, _ = nearest_point_index(shape_lats, shape_lons, stop_lat, stop_lon)
 
                 # 2) evitar retroceder: si min_idx < last_matched_idx, buscar mejor desde last_matched_idx hacia adelante
                 chosen_idx = min_idx
                 if min_idx is None:
                     chosen_idx = last_matched_idx
                 elif min_idx < last_matched_idx:
-                    min_dist_forward = float('inf')
-                    min_idx_forward = None
-                    for i_p in range(last_matched_idx, len(shape_points)):
-                        pt = shape_points[i_p]
-                        d = self.kml_processor.calculate_distance(stop_lat, stop_lon, pt['lat'], pt['lon'])
-                        if d < min_dist_forward:
-                            min_dist_forward = d
-                            min_idx_forward = i_p
+                    min_idx_forward, _ = nearest_point_index(shape_lats, shape_lons, stop_lat, stop_lon, last_matched_idx)
                     if min_idx_forward is not None:
                         chosen_idx = min_idx_forward
                     else:
@@ -374,7 +398,7 @@ class ExcelImporter:
                     continue
 
                 last_time_stop = prev_stops.iloc[-1]
-                last_time = self._parse_time(last_time_stop['arrival_time'])
+                last_seconds = parse_gtfs_time(last_time_stop['arrival_time'])
                 last_dist = float(last_time_stop['shape_dist_traveled'])
                 last_seq = int(last_time_stop['stop_sequence'])
 
@@ -387,11 +411,11 @@ class ExcelImporter:
                     continue
 
                 next_time_stop = next_stops.iloc[0]
-                next_time = self._parse_time(next_time_stop['arrival_time'])
+                next_seconds = parse_gtfs_time(next_time_stop['arrival_time'])
                 next_dist = float(next_time_stop['shape_dist_traveled'])
                 next_seq = int(next_time_stop['stop_sequence'])
 
-                if not last_time or not next_time:
+                if last_seconds is None or next_seconds is None:
                     continue
 
                 if next_dist <= last_dist:
@@ -401,17 +425,13 @@ class ExcelImporter:
                 delta_dist = next_dist - last_dist
                 proportion = (current_dist - last_dist) / delta_dist
 
-                last_seconds = last_time.hour * 3600 + last_time.minute * 60 + last_time.second
-                next_seconds = next_time.hour * 3600 + next_time.minute * 60 + next_time.second
-
                 if next_seconds < last_seconds:
                     next_seconds += 24 * 3600
 
                 time_diff = next_seconds - last_seconds
                 interpolated_seconds = int(last_seconds + (time_diff * proportion))
 
-                interpolated_time = self._seconds_to_time(interpolated_seconds)
-                time_str = self._format_time(interpolated_time, interpolated_seconds)
+                time_str = format_gtfs_time(interpolated_seconds)
 
                 df.at[idx, 'arrival_time'] = time_str
                 df.at[idx, 'departure_time'] = time_str
@@ -434,92 +454,46 @@ class ExcelImporter:
         return df
 
     def _import_stop_times(self, df: pd.DataFrame) -> int:
-        """Importa stop_times desde DataFrame"""
-        count = 0
-
-        for _, row in df.iterrows():
-            try:
-                arrival_time_str = str(row.get('arrival_time', '')).strip()
-                departure_time_str = str(row.get('departure_time', '')).strip()
-
-                arrival_time = self._parse_time(arrival_time_str) if arrival_time_str and arrival_time_str != 'nan' else None
-                departure_time = self._parse_time(departure_time_str) if departure_time_str and departure_time_str != 'nan' else None
-
-                stop_id_value = self._safe_int(row.get('stop_id'))
-                if stop_id_value is None:
-                    print(f"⚠️  Omitiendo stop_time: stop_id inválido para trip {row.get('trip_id')}")
-                    continue
-
-                stop_sequence_value = self._safe_int(row.get('stop_sequence'))
-                if stop_sequence_value is None:
-                    print(f"⚠️  Omitiendo stop_time: stop_sequence inválido para trip {row.get('trip_id')}")
-                    continue
-
-                stop_time = StopTime(
-                    trip_id=str(row.get('trip_id', '')).strip(),
-                    stop_id=stop_id_value,
-                    stop_sequence=stop_sequence_value,
-                    arrival_time=arrival_time,
-                    departure_time=departure_time,
-                    timepoint=self._safe_int(row.get('timepoint'), 1),
-                    shape_dist_traveled=self._safe_float(row.get('shape_dist_traveled'))
-                )
-
-                self.db.add(stop_time)
-                count += 1
-
-            except Exception as e:
-                print(f"⚠️  Error en stop_time {row.get('trip_id')}-{row.get('stop_id')}: {e}")
-                traceback.print_exc()
-                continue
-
+        """Importa stop_times desde DataFrame (conversión por columnas + un INSERT masivo)"""
+        # Convertir tiempos a segundos una sola vez y corregir cruces de medianoche por trip
+        df = df.assign(_seq=pd.to_numeric(df['stop_sequence'], errors='coerce'))
+        df['trip_id'] = df['trip_id'].astype(str).str.strip()
+        df = df.sort_values(['trip_id', '_seq']).reset_index(drop=True)
+        df['arrival_seconds'] = unwrap_midnight_series(parse_gtfs_time_series(df['arrival_time']), df['trip_id'])
+        df['departure_seconds'] = unwrap_midnight_series(parse_gtfs_time_series(df['departure_time']), df['trip_id'])
+
+        def integer(column, default=None):
+            numbers = np.trunc(pd.to_numeric(df[column], errors='coerce').astype('float64'))
+            return numbers.astype('Int64').astype(object).where(numbers.notna(), default)
+
+        stop_times = pd.DataFrame({
+            'trip_id': df['trip_id'],
+            'stop_id': integer('stop_id'),
+            'stop_sequence': integer('stop_sequence'),
+            'arrival_seconds': integer('arrival_seconds'),
+            'departure_seconds': integer('departure_seconds'),
+            'timepoint': integer('timepoint', 1),
+            'shape_dist_traveled': pd.to_numeric(df['shape_dist_traveled'], errors='coerce').astype(object),
+        })
+        stop_times['shape_dist_traveled'] = stop_times['shape_dist_traveled'].where(
+            stop_times['shape_dist_traveled'].notna(), None
+        )
+
+        for column in ('stop_id', 'stop_sequence'):
+            invalid = stop_times[column].isna()
+            if invalid.any():
+                trips = ", ".join(stop_times.loc[invalid, 'trip_id'].unique()[:10])
+                print(f"⚠️  Omitiendo {int(invalid.sum())} stop_times: {column} inválido (trips: {trips})")
+                stop_times = stop_times[~invalid]
+
+        rows = stop_times.to_dict('records')
+        if rows:
+            self.db.execute(insert(StopTime), rows)
         self.db.flush()
-        return count
+        return len(rows)
 
     # === FUNCIONES AUXILIARES ===
 
-    def _parse_time(self, time_str) -> Optional[time]:
-        """Convierte string de tiempo a objeto time (maneja >24h)"""
-        if not time_str or pd.isna(time_str) or str(time_str).strip() == '':
-            return None
-
-        s = str(time_str).strip()
-        s = s.replace('_', ':')
-        parts = s.split(':')
-
-        if len(parts) < 2:
-            return None
-
-        try:
-            h = int(parts[0])
-            m = int(parts[1])
-            sec = int(parts[2]) if len(parts) > 2 else 0
-
-            h = h % 24
-            return time(h, m, sec)
-        except:
-            return None
-
-    def _format_time(self, t: time, total_seconds: Optional[int] = None) -> str:
-        """Convierte time a string formato HH:MM:SS (maneja >24h si se pasa total_seconds)"""
-        if t is None:
-            return None
-
-        if total_seconds is not None and total_seconds >= 24 * 3600:
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-
-        return f"{t.hour:02d}:{t.minute:02d}:{t.second:02d}"
-
-    def _seconds_to_time(self, total_seconds: int) -> time:
-        """Convierte segundos totales a objeto time (normaliza a <24h para el objeto)"""
-        hours = (total_seconds // 3600) % 24
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        return time(hours, minutes, seconds)
-
     def _safe_int(self, value, default=None):
         """Convierte valor a int de forma segura"""
         if pd.isna(value) or value == '' or str(value).strip() == '':
@@ -1,11 +1,30 @@
 # app/services/excel_processor.py
 
-import xlwings as xw
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import os
+import time
 from datetime import datetime
 import traceback
 
+from app.services.scheduling_engine import compute_schedule, normalize_parameters, to_sheet_rows
+
+try:
+    # Solo disponible en Windows con Excel instalado (motor legado / captura de paridad)
+    import xlwings as xw
+except ImportError:
+    xw = None
+
+
+# Tabla 1 en 'Oferta Comercial': columna C = Centro, columna D = Barrio; fila 5 inicio, fila 6 fin
+CELL_HORA_INICIO_CENTRO = 'C5'
+CELL_HORA_FIN_CENTRO = 'C6'
+CELL_HORA_FIN_BARRIO = 'D6'
+
+
+def _excel_time(minutes: int) -> float:
+    """Minutos -> fracción de día (valor de celda con formato de hora; admite >= 24:00)."""
+    return minutes / 1440
+
 
 class ExcelProcessor:
     """
@@ -23,6 +42,8 @@ class ExcelProcessor:
         
     def __enter__(self):
         """Context manager para abrir Excel"""
+        if xw is None:
+            raise RuntimeError("xlwings no está disponible en este servidor (requiere Excel)")
         try:
             # Abrir Excel (visible=False para que sea más rápido)
             self.app = xw.App(visible=False)
@@ -223,9 +244,46 @@ class ExcelProcessor:
             raise
 
 
-def process_scheduling_parameters(excel_path: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+def process_scheduling_parameters(parameters: Dict[str, Any], excel_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Calcula las tablas 4–7 a partir de los parámetros de programación (tablas 1–3).
+
+    Por defecto usa el motor nativo (scheduling_engine), que evalúa las fórmulas
+    del libro en memoria. Si se indica excel_path se usa el libro con xlwings
+    (solo Windows con Excel; útil para capturar salidas de referencia).
+    
+    Returns:
+        Dict con 'success', tabla4..tabla7 como filas [desde, hasta, valor] y 'timestamp'
+    """
+    if excel_path is not None:
+        return process_scheduling_parameters_excel(excel_path, parameters)
+
+    try:
+        started = time.perf_counter()
+        results = to_sheet_rows(compute_schedule(parameters))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"✅ Tablas 4–7 calculadas en {elapsed_ms:.1f}ms "
+              f"(T4={len(results['tabla4'])}, T5={len(results['tabla5'])}, "
+              f"T6={len(results['tabla6'])}, T7={len(results['tabla7'])})")
+        return {
+            'success': True,
+            **results,
+            'tiempo_procesamiento': f"{elapsed_ms:.1f}ms",
+            'timestamp': datetime.now().isoformat()
+        }
+    except Exception as e:
+        print(f"\n❌ ERROR EN PROCESAMIENTO: {e}")
+        traceback.print_exc()
+        return {
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }
+
+
+def process_scheduling_parameters_excel(excel_path: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Procesa los parámetros de programación:
+    Procesa los parámetros de programación con el libro de Excel (motor legado):
     1. Escribe los parámetros en las celdas del Excel
     2. Recalcula las fórmulas
     3. Extrae los resultados
@@ -247,29 +305,31 @@ def process_scheduling_parameters(excel_path: str, parameters: Dict[str, Any]) -
             # ===== PASO 1: ESCRIBIR PARÁMETROS =====
             print("\n📝 PASO 1: Escribiendo parámetros en Excel...")
             
-            tabla1 = parameters.get('tabla1', {})
-            tabla2 = parameters.get('tabla2', [])
-            tabla3 = parameters.get('tabla3', [])
+            # Mismo contrato que el motor nativo: acepta desde/tiempoCB/tiempoBC y hora/tCicloAB/tCicloBA
+            inputs = normalize_parameters(parameters)
             
-            # Tabla 1: Hora de inicio/fin en Oferta Comercial
-            processor.write_to_cells('Oferta Comercial', {
-                'C5': tabla1.get('horaInicioCentro', ''),
-                'C6': tabla1.get('horaFinCentro', '')
-            })
+            # Tabla 1: Hora de inicio/fin en Oferta Comercial (horaFinBarrio cierra la tabla 7)
+            tabla1_cells = {
+                CELL_HORA_INICIO_CENTRO: _excel_time(inputs.start),
+                CELL_HORA_FIN_CENTRO: _excel_time(inputs.end),
+            }
+            if inputs.end_barrio is not None:
+                tabla1_cells[CELL_HORA_FIN_BARRIO] = _excel_time(inputs.end_barrio)
+            processor.write_to_cells('Oferta Comercial', tabla1_cells)
             
             # Tabla 2: Buses variables en Flota Variable
-            if tabla2:
-                horas = [[item['hora'] for item in tabla2]]
-                buses = [[item['buses'] for item in tabla2]]
+            if len(inputs.fleet.breaks):
+                horas = [[_excel_time(int(m)) for m in inputs.fleet.breaks]]
+                buses = [[int(b) for b in inputs.fleet.values]]
                 
                 processor.write_range('Flota Variable', 'K3', horas, 'horizontal')
                 processor.write_range('Flota Variable', 'K4', buses, 'horizontal')
             
-            # Tabla 3: Tiempos de ciclo en Tiempos de ciclo
-            if tabla3:
-                horas_col = [[item['hora']] for item in tabla3]
-                tciclo_ab = [[item['tCicloAB']] for item in tabla3]
-                tciclo_ba = [[item['tCicloBA']] for item in tabla3]
+            # Tabla 3: Tiempos de ciclo en Tiempos de ciclo (tiempoCB/tiempoBC comparten los 'desde')
+            if len(inputs.time_cb.breaks):
+                horas_col = [[_excel_time(int(m))] for m in inputs.time_cb.breaks]
+                tciclo_ab = [[_excel_time(int(m))] for m in inputs.time_cb.values]
+                tciclo_ba = [[_excel_time(int(m))] for m in inputs.time_bc.values]
                 
                 processor.write_range('Tiempos de ciclo', 'E3', horas_col, 'vertical')
                 processor.write_range('Tiempos de ciclo', 'H3', tciclo_ab, 'vertical')
@@ -0,0 +1,410 @@
+# app/services/feed_snapshot.py
+
+"""
+Snapshot compilado del feed GTFS (stops, routes, shapes, trips, stop_times).
+
+Tras cada importación/generación se vuelcan arreglos NumPy columnares a un
+directorio versionado de archivos .npy. Cada worker de uvicorn los abre con
+mmap_mode='r': las páginas se comparten vía page cache entre procesos y no
+se copian a memoria de cada worker. Las búsquedas por id usan searchsorted
+sobre columnas ordenadas, así que tampoco hay diccionarios por worker.
+
+Estructura:
+    <FEED_SNAPSHOT_DIR>/CURRENT          -> nombre de la versión vigente
+    <FEED_SNAPSHOT_DIR>/<versión>/*.npy  -> columnas
+    <FEED_SNAPSHOT_DIR>/<versión>/meta.json
+
+Las escrituras puntuales (admin, KML, CSV) invalidan el snapshot borrando
+CURRENT; los endpoints vuelven a la BD hasta la siguiente compilación.
+"""
+
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from app.config import settings
+from app.models.gtfs_models import Route, Shape, Stop, StopTime, Trip
+
+SNAPSHOT_FORMAT = 2
+
+# Columnas de texto nullable servidas tal cual: se guarda además su máscara de nulos
+# (_str_array guarda None como '' y la respuesta debe distinguirlos, igual que la BD)
+NULLABLE_TEXT_COLUMNS = ("routes_route_short_name", "routes_route_long_name", "routes_route_color")
+KEEP_VERSIONS = 2
+NULL_INT = -1
+
+
+def _snapshot_dir() -> Path:
+    return Path(settings.FEED_SNAPSHOT_DIR)
+
+
+def _str_array(series: pd.Series) -> np.ndarray:
+    """Columna de texto de ancho fijo (sin pickle, apta para mmap). None se guarda como ''."""
+    values = series.astype(object).where(series.notna(), "").astype(str).to_numpy()
+    return np.asarray(values, dtype=str) if len(values) else np.zeros(0, dtype="<U1")
+
+
+def _null_mask(series: pd.Series) -> np.ndarray:
+    return series.isna().to_numpy(dtype=bool)
+
+
+def _int_array(series: pd.Series, dtype="int64") -> np.ndarray:
+    return pd.to_numeric(series, errors="coerce").fillna(NULL_INT).astype(dtype).to_numpy()
+
+
+def _float_array(series: pd.Series) -> np.ndarray:
+    return pd.to_numeric(series, errors="coerce").astype("float64").to_numpy()
+
+
+def _offsets(sorted_codes: np.ndarray, size: int) -> np.ndarray:
+    """Offsets tipo CSR: filas de la entidad i = [offsets[i], offsets[i+1])."""
+    return np.searchsorted(sorted_codes, np.arange(size + 1)).astype("int64")
+
+
+def compile_feed(db) -> Dict[str, np.ndarray]:
+    """Lee el feed de la BD y lo compila a columnas ordenadas por id."""
+    bind = db.get_bind()
+
+    stops = pd.read_sql(
+        select(Stop.stop_id, Stop.stop_name, Stop.stop_lat, Stop.stop_lon).order_by(Stop.stop_id), bind
+    )
+    routes = pd.read_sql(
+        select(Route.route_id, Route.route_short_name, Route.route_long_name, Route.route_color)
+        .order_by(Route.route_id), bind
+    )
+    shapes = pd.read_sql(
+        select(Shape.shape_id, Shape.shape_pt_sequence, Shape.shape_pt_lat, Shape.shape_pt_lon, Shape.shape_dist_traveled)
+        .where(Shape.shape_id.isnot(None))
+        .order_by(Shape.shape_id, Shape.shape_pt_sequence), bind
+    )
+    trips = pd.read_sql(
+        select(Trip.trip_id, Trip.route_id, Trip.service_id, Trip.direction_id, Trip.block_id,
+               Trip.shape_id, Trip.trip_headsign).order_by(Trip.trip_id), bind
+    )
+    stop_times = pd.read_sql(
+        select(StopTime.trip_id, StopTime.stop_id, StopTime.stop_sequence,
+               StopTime.arrival_seconds, StopTime.departure_seconds)
+        .order_by(StopTime.trip_id, StopTime.stop_sequence), bind
+    )
+
+    arrays: Dict[str, np.ndarray] = {}
+
+    # --- stops / routes ---
+    arrays["stops_stop_id"] = _int_array(stops["stop_id"])
+    arrays["stops_stop_name"] = _str_array(stops["stop_name"])
+    arrays["stops_stop_lat"] = _float_array(stops["stop_lat"])
+    arrays["stops_stop_lon"] = _float_array(stops["stop_lon"])
+
+    arrays["routes_route_id"] = _str_array(routes["route_id"])
+    arrays["routes_route_short_name"] = _str_array(routes["route_short_name"])
+    arrays["routes_route_long_name"] = _str_array(routes["route_long_name"])
+    arrays["routes_route_color"] = _str_array(routes["route_color"])
+    for name in NULLABLE_TEXT_COLUMNS:
+        arrays[f"{name}_null"] = _null_mask(routes[name[len("routes_"):]])
+
+    # --- shapes: puntos ordenados + offsets por shape_id ---
+    shape_codes, shape_ids = pd.factorize(shapes["shape_id"].astype(str), sort=True)
+    arrays["shapes_shape_id"] = np.asarray(shape_ids, dtype=str) if len(shape_ids) else np.zeros(0, dtype="<U1")
+    arrays["shapes_offsets"] = _offsets(shape_codes, len(shape_ids))
+    arrays["shape_points_lat"] = _float_array(shapes["shape_pt_lat"])
+    arrays["shape_points_lon"] = _float_array(shapes["shape_pt_lon"])
+    arrays["shape_points_sequence"] = _int_array(shapes["shape_pt_sequence"], "int32")
+    arrays["shape_points_dist"] = _float_array(shapes["shape_dist_traveled"])
+
+    # --- trips ---
+    arrays["trips_trip_id"] = _str_array(trips["trip_id"])
+    arrays["trips_route_id"] = _str_array(trips["route_id"])
+    arrays["trips_service_id"] = _str_array(trips["service_id"])
+    arrays["trips_direction_id"] = _int_array(trips["direction_id"], "int16")
+    arrays["trips_block_id"] = _str_array(trips["block_id"])
+    arrays["trips_shape_id"] = _str_array(trips["shape_id"])
+    arrays["trips_trip_headsign"] = _str_array(trips["trip_headsign"])
+
+    # --- stop_times: por trip (índice en trips) + offsets ---
+    trip_ids = arrays["trips_trip_id"]
+    st_trip = stop_times["trip_id"].astype(str).to_numpy()
+    trip_index = np.searchsorted(trip_ids, st_trip) if len(trip_ids) else np.zeros(len(st_trip), dtype="int64")
+    valid = trip_index < len(trip_ids)
+    valid[valid] = trip_ids[trip_index[valid]] == st_trip[valid]
+    stop_times = stop_times[valid]
+    trip_index = trip_index[valid]
+
+    arrays["stop_times_trip_index"] = trip_index.astype("int32")
+    arrays["stop_times_stop_id"] = _int_array(stop_times["stop_id"])
+    arrays["stop_times_stop_sequence"] = _int_array(stop_times["stop_sequence"], "int32")
+    arrays["stop_times_arrival_seconds"] = _int_array(stop_times["arrival_seconds"], "int32")
+    arrays["stop_times_departure_seconds"] = _int_array(stop_times["departure_seconds"], "int32")
+    arrays["trips_stop_time_offsets"] = _offsets(trip_index, len(trip_ids))
+
+    arrays.update(_compile_map_tables(arrays))
+    return arrays
+
+
+def _compile_map_tables(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Precalcula lo que sirve /gtfs/routes-with-details: paradas únicas por
+    (ruta, sentido, secuencia) y shapes por (ruta, sentido).
+    """
+    route_ids = arrays["routes_route_id"]
+    trip_route = arrays["trips_route_id"]
+    route_index = np.searchsorted(route_ids, trip_route) if len(route_ids) else np.zeros(len(trip_route), dtype="int64")
+    route_valid = route_index < len(route_ids)
+    route_valid[route_valid] = route_ids[route_index[route_valid]] == trip_route[route_valid]
+    # Sentido 0/1; cualquier otro valor se agrupa en 0 (como el endpoint original)
+    direction = np.where(np.isin(arrays["trips_direction_id"], (0, 1)), arrays["trips_direction_id"], 0)
+
+    st_trip = arrays["stop_times_trip_index"]
+    frame = pd.DataFrame({
+        "route": route_index[st_trip] if len(st_trip) else np.zeros(0, dtype="int64"),
+        "direction": direction[st_trip] if len(st_trip) else np.zeros(0, dtype="int16"),
+        "sequence": arrays["stop_times_stop_sequence"],
+        "stop_id": arrays["stop_times_stop_id"],
+        "trip": st_trip,
+    })
+    frame = frame[route_valid[st_trip]] if len(st_trip) else frame
+
+    stop_ids = arrays["stops_stop_id"]
+    stop_index = np.searchsorted(stop_ids, frame["stop_id"].to_numpy())
+    stop_valid = stop_index < len(stop_ids)
+    stop_valid[stop_valid] = stop_ids[stop_index[stop_valid]] == frame["stop_id"].to_numpy()[stop_valid]
+    stops_frame = frame.assign(stop_index=stop_index)[stop_valid]
+    stops_frame = stops_frame.sort_values(["route", "direction", "sequence"], kind="stable")
+    stops_frame = stops_frame.drop_duplicates(["route", "direction", "sequence", "stop_id"])
+
+    shape_ids = arrays["shapes_shape_id"]
+    trips_used = np.unique(frame["trip"].to_numpy())
+    trip_shape = arrays["trips_shape_id"][trips_used]
+    shape_index = np.searchsorted(shape_ids, trip_shape) if len(shape_ids) else np.zeros(len(trip_shape), dtype="int64")
+    shape_valid = shape_index < len(shape_ids)
+    shape_valid[shape_valid] = shape_ids[shape_index[shape_valid]] == trip_shape[shape_valid]
+    shapes_frame = pd.DataFrame({
+        "route": route_index[trips_used],
+        "direction": direction[trips_used],
+        "shape": shape_index,
+    })[shape_valid].drop_duplicates().sort_values(["route", "direction", "shape"])
+
+    return {
+        "map_stops_route": stops_frame["route"].to_numpy(dtype="int32"),
+        "map_stops_direction": stops_frame["direction"].to_numpy(dtype="int16"),
+        "map_stops_sequence": stops_frame["sequence"].to_numpy(dtype="int32"),
+        "map_stops_stop_index": stops_frame["stop_index"].to_numpy(dtype="int64"),
+        "map_shapes_route": shapes_frame["route"].to_numpy(dtype="int32"),
+        "map_shapes_direction": shapes_frame["direction"].to_numpy(dtype="int16"),
+        "map_shapes_shape_index": shapes_frame["shape"].to_numpy(dtype="int64"),
+    }
+
+
+def build_feed_snapshot(db) -> Optional[str]:
+    """Compila el feed y publica una nueva versión de forma atómica. Devuelve la versión."""
+    if not settings.FEED_SNAPSHOT_ENABLED:
+        return None
+
+    base = _snapshot_dir()
+    base.mkdir(parents=True, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    tmp_dir = base / f".{version}.tmp"
+    tmp_dir.mkdir()
+
+    arrays = compile_feed(db)
+    for name, values in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", values, allow_pickle=False)
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "created_at": datetime.now().isoformat(),
+        "counts": {
+            "stops": int(len(arrays["stops_stop_id"])),
+            "routes": int(len(arrays["routes_route_id"])),
+            "shapes": int(len(arrays["shapes_shape_id"])),
+            "shape_points": int(len(arrays["shape_points_lat"])),
+            "trips": int(len(arrays["trips_trip_id"])),
+            "stop_times": int(len(arrays["stop_times_trip_index"])),
+        },
+        "arrays": sorted(arrays),
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+    os.replace(tmp_dir, base / version)
+
+    # Publicar: CURRENT se reemplaza atómicamente
+    pointer_tmp = base / "CURRENT.tmp"
+    pointer_tmp.write_text(version)
+    os.replace(pointer_tmp, base / "CURRENT")
+
+    _cleanup_old_versions(base, version)
+    print(f"🗂️ Snapshot del feed publicado: {version} {meta['counts']}")
+    return version
+
+
+def refresh_feed_snapshot(db) -> Optional[str]:
+    """build_feed_snapshot sin propagar errores: si falla, se invalida y se sigue usando la BD."""
+    try:
+        return build_feed_snapshot(db)
+    except Exception as e:
+        print(f"⚠️ No se pudo compilar el snapshot del feed: {e}")
+        invalidate_feed_snapshot()
+        return None
+
+
+def invalidate_feed_snapshot() -> None:
+    try:
+        (_snapshot_dir() / "CURRENT").unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _cleanup_old_versions(base: Path, current: str) -> None:
+    # Los workers que aún mapean una versión borrada la siguen leyendo (unlink no invalida el mmap)
+    versions = sorted(p for p in base.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for old in versions[:-KEEP_VERSIONS]:
+        if old.name != current:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+class FeedSnapshot:
+    """Vista de solo lectura (mmap) de una versión del snapshot."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text())
+        if self.meta.get("format") != SNAPSHOT_FORMAT:
+            # Versión compilada por un código anterior: se ignora hasta la siguiente compilación
+            raise ValueError(f"formato {self.meta.get('format')} (se espera {SNAPSHOT_FORMAT})")
+        self.version = self.meta["version"]
+        self.arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r", allow_pickle=False)
+            for name in self.meta["arrays"]
+        }
+        self._routes_with_details: Optional[List[Dict[str, Any]]] = None
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    @staticmethod
+    def _lookup(sorted_ids: np.ndarray, value) -> Optional[int]:
+        idx = int(np.searchsorted(sorted_ids, value))
+        if idx < len(sorted_ids) and sorted_ids[idx] == value:
+            return idx
+        return None
+
+    def stop_index(self, stop_id: int) -> Optional[int]:
+        return self._lookup(self["stops_stop_id"], stop_id)
+
+    def trip_index(self, trip_id: str) -> Optional[int]:
+        return self._lookup(self["trips_trip_id"], trip_id)
+
+    def shape_points(self, shape_id: str):
+        """(lat, lon) del shape como vistas sobre el mmap, o None."""
+        idx = self._lookup(self["shapes_shape_id"], shape_id)
+        if idx is None:
+            return None
+        start, end = self["shapes_offsets"][idx], self["shapes_offsets"][idx + 1]
+        return self["shape_points_lat"][start:end], self["shape_points_lon"][start:end]
+
+    def trip_stop_times(self, trip_id: str) -> Optional[Dict[str, np.ndarray]]:
+        idx = self.trip_index(trip_id)
+        if idx is None:
+            return None
+        start, end = self["trips_stop_time_offsets"][idx], self["trips_stop_time_offsets"][idx + 1]
+        return {
+            "stop_id": self["stop_times_stop_id"][start:end],
+            "stop_sequence": self["stop_times_stop_sequence"][start:end],
+            "arrival_seconds": self["stop_times_arrival_seconds"][start:end],
+            "departure_seconds": self["stop_times_departure_seconds"][start:end],
+        }
+
+    def routes_with_details(self) -> List[Dict[str, Any]]:
+        """Respuesta de /gtfs/routes-with-details (memorizada por versión)."""
+        if self._routes_with_details is not None:
+            return self._routes_with_details
+
+        def text(name, idx):
+            return None if self[f"{name}_null"][idx] else str(self[name][idx])
+
+        def coordinate(value):
+            # NULL en la BD -> NaN en el .npy -> null en el JSON (NaN no es JSON válido)
+            return None if np.isnan(value) else float(value)
+
+        def coordinate_pairs(lats, lons):
+            values = np.column_stack((lats, lons))
+            pairs = values.astype(object)
+            pairs[np.isnan(values)] = None
+            return pairs.tolist()
+
+        stop_ids = self["stops_stop_id"]
+        stop_names = self["stops_stop_name"]
+        stop_lats = self["stops_stop_lat"]
+        stop_lons = self["stops_stop_lon"]
+        shape_offsets = self["shapes_offsets"]
+        shape_lats = self["shape_points_lat"]
+        shape_lons = self["shape_points_lon"]
+
+        routes = [
+            {"direction_0": {"stops": [], "shapes": []}, "direction_1": {"stops": [], "shapes": []}}
+            for _ in range(len(self["routes_route_id"]))
+        ]
+        for route, direction, sequence, stop_idx in zip(
+            self["map_stops_route"].tolist(), self["map_stops_direction"].tolist(),
+            self["map_stops_sequence"].tolist(), self["map_stops_stop_index"].tolist()
+        ):
+            routes[route][f"direction_{direction}"]["stops"].append({
+                "stop_id": int(stop_ids[stop_idx]),
+                "stop_name": str(stop_names[stop_idx]),
+                "stop_lat": coordinate(stop_lats[stop_idx]),
+                "stop_lon": coordinate(stop_lons[stop_idx]),
+                "stop_sequence": None if sequence == NULL_INT else sequence,
+            })
+        for route, direction, shape_idx in zip(
+            self["map_shapes_route"].tolist(), self["map_shapes_direction"].tolist(),
+            self["map_shapes_shape_index"].tolist()
+        ):
+            start, end = shape_offsets[shape_idx], shape_offsets[shape_idx + 1]
+            routes[route][f"direction_{direction}"]["shapes"].append(
+                coordinate_pairs(shape_lats[start:end], shape_lons[start:end])
+            )
+
+        result = []
+        for idx, details in enumerate(routes):
+            result.append({
+                "route_id": str(self["routes_route_id"][idx]),
+                "route_short_name": text("routes_route_short_name", idx),
+                "route_long_name": text("routes_route_long_name", idx),
+                "route_color": text("routes_route_color", idx),
+                **details,
+            })
+        self._routes_with_details = result
+        return result
+
+
+_snapshot: Optional[FeedSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_feed_snapshot() -> Optional[FeedSnapshot]:
+    """Snapshot vigente para este worker (se re-mapea cuando cambia CURRENT), o None."""
+    global _snapshot
+    if not settings.FEED_SNAPSHOT_ENABLED:
+        return None
+    base = _snapshot_dir()
+    try:
+        version = (base / "CURRENT").read_text().strip()
+    except FileNotFoundError:
+        return None
+    current = _snapshot
+    if current is not None and current.version == version:
+        return current
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            try:
+                _snapshot = FeedSnapshot(base / version)
+            except (FileNotFoundError, KeyError, ValueError, json.JSONDecodeError) as e:
+                print(f"⚠️ Snapshot {version} ilegible: {e}")
+                return None
+        return _snapshot
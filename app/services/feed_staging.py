@@ -0,0 +1,186 @@
+# app/services/feed_staging.py
+
+"""
+Tablas de staging para importar un feed GTFS sin que los lectores vean datos
+a medias.
+
+La importación escribe en copias de las tablas GTFS (<tabla>__staging) con el
+mismo esquema que los modelos y sus llaves foráneas apuntando entre sí. Con
+el feed completo se valida ahí mismo y se intercambia con el vigente en una
+sola transacción:
+
+    DROP <tabla> ...; ALTER TABLE <tabla>__staging RENAME TO <tabla> ...
+
+Hasta el COMMIT los lectores siguen viendo el feed anterior completo: en
+SQLite (WAL) leen la última versión confirmada sin bloquearse, y en
+PostgreSQL el intercambio solo toma el lock exclusivo durante los DROP/RENAME.
+
+Índices:
+- PostgreSQL los construye sobre el staging antes del intercambio (con sufijo)
+  y los renombra dentro de la transacción.
+- SQLite no puede renombrar índices, así que los crea con su nombre definitivo
+  dentro de la transacción del intercambio; los lectores no se bloquean por WAL.
+"""
+
+from typing import Dict, List
+
+from sqlalchemy import Column, ForeignKeyConstraint, Index, MetaData, Table, inspect, text
+
+from app.models.gtfs_models import (
+    Agency,
+    Calendar,
+    CalendarDate,
+    FareAttribute,
+    FareRule,
+    FeedInfo,
+    Frequency,
+    Route,
+    Shape,
+    Stop,
+    StopTime,
+    Trip,
+)
+from app.services.metrics import stage_timer
+from app.services.stop_patterns import refresh_stop_patterns
+
+STAGING_SUFFIX = "__staging"
+
+# Orden de dependencias (padres primero)
+STAGED_MODELS = [
+    Agency, Calendar, CalendarDate, FareAttribute, Route, FareRule, Shape, Stop, Trip, StopTime, Frequency, FeedInfo,
+]
+
+# PostgreSQL: espera máxima por el lock de las tablas vigentes durante el intercambio
+SWAP_LOCK_TIMEOUT = "10s"
+
+
+def staging_name(name: str) -> str:
+    return f"{name}{STAGING_SUFFIX}"
+
+
+def _copy_table(table: Table, metadata: MetaData) -> Table:
+    """Copia de la tabla con nombre de staging y llaves foráneas hacia las otras tablas de staging."""
+    columns = [
+        Column(
+            col.name,
+            col.type,
+            primary_key=col.primary_key,
+            nullable=col.nullable,
+            autoincrement=col.autoincrement,
+            default=col.default.arg if col.default is not None and col.default.is_scalar else None,
+        )
+        for col in table.columns
+    ]
+    # Nombre explícito = el que PostgreSQL le daría a la tabla vigente; sobrevive al RENAME
+    foreign_keys = [
+        ForeignKeyConstraint(
+            [fk.parent.name],
+            [f"{staging_name(fk.column.table.name)}.{fk.column.name}"],
+            name=f"{table.name}_{fk.parent.name}_fkey",
+        )
+        for fk in table.foreign_keys
+    ]
+    return Table(staging_name(table.name), metadata, *columns, *foreign_keys)
+
+
+class FeedStaging:
+    """Ciclo de vida de las tablas de staging: crear, indexar, intercambiar o descartar."""
+
+    def __init__(self, bind):
+        self.bind = bind
+        self.metadata = MetaData()
+        self.live: Dict[str, Table] = {model.__tablename__: model.__table__ for model in STAGED_MODELS}
+        self.tables: Dict[str, Table] = {
+            name: _copy_table(table, self.metadata) for name, table in self.live.items()
+        }
+        self.is_postgres = bind.dialect.name == "postgresql"
+
+    def table_for(self, model) -> Table:
+        return self.tables[model.__tablename__]
+
+    def create(self) -> None:
+        """Crea el staging vacío (descarta restos de una importación interrumpida)."""
+        self.drop()
+        self.metadata.create_all(bind=self.bind)
+        print(f"🧱 Tablas de staging creadas ({len(self.tables)})")
+
+    def drop(self) -> None:
+        self.metadata.drop_all(bind=self.bind, checkfirst=True)
+
+    def _staged_indexes(self) -> List[Index]:
+        """Índices de los modelos recreados sobre las tablas de staging (nombre con sufijo)."""
+        indexes = []
+        for name, table in self.live.items():
+            staged = self.tables[name]
+            for index in table.indexes:
+                indexes.append(Index(
+                    staging_name(index.name), *[staged.c[col.name] for col in index.columns], unique=index.unique
+                ))
+        return indexes
+
+    @stage_timer("gtfs_import.staging_indexes")
+    def build_indexes(self) -> None:
+        """PostgreSQL: indexa el staging antes del intercambio (SQLite lo hace dentro, ver swap)."""
+        if not self.is_postgres:
+            return
+        with self.bind.begin() as conn:
+            for index in self._staged_indexes():
+                index.create(bind=conn)
+        print("🗂️ Índices de staging creados")
+
+    def _quote(self, name: str) -> str:
+        return self.bind.dialect.identifier_preparer.quote(name)
+
+    @stage_timer("gtfs_import.swap")
+    def swap(self) -> None:
+        """Reemplaza las tablas vigentes por las de staging en una sola transacción."""
+        live_names = [model.__tablename__ for model in STAGED_MODELS]
+        with self.bind.connect() as conn:
+            if self.is_postgres:
+                conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+            else:
+                # pysqlite no abre transacción antes de DDL: sin BEGIN explícito cada DROP/RENAME se confirmaría solo
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                existing = set(inspect(conn).get_table_names())
+                for name in reversed(live_names):
+                    if name in existing:
+                        conn.exec_driver_sql(f"DROP TABLE {self._quote(name)}")
+                for name in live_names:
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {self._quote(staging_name(name))} RENAME TO {self._quote(name)}"
+                    )
+
+                if self.is_postgres:
+                    self._rename_postgres_objects(conn, live_names)
+                else:
+                    for name in live_names:
+                        for index in self.live[name].indexes:
+                            index.create(bind=conn)
+
+                # Patrones derivados en la misma transacción: cambian junto con los trips
+                refresh_stop_patterns(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        print("🔀 Feed de staging publicado")
+
+    def _rename_postgres_objects(self, conn, live_names) -> None:
+        """Devuelve a índices, llaves primarias y secuencias los nombres de las tablas vigentes."""
+        for name in live_names:
+            for index in self.live[name].indexes:
+                conn.exec_driver_sql(
+                    f"ALTER INDEX {self._quote(staging_name(index.name))} RENAME TO {self._quote(index.name)}"
+                )
+            conn.exec_driver_sql(
+                f"ALTER TABLE {self._quote(name)} RENAME CONSTRAINT "
+                f"{self._quote(staging_name(name) + '_pkey')} TO {self._quote(name + '_pkey')}"
+            )
+            for column in self.live[name].primary_key.columns:
+                sequence = conn.execute(
+                    text("SELECT pg_get_serial_sequence(:table, :column)"),
+                    {"table": name, "column": column.name},
+                ).scalar()
+                if sequence:
+                    conn.exec_driver_sql(f"ALTER SEQUENCE {sequence} RENAME TO {self._quote(f'{name}_{column.name}_seq')}")
@@ -0,0 +1,282 @@
+# app/services/frequencies.py
+
+"""
+Compresión de trips con headway constante a frequencies.txt y expansión inversa.
+
+Una ruta de alta frecuencia genera decenas de trips idénticos salvo por la
+hora de salida. Si varios trips consecutivos del mismo sentido y del mismo bus
+(block_id) tienen el mismo perfil (paradas y tiempos relativos a la salida) y
+salen con el mismo headway, basta con guardar el primero como trip plantilla y
+una fila de frequencies:
+
+    trip_id, start_time, end_time, headway_secs, exact_times=1
+
+Con exact_times=1 las salidas son start + k * headway mientras sean < end,
+así que el feed describe exactamente los mismos viajes. La agrupación sigue la
+misma regla que IntervalProcessor._group_intervals (cortar cuando cambia el
+headway), aplicada sobre las salidas ya generadas. Agrupar por block_id
+conserva el bus de cada salida: los horarios empalmados siguen encadenando
+IDA/VUELTA y numerando buses igual que con trips explícitos.
+
+expand_frequencies() / expand_timetable_rows() hacen el camino inverso para
+consumidores que necesitan trips explícitos (exportación expandida, horarios
+empalmados); expand_departures() para el tablero de salidas.
+"""
+
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+from sqlalchemy import func, select
+
+from app.models.gtfs_models import Frequency, StopTime
+
+# Un periodo con menos trips se guarda explícito: la fila de frequencies no compensa
+MIN_FREQUENCY_TRIPS = 3
+
+# Columnas del trip que deben coincidir para compartir plantilla
+TEMPLATE_TRIP_COLUMNS = [
+    'route_id', 'service_id', 'direction_id', 'shape_id', 'block_id',
+    'trip_headsign', 'wheelchair_accessible', 'bikes_allowed',
+]
+
+FREQUENCY_COLUMNS = ['trip_id', 'start_seconds', 'end_seconds', 'headway_secs', 'exact_times']
+
+
+def _trip_profiles(stop_times_df: pd.DataFrame) -> Tuple[Dict[str, int], Dict[str, tuple]]:
+    """
+    Salida de cada trip y su perfil: (stop_id, stop_sequence, llegada y salida
+    relativas a la salida). Los trips con tiempos faltantes no tienen perfil.
+    """
+    ordered = stop_times_df.sort_values(['trip_id', 'stop_sequence'])
+    first_departures: Dict[str, int] = {}
+    profiles: Dict[str, tuple] = {}
+
+    for trip_id, group in ordered.groupby('trip_id', sort=False):
+        arrivals = group['arrival_seconds']
+        departures = group['departure_seconds']
+        if arrivals.isna().any() or departures.isna().any():
+            continue
+        start = int(departures.iloc[0])
+        first_departures[trip_id] = start
+        profiles[trip_id] = tuple(zip(
+            group['stop_id'].astype(str).tolist(),
+            group['stop_sequence'].astype(int).tolist(),
+            (arrivals.astype(int) - start).tolist(),
+            (departures.astype(int) - start).tolist(),
+        ))
+    return first_departures, profiles
+
+
+def _constant_headway_runs(departures: List[Tuple[int, str]], min_trips: int) -> List[List[Tuple[int, str]]]:
+    """
+    Corta la secuencia de salidas (ordenada) en periodos de headway constante.
+    Un periodo corto no se comprime: su primer trip queda suelto y se reintenta
+    desde el siguiente.
+    """
+    runs = []
+    i = 0
+    while i < len(departures):
+        j = i + 1
+        if j < len(departures):
+            headway = departures[j][0] - departures[i][0]
+            while (
+                headway > 0
+                and j + 1 < len(departures)
+                and departures[j + 1][0] - departures[j][0] == headway
+            ):
+                j += 1
+            if headway > 0 and j - i + 1 >= min_trips:
+                runs.append(departures[i:j + 1])
+                i = j + 1
+                continue
+        runs.append(departures[i:i + 1])
+        i += 1
+    return runs
+
+
+def compress_to_frequencies(
+    trips_df: pd.DataFrame,
+    stop_times_df: pd.DataFrame,
+    min_trips: int = MIN_FREQUENCY_TRIPS
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Reemplaza cada periodo de headway constante por su primer trip (plantilla)
+    y una fila de frequencies con exact_times=1.
+
+    stop_times_df debe traer arrival_seconds/departure_seconds. Devuelve
+    (trips, stop_times, frequencies); los trips no comprimibles quedan igual.
+    """
+    empty = pd.DataFrame(columns=FREQUENCY_COLUMNS)
+    if trips_df.empty or stop_times_df.empty:
+        return trips_df, stop_times_df, empty
+
+    first_departures, profiles = _trip_profiles(stop_times_df)
+    key_columns = [c for c in TEMPLATE_TRIP_COLUMNS if c in trips_df.columns]
+
+    candidates: Dict[tuple, List[Tuple[int, str]]] = {}
+    for trip in trips_df.to_dict('records'):
+        trip_id = trip['trip_id']
+        if trip_id not in profiles:
+            continue
+        key = tuple(str(trip.get(c)) for c in key_columns) + (profiles[trip_id],)
+        candidates.setdefault(key, []).append((first_departures[trip_id], trip_id))
+
+    frequencies = []
+    dropped = set()
+    for departures in candidates.values():
+        departures.sort()
+        for run in _constant_headway_runs(departures, min_trips):
+            if len(run) == 1:
+                continue
+            headway = run[1][0] - run[0][0]
+            template_id = run[0][1]
+            dropped.update(trip_id for _, trip_id in run[1:])
+            frequencies.append({
+                'trip_id': template_id,
+                'start_seconds': run[0][0],
+                # end_time es exclusivo: la última salida queda dentro del periodo
+                'end_seconds': run[-1][0] + headway,
+                'headway_secs': headway,
+                'exact_times': 1,
+            })
+
+    if not frequencies:
+        return trips_df, stop_times_df, empty
+
+    trips_df = trips_df[~trips_df['trip_id'].isin(dropped)].copy()
+    stop_times_df = stop_times_df[~stop_times_df['trip_id'].isin(dropped)].copy()
+    frequencies_df = pd.DataFrame(frequencies, columns=FREQUENCY_COLUMNS).sort_values(['trip_id', 'start_seconds'])
+    return trips_df, stop_times_df, frequencies_df.reset_index(drop=True)
+
+
+def frequency_instances(rows: Iterable[tuple]) -> List[Tuple[str, int, str]]:
+    """
+    Salidas de los periodos (trip_id, start, end, headway) como
+    (trip_id plantilla, salida, trip_id explícito <trip_id>_F01, _F02, ...).
+    La numeración recorre los periodos de cada plantilla en orden de inicio.
+    """
+    instances = []
+    numbers: Dict[str, int] = {}
+    for trip_id, start, end, headway in sorted(rows, key=lambda row: (row[0], row[1])):
+        if not headway or headway <= 0:
+            continue
+        for trip_start in range(int(start), int(end), int(headway)):
+            numbers[trip_id] = numbers.get(trip_id, 0) + 1
+            instances.append((trip_id, trip_start, f"{trip_id}_F{numbers[trip_id]:02d}"))
+    return instances
+
+
+def template_first_departures():
+    """Subconsulta (trip_id, first_seconds): primera salida de cada trip plantilla."""
+    seconds = func.coalesce(StopTime.departure_seconds, StopTime.arrival_seconds)
+    return (
+        select(StopTime.trip_id, func.min(seconds).label("first_seconds"))
+        .where(StopTime.trip_id.in_(select(Frequency.trip_id)))
+        .group_by(StopTime.trip_id)
+        .subquery()
+    )
+
+
+def expand_frequencies(
+    trips_df: pd.DataFrame,
+    stop_times_df: pd.DataFrame,
+    frequencies_df: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Convierte cada trip plantilla en trips explícitos (<trip_id>_F01, _F02, ...)
+    con sus stop_times desplazados a cada salida. Sirve igual para exact_times=0:
+    las salidas se programan en start + k * headway.
+    """
+    if frequencies_df is None or frequencies_df.empty:
+        return trips_df, stop_times_df
+
+    instances = frequency_instances(
+        frequencies_df[['trip_id', 'start_seconds', 'end_seconds', 'headway_secs']].itertuples(index=False)
+    )
+    templates = set(frequencies_df['trip_id'])
+    if not instances:
+        return (
+            trips_df[~trips_df['trip_id'].isin(templates)],
+            stop_times_df[~stop_times_df['trip_id'].isin(templates)],
+        )
+
+    instances_df = pd.DataFrame(instances, columns=['template_id', 'start', 'new_trip_id'])
+
+    # Tiempos relativos a la primera salida de la plantilla
+    template_times = stop_times_df[stop_times_df['trip_id'].isin(templates)].sort_values(['trip_id', 'stop_sequence'])
+    first = template_times.groupby('trip_id')['departure_seconds'].transform('first')
+    template_times = template_times.assign(
+        arrival_offset=template_times['arrival_seconds'] - first,
+        departure_offset=template_times['departure_seconds'] - first,
+    )
+
+    expanded_times = instances_df.merge(template_times, left_on='template_id', right_on='trip_id')
+    expanded_times['trip_id'] = expanded_times['new_trip_id']
+    expanded_times['arrival_seconds'] = (expanded_times['start'] + expanded_times['arrival_offset']).astype('Int64')
+    expanded_times['departure_seconds'] = (expanded_times['start'] + expanded_times['departure_offset']).astype('Int64')
+    expanded_times = expanded_times[stop_times_df.columns]
+
+    expanded_trips = instances_df.merge(trips_df, left_on='template_id', right_on='trip_id')
+    expanded_trips['trip_id'] = expanded_trips['new_trip_id']
+    expanded_trips = expanded_trips[trips_df.columns]
+
+    trips_out = pd.concat([trips_df[~trips_df['trip_id'].isin(templates)], expanded_trips], ignore_index=True)
+    stop_times_out = pd.concat(
+        [stop_times_df[~stop_times_df['trip_id'].isin(templates)], expanded_times], ignore_index=True
+    )
+    return trips_out, stop_times_out
+
+
+def expand_departures(rows) -> List[tuple]:
+    """
+    Salidas en una parada de los trips plantilla. Cada fila: (offset, start,
+    end, headway, *resto) -> una tupla (start + offset + k*headway, *resto)
+    por cada salida del periodo.
+    """
+    departures = []
+    for offset, start, end, headway, *rest in rows:
+        if not headway or headway <= 0:
+            continue
+        for trip_start in range(int(start), int(end), int(headway)):
+            departures.append((trip_start + int(offset), *rest))
+    return departures
+
+
+def expand_timetable_rows(
+    trips: List[Dict],
+    stop_times: List[tuple],
+    frequency_rows: Iterable[tuple]
+) -> Tuple[List[Dict], List[tuple]]:
+    """
+    Versión por filas de expand_frequencies para consultas que solo traen
+    algunas paradas (horarios empalmados).
+
+    trips: dicts con trip_id; stop_times: (trip_id, stop_id, segundos) ordenados
+    por trip y stop_sequence; frequency_rows: (trip_id, start, end, headway,
+    primera salida del trip). Los tiempos se desplazan respecto a esa primera
+    salida, no a la primera parada consultada.
+    """
+    frequency_rows = list(frequency_rows)
+    if not frequency_rows:
+        return trips, stop_times
+
+    first_departures = {row[0]: row[4] for row in frequency_rows}
+    instances = frequency_instances(row[:4] for row in frequency_rows)
+    templates = set(first_departures)
+
+    trips_by_id = {trip["trip_id"]: trip for trip in trips}
+    template_times: Dict[str, List[tuple]] = {}
+    for trip_id, stop_id, seconds in stop_times:
+        if trip_id in templates:
+            template_times.setdefault(trip_id, []).append((stop_id, seconds))
+
+    expanded_trips = [trip for trip in trips if trip["trip_id"] not in templates]
+    expanded_times = [row for row in stop_times if row[0] not in templates]
+    for template_id, start, new_trip_id in instances:
+        if template_id not in trips_by_id:
+            continue
+        expanded_trips.append({**trips_by_id[template_id], "trip_id": new_trip_id})
+        shift = start - first_departures[template_id]
+        for stop_id, seconds in template_times.get(template_id, []):
+            expanded_times.append((new_trip_id, stop_id, None if seconds is None else seconds + shift))
+    return expanded_trips, expanded_times
@@ -1,12 +1,18 @@
 import logging
 import traceback
 from typing import List, Dict, Any, Optional # Asegúrate de importar Optional
-from datetime import time #
 from sqlalchemy.orm import Session
+import numpy as np
 import pandas as pd
 
-from app.models.gtfs_models import Trip, StopTime, Stop, Shape
+from app.models.gtfs_models import Frequency, Trip, StopTime, Stop, Shape
 from app.services.kml_processor import KMLProcessor
+from app.services.stop_patterns import refresh_stop_patterns
+from app.services.departure_board import departure_index
+from app.services.feed_snapshot import refresh_feed_snapshot
+from app.services.frequencies import compress_to_frequencies
+from app.services.spatial_index import nearest_point_index
+from app.utils.gtfs_time import parse_gtfs_time_series, unwrap_midnight_series
 
 # NOTA: Tu código de logger está bien, lo mantengo
 # Si 'app.services.kml_processor' no existe, ajusta la importación
@@ -38,8 +44,14 @@ class GTFSFromSheetGenerator:
         shape_id_s1: str, # Este puede venir del formulario (manual)
         shape_id_s2: str, # Este puede venir del formulario (manual)
         stops_data: List[Dict], # Esto viene del Excel o DB
-        bikes_allowed: int = 0
+        bikes_allowed: int = 0,
+        use_frequencies: bool = False
     ) -> Dict:
+        """
+        Con use_frequencies=True los periodos de headway constante se guardan como
+        un trip plantilla + una fila de frequencies (exact_times=1) en lugar de un
+        trip por salida; ver app/services/frequencies.py.
+        """
 
         warnings = []
         errors = []
@@ -238,8 +250,24 @@ class GTFSFromSheetGenerator:
             self.logger.error(msg)
             errors.append(msg)
 
+        trips_generated = len(trips_df)
+        frequencies_df = None
         try:
-            insert_errors = self._insert_to_db(trips_df, stop_times_df)
+            stop_times_df = self._add_seconds_columns(stop_times_df)
+            if use_frequencies:
+                trips_df, stop_times_df, frequencies_df = compress_to_frequencies(trips_df, stop_times_df)
+                self.logger.info(
+                    "Frequencies: %d trips generados -> %d trips guardados + %d periodos",
+                    trips_generated, len(trips_df), len(frequencies_df)
+                )
+        except Exception as e:
+            tb = traceback.format_exc()
+            msg = f"Error preparando tiempos/frequencies: {e}\n{tb}"
+            self.logger.error(msg)
+            errors.append(msg)
+
+        try:
+            insert_errors = self._insert_to_db(trips_df, stop_times_df, frequencies_df)
             if insert_errors:
                 errors.extend(insert_errors)
         except Exception as e:
@@ -252,6 +280,8 @@ class GTFSFromSheetGenerator:
             'success': len(errors) == 0,
             'trips_created': len(trips_df),
             'stop_times_created': len(stop_times_df),
+            'frequencies_created': len(frequencies_df) if frequencies_df is not None else 0,
+            'trips_represented': trips_generated,
             'warnings': warnings,
             'errors': errors,
             'malformed_rows_sample': malformed_rows[:5]
@@ -294,6 +324,12 @@ class GTFSFromSheetGenerator:
         for sid, pts in shapes_dict.items():
             pts.sort(key=lambda x: x['dist'])
 
+        # Coordenadas por shape como arreglos para la búsqueda vectorizada del vértice más cercano
+        shape_coords = {
+            sid: (np.array([p['lat'] for p in pts]), np.array([p['lon'] for p in pts]))
+            for sid, pts in shapes_dict.items()
+        }
+
         df = df.sort_values(['trip_id', 'stop_sequence']).reset_index(drop=True)
         result_shape_dist = [0.0] * len(df)
         eps = 1.0
@@ -328,6 +364,7 @@ class GTFSFromSheetGenerator:
                 continue
 
             shape_points = shapes_dict[shape_id]
+            shape_lats, shape_lons = shape_coords[shape_id]
             last_matched_idx = 0
             last_matched_dist = 0.0
 
@@ -347,17 +384,10 @@ class GTFSFromSheetGenerator:
                     continue
 
                 stop_lat, stop_lon = stops_dict[stop_id]
-                min_dist = float('inf')
-                min_idx = None
-                
+
                 # Buscar desde el último punto encontrado hacia adelante
-                for i_p in range(last_matched_idx, len(shape_points)):
-                    pt = shape_points[i_p]
-                    d = self.kml_processor.calculate_distance(stop_lat, stop_lon, pt['lat'], pt['lon'])
-                    if d < min_dist:
-                        min_dist = d
-                        min_idx = i_p
-                
+                min_idx, _ = nearest_point_index(shape_lats, shape_lons, stop_lat, stop_lon, last_matched_idx)
+
                 chosen_idx = min_idx if min_idx is not None else last_matched_idx
                 chosen_dist = float(shape_points[chosen_idx]['dist']) if chosen_idx is not None else last_matched_dist
 
@@ -461,41 +491,31 @@ class GTFSFromSheetGenerator:
             return (h * 3600) + (m * 60) + sec
         except Exception:
             return None
-# CÓDIGO A AÑADIR (dentro de la clase)
-
-    def _parse_gtfs_time_to_time_obj(self, time_str: str) -> Optional[time]:
+    def _add_seconds_columns(self, stop_times_df):
         """
-        Convierte un string HH:MM:SS a un objeto time de Python.
-        Maneja 'None' y advierte sobre horas >= 24 (que SQLite no soporta).
+        Tiempos a segundos una sola vez; los cruces de medianoche de la sábana
+        ("23:50" -> "00:30") se corrigen por trip.
         """
-        if not time_str or pd.isna(time_str):
-            return None
-        try:
-            s = str(time_str).strip().replace('_', ':')
-            parts = s.split(':')
-            h = int(parts[0])
-            m = int(parts[1])
-            sec = int(parts[2]) if len(parts) > 2 else 0
-
-            # ADVERTENCIA: Python/SQLite 'time' no soporta horas > 23.
-            # Haremos un módulo (modulo 24) para evitar el crash.
-            if h >= 24:
-                self.logger.warning(f"Hora GTFS '{time_str}' (>=24h) se guardará como {h % 24}h.")
-                h = h % 24
-                
-            return time(h, m, sec)
-        except Exception as e:
-            self.logger.error(f"Error al parsear '{time_str}' a objeto time: {e}")
-            return None
-
+        if stop_times_df.empty or 'arrival_seconds' in stop_times_df.columns:
+            return stop_times_df
+        stop_times_df = stop_times_df.sort_values(['trip_id', 'stop_sequence'])
+        stop_times_df['arrival_seconds'] = unwrap_midnight_series(
+            parse_gtfs_time_series(stop_times_df['arrival_time']), stop_times_df['trip_id'])
+        stop_times_df['departure_seconds'] = unwrap_midnight_series(
+            parse_gtfs_time_series(stop_times_df['departure_time']), stop_times_df['trip_id'])
+        return stop_times_df
 
-    def _insert_to_db(self, trips_df, stop_times_df):
+    def _insert_to_db(self, trips_df, stop_times_df, frequencies_df=None):
         """
         CORRECCIÓN CRÍTICA: 
         1. stop_id se guarda como string.
-        2. arrival_time y departure_time se guardan como string (los que generamos).
+        2. arrival_time y departure_time se guardan como segundos enteros
+           (las horas >= 24 se conservan, sin módulo 24).
         """
         insert_errors = []
+
+        stop_times_df = self._add_seconds_columns(stop_times_df)
+
         for i, (_, row) in enumerate(trips_df.iterrows()):
             try:
                 trip_kwargs = row.to_dict()
@@ -510,15 +530,8 @@ class GTFSFromSheetGenerator:
 
         for i, (_, row) in enumerate(stop_times_df.iterrows()):
             try:
-                # Obtenemos los strings de tiempo
-                arr_time_str = row['arrival_time']
-                dep_time_str = row['departure_time']
-                
-                # --- CORRECCIÓN ---
-                # Convertimos los strings a objetos 'time' de Python
-                arr_time_obj = self._parse_gtfs_time_to_time_obj(arr_time_str)
-                dep_time_obj = self._parse_gtfs_time_to_time_obj(dep_time_str)
-                # --- FIN CORRECCIÓN ---
+                arr_seconds = row['arrival_seconds']
+                dep_seconds = row['departure_seconds']
 
                 stop_id_str = str(row['stop_id']) if row.get('stop_id') not in (None, '', 'nan') else None
 
@@ -527,10 +540,8 @@ class GTFSFromSheetGenerator:
                     stop_id=stop_id_str,
                     stop_sequence=int(row['stop_sequence']) if row.get('stop_sequence') not in (None, '', 'nan') else 0,
                     
-                    # --- CORRECCIÓN ---
-                    arrival_time=arr_time_obj,   # <-- Usar el objeto time
-                    departure_time=dep_time_obj, # <-- Usar el objeto time
-                    # --- FIN CORRECCIÓN ---
+                    arrival_seconds=int(arr_seconds) if pd.notna(arr_seconds) else None,
+                    departure_seconds=int(dep_seconds) if pd.notna(dep_seconds) else None,
 
                     timepoint=int(row.get('timepoint', 1)),
                     shape_dist_traveled=float(row.get('shape_dist_traveled') or 0.0)
@@ -559,7 +570,15 @@ class GTFSFromSheetGenerator:
             return insert_errors
 
         try:
+            if frequencies_df is not None and not frequencies_df.empty:
+                # Los trips plantilla deben existir antes que sus periodos (FK)
+                self.db.flush()
+                for row in frequencies_df.to_dict('records'):
+                    self.db.add(Frequency(**{k: v if k == 'trip_id' else int(v) for k, v in row.items()}))
+            refresh_stop_patterns(self.db, trips_df['route_id'].dropna().unique())
             self.db.commit()
+            departure_index.invalidate_routes(self.db, trips_df['route_id'].dropna().unique())
+            refresh_feed_snapshot(self.db)
             self.logger.info("Commit exitoso: %d trips, %d stop_times", len(trips_df), len(stop_times_df))
         except Exception as e:
             tb = traceback.format_exc()
@@ -1,37 +1,79 @@
 """
 GTFS Importer Service - CORREGIDO
 """
+import numpy as np
 import pandas as pd
 from zipfile import ZipFile
 from io import BytesIO
-from typing import Dict, BinaryIO
-from datetime import datetime, time
+from typing import Dict, BinaryIO, Optional
+from datetime import datetime
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 import traceback
 
+from app.config import settings
+
 # Importa todos los modelos para poder limpiarlos
 from app.models.gtfs_models import (
     Agency,
     Calendar,
+    CalendarDate,
     FareAttribute,
     FareRule,
     FeedInfo,
+    Frequency,
     Route,
     Shape,
     Stop,
     StopTime,
     Trip,
 )
+from app.models.pattern_models import RouteStopPattern
+from app.services.stop_patterns import refresh_stop_patterns
+from app.services.calendar_service import invalidate_calendar_cache
+from app.services.departure_board import departure_index
+from app.services.feed_snapshot import invalidate_feed_snapshot, refresh_feed_snapshot
+from app.services.spatial_index import invalidate_spatial_index
+from app.services.feed_staging import FeedStaging
+from app.services.gtfs_validator import (
+    ValidationReport,
+    read_feed_database,
+    summarize_report,
+    validate_feed_tables,
+    validate_gtfs_zip,
+)
+from app.services.metrics import stage_timer
+from app.utils.gtfs_time import parse_gtfs_time, parse_gtfs_time_series
+
+INSERT_CHUNK_SIZE = 50000
 
 class GTFSImporter:
-    """Importador de archivos GTFS"""
+    """
+    Importador de archivos GTFS.
+
+    Con staged=True (GTFS_IMPORT_STAGED) carga en tablas de staging y publica el
+    feed completo de una vez (ver feed_staging.py); los lectores nunca ven las
+    tablas vacías ni a medio cargar. Con staged=False borra y recarga en vivo.
+    """
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, staged: Optional[bool] = None):
         self.db = db
         self.agency_id = None
+        self.staged = settings.GTFS_IMPORT_STAGED if staged is None else staged
+        self.staging: Optional[FeedStaging] = None
+
+    def _table(self, model):
+        """Tabla destino: la de staging durante una importación por staging, si no la vigente."""
+        return self.staging.table_for(model) if self.staging is not None else model.__table__
+
+    def _insert_rows(self, model, rows) -> None:
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            self.db.execute(insert(self._table(model)), rows[start:start + INSERT_CHUNK_SIZE])
+        self.db.commit()
 
     # --- INICIO DE LA SECCIÓN CORREGIDA ---
 
+    @stage_timer("gtfs_import.clear")
     def _clear_existing_data(self):
         """
         Elimina todos los registros de las tablas GTFS.
@@ -41,10 +83,13 @@ class GTFSImporter:
             print("🗑️ Limpiando datos GTFS existentes...")
             
             # Se eliminan primero las tablas con dependencias (llaves foráneas)
+            self.db.query(RouteStopPattern).delete(synchronize_session=False)
             self.db.query(StopTime).delete(synchronize_session=False)
+            self.db.query(Frequency).delete(synchronize_session=False)
             self.db.query(Trip).delete(synchronize_session=False)
             self.db.query(FareRule).delete(synchronize_session=False)
             self.db.query(Route).delete(synchronize_session=False)
+            self.db.query(CalendarDate).delete(synchronize_session=False)
             
             # Ahora se pueden eliminar las tablas de las que dependían las anteriores
             self.db.query(Stop).delete(synchronize_session=False)
@@ -63,17 +108,35 @@ class GTFSImporter:
             self.db.rollback()
             raise  # Vuelve a lanzar la excepción para que sea manejada por el endpoint
 
-    def import_gtfs(self, gtfs_zip: BinaryIO, agency_name: str = None) -> Dict:
+    def import_gtfs(self, gtfs_zip: BinaryIO, agency_name: str = None, validate: bool = True) -> Dict:
         """
-        Importa un archivo GTFS completo, limpiando los datos anteriores primero.
+        Importa un archivo GTFS completo, reemplazando los datos anteriores.
+        Con validate=True un feed con errores se rechaza antes de borrar nada.
         """
         try:
-            # 1. Limpiar todos los datos GTFS existentes
-            self._clear_existing_data()
-
-            # 2. Continuar con la importación como antes
             content = gtfs_zip.read() if hasattr(gtfs_zip, 'read') else gtfs_zip
-            
+
+            # 1. Validar el feed completo mientras los datos actuales siguen intactos
+            validation = None
+            if validate:
+                validation = validate_gtfs_zip(content)
+                if not validation["valid"]:
+                    print(f"❌ {summarize_report(validation)}")
+                    return {"status": "error", "message": summarize_report(validation), "validation": validation}
+                print(f"✅ Feed validado en {validation['elapsed_ms']:.0f}ms ({len(validation['warnings'])} advertencias)")
+
+            # 2. Staging vacío, o limpiar todos los datos GTFS existentes
+            if self.staged:
+                self.staging = FeedStaging(self.db.get_bind())
+                self.staging.create()
+            else:
+                self._clear_existing_data()
+                invalidate_calendar_cache()
+                departure_index.invalidate_all()
+                invalidate_feed_snapshot()
+                invalidate_spatial_index()
+
+            # 3. Continuar con la importación como antes
             with ZipFile(BytesIO(content)) as zip_ref:
                 results = {
                     "agency": 0, "calendar": 0, "fare_attributes": 0,
@@ -95,6 +158,11 @@ class GTFSImporter:
                     calendars = self._import_calendar(zip_ref)
                     results["calendar"] = len(calendars) if calendars else 0
 
+                if "calendar_dates.txt" in filenames:
+                    print("📥 Importando calendar_dates...")
+                    calendar_dates = self._import_calendar_dates(zip_ref)
+                    results["calendar_dates"] = len(calendar_dates) if calendar_dates else 0
+
                 if "fare_attributes.txt" in filenames:
                     print("📥 Importando fare_attributes...")
                     fares = self._import_fare_attributes(zip_ref)
@@ -130,19 +198,65 @@ class GTFSImporter:
                     stop_times = self._import_stop_times(zip_ref)
                     results["stop_times"] = len(stop_times) if stop_times else 0
 
+                if "frequencies.txt" in filenames:
+                    print("📥 Importando frequencies...")
+                    frequencies = self._import_frequencies(zip_ref, trips if "trips.txt" in filenames else [])
+                    results["frequencies"] = len(frequencies) if frequencies else 0
+
                 if "feed_info.txt" in filenames:
                     print("📥 Importando feed_info...")
                     feed = self._import_feed_info(zip_ref)
                     results["feed_info"] = 1 if feed else 0
 
-                return {"status": "success", "imported": results}
+                if self.staging is not None:
+                    # 4. Validar lo cargado y publicarlo de una vez (incluye los patrones de paradas)
+                    staged_report = self._validate_staging()
+                    if not staged_report["valid"]:
+                        self._discard_staging()
+                        print(f"❌ Staging rechazado: {summarize_report(staged_report)}")
+                        return {"status": "error", "message": summarize_report(staged_report), "validation": staged_report}
+                    self.staging.build_indexes()
+                    self.staging.swap()
+                    self.staging = None
+                else:
+                    # Patrones de paradas por ruta/sentido para /api/route_stops/
+                    with stage_timer("gtfs_import.stop_patterns"):
+                        refresh_stop_patterns(self.db)
+                        self.db.commit()
+                invalidate_calendar_cache()
+                departure_index.invalidate_all()
+                with stage_timer("gtfs_import.feed_snapshot"):
+                    refresh_feed_snapshot(self.db)
+                invalidate_spatial_index()
+
+                response = {"status": "success", "imported": results}
+                if validation is not None:
+                    response["warnings"] = validation["warnings"]
+                return response
                 
         except Exception as e:
             self.db.rollback()
+            self._discard_staging()
             print(f"❌ Error en importación: {e}")
             traceback.print_exc()
             return {"status": "error", "message": str(e)}
     
+    @stage_timer("gtfs_import.staging_validate")
+    def _validate_staging(self) -> Dict:
+        """Mismas reglas del validador sobre lo que realmente quedó en staging (filas descartadas incluidas)."""
+        report = ValidationReport("staging")
+        tables = read_feed_database(self.db.get_bind(), self.staging.tables)
+        return validate_feed_tables(tables, report, is_zip=False).to_dict()
+
+    def _discard_staging(self) -> None:
+        if self.staging is None:
+            return
+        try:
+            self.staging.drop()
+        except Exception as e:
+            print(f"⚠️ No se pudieron eliminar las tablas de staging: {e}")
+        self.staging = None
+
     # --- FIN DE LA SECCIÓN CORREGIDA ---
     
     def _safe_int(self, value, default=None):
@@ -163,24 +277,15 @@ class GTFSImporter:
         except (ValueError, TypeError):
             return default
     
-    def _parse_time_safe(self, value):
-        """Convierte string GTFS time a Python time (maneja >24:00:00)"""
+    def _parse_time_seconds(self, value):
+        """Convierte string GTFS time a segundos totales (conserva horas >= 24)"""
         if pd.isna(value):
             return None
         
-        s = str(value).strip()
-        try:
-            parts = s.split(":")
-            h = int(parts[0]) if len(parts) > 0 else 0
-            m = int(parts[1]) if len(parts) > 1 else 0
-            sec = int(parts[2]) if len(parts) > 2 else 0
-            
-            # Normalizar horas > 24
-            h_norm = h % 24
-            return time(h_norm, m, sec)
-        except Exception as e:
-            print(f"Error parsing time '{value}': {e}")
-            return None
+        seconds = parse_gtfs_time(value)
+        if seconds is None:
+            print(f"Error parsing time '{value}'")
+        return seconds
     
     def _parse_date_safe(self, value):
         """Convierte string GTFS date (YYYYMMDD) a Python date"""
@@ -194,22 +299,24 @@ class GTFSImporter:
             print(f"Error parsing date '{value}': {e}")
             return None
 
+    @stage_timer("gtfs_import.agency")
     def _import_agency(self, zip_ref, override_name=None):
         """Importa agency.txt"""
         df = pd.read_csv(zip_ref.open("agency.txt"), dtype=str)
         
-        agency = Agency(
+        agency = dict(
             agency_name=override_name or self._safe_str(df.iloc[0].get("agency_name"), "Unknown"),
             agency_url=self._safe_str(df.iloc[0].get("agency_url")),
             agency_timezone=self._safe_str(df.iloc[0].get("agency_timezone"), "America/Mexico_City"),
             agency_phone=self._safe_str(df.iloc[0].get("agency_phone"))
         )
-        self.db.add(agency)
+        result = self.db.execute(insert(self._table(Agency)).values(**agency))
         self.db.commit()
-        self.agency_id = agency.agency_id
-        print(f"✅ Agency importada: {agency.agency_name} (ID: {agency.agency_id})")
+        self.agency_id = result.inserted_primary_key[0]
+        print(f"✅ Agency importada: {agency['agency_name']} (ID: {self.agency_id})")
         return agency
 
+    @stage_timer("gtfs_import.calendar")
     def _import_calendar(self, zip_ref):
         """Importa calendar.txt"""
         df = pd.read_csv(zip_ref.open("calendar.txt"), dtype=str)
@@ -217,7 +324,7 @@ class GTFSImporter:
         
         for _, row in df.iterrows():
             try:
-                calendar = Calendar(
+                calendar = dict(
                     service_id=self._safe_str(row["service_id"]),
                     monday=bool(int(row.get("monday", 0))),
                     tuesday=bool(int(row.get("tuesday", 0))),
@@ -229,16 +336,40 @@ class GTFSImporter:
                     start_date=self._parse_date_safe(row["start_date"]),
                     end_date=self._parse_date_safe(row["end_date"])
                 )
-                self.db.add(calendar)
                 calendars.append(calendar)
             except Exception as e:
                 print(f"⚠️ Error importando calendar: {e}")
                 continue
         
-        self.db.commit()
+        self._insert_rows(Calendar, calendars)
         print(f"✅ {len(calendars)} calendars importados")
         return calendars
 
+    @stage_timer("gtfs_import.calendar_dates")
+    def _import_calendar_dates(self, zip_ref):
+        """Importa calendar_dates.txt"""
+        df = pd.read_csv(zip_ref.open("calendar_dates.txt"), dtype=str)
+        calendar_dates = []
+        
+        for _, row in df.iterrows():
+            try:
+                calendar_date = dict(
+                    service_id=self._safe_str(row["service_id"]),
+                    date=self._parse_date_safe(row["date"]),
+                    exception_type=self._safe_int(row.get("exception_type"), 1)
+                )
+                if calendar_date["date"] is None:
+                    continue
+                calendar_dates.append(calendar_date)
+            except Exception as e:
+                print(f"⚠️ Error importando calendar_date: {e}")
+                continue
+        
+        self._insert_rows(CalendarDate, calendar_dates)
+        print(f"✅ {len(calendar_dates)} calendar_dates importados")
+        return calendar_dates
+
+    @stage_timer("gtfs_import.fare_attributes")
     def _import_fare_attributes(self, zip_ref):
         """Importa fare_attributes.txt"""
         df = pd.read_csv(zip_ref.open("fare_attributes.txt"), dtype=str)
@@ -246,23 +377,23 @@ class GTFSImporter:
         
         for _, row in df.iterrows():
             try:
-                fare = FareAttribute(
+                fare = dict(
                     fare_id=self._safe_str(row["fare_id"]),
                     price=float(row["price"]),
                     currency_type=self._safe_str(row["currency_type"]),
                     payment_method=int(row["payment_method"]),
                     transfers=self._safe_int(row.get("transfers"))
                 )
-                self.db.add(fare)
                 fares.append(fare)
             except Exception as e:
                 print(f"⚠️ Error importando fare: {e}")
                 continue
         
-        self.db.commit()
+        self._insert_rows(FareAttribute, fares)
         print(f"✅ {len(fares)} fare_attributes importados")
         return fares
 
+    @stage_timer("gtfs_import.fare_rules")
     def _import_fare_rules(self, zip_ref):
         """Importa fare_rules.txt"""
         df = pd.read_csv(zip_ref.open("fare_rules.txt"), dtype=str)
@@ -270,26 +401,26 @@ class GTFSImporter:
         
         for _, row in df.iterrows():
             try:
-                rule = FareRule(
+                rule = dict(
                     fare_id=self._safe_str(row["fare_id"]),
                     route_id=self._safe_str(row["route_id"])
                 )
-                self.db.add(rule)
                 rules.append(rule)
             except Exception as e:
                 print(f"⚠️ Error importando fare_rule: {e}")
                 continue
         
-        self.db.commit()
+        self._insert_rows(FareRule, rules)
         print(f"✅ {len(rules)} fare_rules importados")
         return rules
 
+    @stage_timer("gtfs_import.feed_info")
     def _import_feed_info(self, zip_ref):
         """Importa feed_info.txt"""
         df = pd.read_csv(zip_ref.open("feed_info.txt"), dtype=str)
         
         try:
-            info = FeedInfo(
+            info = dict(
                 feed_publisher_name=self._safe_str(df.iloc[0]["feed_publisher_name"]),
                 feed_publisher_url=self._safe_str(df.iloc[0].get("feed_publisher_url")),
                 feed_lang=self._safe_str(df.iloc[0].get("feed_lang")),
@@ -301,14 +432,14 @@ class GTFSImporter:
                 # ✅ LÍNEA AÑADIDA para el campo que faltaba
                 feed_contact_email=self._safe_str(df.iloc[0].get("feed_contact_email"))
             )
-            self.db.add(info)
-            self.db.commit()
+            self._insert_rows(FeedInfo, [info])
             print(f"✅ Feed info importado")
             return info
         except Exception as e:
             print(f"⚠️ Error importando feed_info: {e}")
             return None
 
+    @stage_timer("gtfs_import.routes")
     def _import_routes(self, zip_ref):
         """Importa routes.txt"""
         df = pd.read_csv(zip_ref.open("routes.txt"), dtype=str)
@@ -316,7 +447,7 @@ class GTFSImporter:
         
         for _, row in df.iterrows():
             try:
-                route = Route(
+                route = dict(
                     route_id=self._safe_str(row["route_id"]),
                     route_short_name=self._safe_str(row.get("route_short_name")),
                     route_long_name=self._safe_str(row.get("route_long_name")),
@@ -325,40 +456,38 @@ class GTFSImporter:
                     route_text_color=self._safe_str(row.get("route_text_color")),
                     agency_id=self.agency_id
                 )
-                self.db.add(route)
                 routes.append(route)
             except Exception as e:
                 print(f"⚠️ Error importando route: {e}")
                 continue
         
-        self.db.commit()
+        self._insert_rows(Route, routes)
         print(f"✅ {len(routes)} routes importados")
         return routes
 
+    @stage_timer("gtfs_import.shapes")
     def _import_shapes(self, zip_ref):
-        """Importa shapes.txt"""
+        """Importa shapes.txt (conversión por columnas + INSERT masivo)"""
         df = pd.read_csv(zip_ref.open("shapes.txt"), dtype=str)
-        shapes = []
-        
-        for _, row in df.iterrows():
-            try:
-                shape = Shape(
-                    shape_id=self._safe_str(row["shape_id"]),
-                    shape_pt_lat=float(row["shape_pt_lat"]),
-                    shape_pt_lon=float(row["shape_pt_lon"]),
-                    shape_pt_sequence=int(row["shape_pt_sequence"]),
-                    shape_dist_traveled=float(row["shape_dist_traveled"]) if pd.notna(row.get("shape_dist_traveled")) else None
-                )
-                self.db.add(shape)
-                shapes.append(shape)
-            except Exception as e:
-                print(f"⚠️ Error importando shape: {e}")
-                continue
-        
-        self.db.commit()
-        print(f"✅ {len(shapes)} shapes importados")
-        return shapes
+        shapes = pd.DataFrame({
+            "shape_id": df["shape_id"].fillna("").str.strip(),
+            "shape_pt_lat": pd.to_numeric(df["shape_pt_lat"], errors="coerce"),
+            "shape_pt_lon": pd.to_numeric(df["shape_pt_lon"], errors="coerce"),
+            "shape_pt_sequence": self._integer_column(df, "shape_pt_sequence"),
+            "shape_dist_traveled": self._float_column(df, "shape_dist_traveled"),
+        })
+
+        invalid = shapes[["shape_pt_lat", "shape_pt_lon"]].isna().any(axis=1) | shapes["shape_pt_sequence"].isna()
+        if invalid.any():
+            print(f"⚠️ Omitiendo {int(invalid.sum())} puntos de shape con coordenadas o secuencia inválidas")
+            shapes = shapes[~invalid]
+
+        rows = self._records(shapes)
+        self._insert_rows(Shape, rows)
+        print(f"✅ {len(rows)} shapes importados")
+        return rows
 
+    @stage_timer("gtfs_import.stops")
     def _import_stops(self, zip_ref):
         """Importa stops.txt"""
         df = pd.read_csv(zip_ref.open("stops.txt"), dtype=str)
@@ -366,23 +495,23 @@ class GTFSImporter:
         
         for _, row in df.iterrows():
             try:
-                stop = Stop(
+                stop = dict(
                     stop_id=self._safe_int(row["stop_id"]),
                     stop_name=self._safe_str(row["stop_name"]),
                     stop_lat=float(row["stop_lat"]),
                     stop_lon=float(row["stop_lon"]),
                     wheelchair_boarding=self._safe_int(row.get("wheelchair_boarding"))
                 )
-                self.db.add(stop)
                 stops.append(stop)
             except Exception as e:
                 print(f"⚠️ Error importando stop: {e}")
                 continue
         
-        self.db.commit()
+        self._insert_rows(Stop, stops)
         print(f"✅ {len(stops)} stops importados")
         return stops
 
+    @stage_timer("gtfs_import.trips")
     def _import_trips(self, zip_ref):
         """Importa trips.txt"""
         df = pd.read_csv(zip_ref.open("trips.txt"), dtype=str)
@@ -390,7 +519,7 @@ class GTFSImporter:
         
         for _, row in df.iterrows():
             try:
-                trip = Trip(
+                trip = dict(
                     route_id=self._safe_str(row["route_id"]),
                     trip_id=self._safe_str(row["trip_id"]),
                     service_id=self._safe_str(row["service_id"]),
@@ -401,46 +530,88 @@ class GTFSImporter:
                     wheelchair_accessible=self._safe_int(row.get("wheelchair_accessible")),
                     bikes_allowed=self._safe_int(row.get("bikes_allowed"))
                 )
-                self.db.add(trip)
                 trips.append(trip)
             except Exception as e:
                 print(f"⚠️ Error importando trip: {e}")
                 continue
         
-        self.db.commit()
+        self._insert_rows(Trip, trips)
         print(f"✅ {len(trips)} trips importados")
         return trips
 
+    @stage_timer("gtfs_import.stop_times")
     def _import_stop_times(self, zip_ref):
-        """Importa stop_times.txt"""
+        """Importa stop_times.txt (conversión por columnas + INSERT masivo)"""
         df = pd.read_csv(zip_ref.open("stop_times.txt"), dtype=str)
-        stop_times = []
-        
-        for _, row in df.iterrows():
-            try:
-                st = StopTime(
-                    trip_id=self._safe_str(row["trip_id"]),
-                    stop_id=self._safe_int(row["stop_id"]),
-                    arrival_time=self._parse_time_safe(row["arrival_time"]),
-                    departure_time=self._parse_time_safe(row["departure_time"]),
-                    timepoint=self._safe_int(row.get("timepoint")),
-                    stop_sequence=int(row["stop_sequence"]),
-                    shape_dist_traveled=float(row["shape_dist_traveled"]) if pd.notna(row.get("shape_dist_traveled")) else None
-                )
-                self.db.add(st)
-                stop_times.append(st)
-            except Exception as e:
-                print(f"⚠️ Error importando stop_time: {e}")
-                continue
-        
-        self.db.commit()
-        print(f"✅ {len(stop_times)} stop_times importados")
-        return stop_times
+        stop_times = pd.DataFrame({
+            "trip_id": df["trip_id"].fillna("").str.strip(),
+            "stop_id": self._integer_column(df, "stop_id"),
+            "arrival_seconds": parse_gtfs_time_series(df["arrival_time"]),
+            "departure_seconds": parse_gtfs_time_series(df["departure_time"]),
+            "timepoint": self._integer_column(df, "timepoint"),
+            "stop_sequence": self._integer_column(df, "stop_sequence"),
+            "shape_dist_traveled": self._float_column(df, "shape_dist_traveled"),
+        })
+
+        invalid = stop_times["stop_sequence"].isna()
+        if invalid.any():
+            print(f"⚠️ Omitiendo {int(invalid.sum())} stop_times con stop_sequence inválido")
+            stop_times = stop_times[~invalid]
+
+        rows = self._records(stop_times)
+        self._insert_rows(StopTime, rows)
+        print(f"✅ {len(rows)} stop_times importados")
+        return rows
+
+    @stage_timer("gtfs_import.frequencies")
+    def _import_frequencies(self, zip_ref, trips):
+        """Importa frequencies.txt (solo periodos de trips importados)"""
+        df = pd.read_csv(zip_ref.open("frequencies.txt"), dtype=str)
+        frequencies = pd.DataFrame({
+            "trip_id": df["trip_id"].fillna("").str.strip(),
+            "start_seconds": parse_gtfs_time_series(df["start_time"]),
+            "end_seconds": parse_gtfs_time_series(df["end_time"]),
+            "headway_secs": self._integer_column(df, "headway_secs"),
+            "exact_times": self._integer_column(df, "exact_times").fillna(0),
+        })
+
+        trip_ids = {trip["trip_id"] for trip in trips}
+        invalid = (
+            frequencies[["start_seconds", "end_seconds", "headway_secs"]].isna().any(axis=1)
+            | ~frequencies["trip_id"].isin(trip_ids)
+        )
+        if invalid.any():
+            print(f"⚠️ Omitiendo {int(invalid.sum())} frequencies con tiempos inválidos o trip inexistente")
+            frequencies = frequencies[~invalid]
+
+        rows = self._records(frequencies)
+        self._insert_rows(Frequency, rows)
+        print(f"✅ {len(rows)} frequencies importados")
+        return rows
+
+    @staticmethod
+    def _integer_column(df, column):
+        """Columna entera nullable (Int64); ausente o no numérica -> nulo."""
+        if column not in df.columns:
+            return pd.Series(pd.NA, index=df.index, dtype="Int64")
+        numbers = pd.to_numeric(df[column], errors="coerce")
+        return np.trunc(numbers).astype("Int64")
+
+    @staticmethod
+    def _float_column(df, column):
+        if column not in df.columns:
+            return pd.Series(np.nan, index=df.index, dtype="float64")
+        return pd.to_numeric(df[column], errors="coerce")
+
+    @staticmethod
+    def _records(frame):
+        """Filas para executemany: nulos de pandas (NaN/NA) como None y enteros nativos."""
+        return frame.astype(object).where(frame.notna(), None).to_dict("records")
 
 
 def validate_gtfs_file(gtfs_zip: BinaryIO) -> Dict:
     """
-    Valida estructura básica del GTFS sin importarlo
+    Valida el GTFS sin importarlo (estructura, referencias, tiempos y coordenadas)
     """
     try:
         content = gtfs_zip.read() if hasattr(gtfs_zip, 'read') else gtfs_zip
@@ -450,15 +621,17 @@ def validate_gtfs_file(gtfs_zip: BinaryIO) -> Dict:
             
             required_files = ['agency.txt', 'routes.txt', 'stops.txt', 'trips.txt', 'stop_times.txt']
             missing = [f for f in required_files if f not in files_in_zip]
-            
-            return {
-                'valid': len(missing) == 0,
-                'files_found': files_in_zip,
-                'missing_required': missing,
-                'error': None
-            }
+
+        report = validate_gtfs_zip(content)
+        return {
+            'valid': report['valid'],
+            'files_found': files_in_zip,
+            'missing_required': missing,
+            'report': report,
+            'error': None if report['valid'] else summarize_report(report)
+        }
     except Exception as e:
         return {
             'valid': False,
             'error': str(e)
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,486 @@
+# app/services/gtfs_validator.py
+
+"""
+Validación de feeds GTFS antes de cualquier paso destructivo.
+
+Funciona igual sobre un ZIP subido y sobre el feed vigente en la BD:
+cada archivo (o tabla) se lee una sola vez, solo con las columnas que se
+validan, y todas las reglas son operaciones vectorizadas (isin, lexsort,
+shift por grupo) en lugar de recorrer filas.
+
+Reglas:
+- estructura: archivos y columnas obligatorias, ids duplicados
+- integridad referencial: trip -> route/service/shape, stop_time -> trip/stop
+- stop_times: secuencias únicas por trip, tiempos legibles, llegada <= salida,
+  tiempos que no retroceden dentro del trip, primera/última parada con hora
+- coordenadas: numéricas, dentro de rango, sin (0, 0) ni paradas a cientos
+  de km del resto del feed
+
+En stop_times (el archivo grande) los ids y los tiempos se leen como
+categorías: cada hora distinta se convierte una sola vez (unas decenas de
+miles de valores aun con millones de filas) y las comprobaciones de
+pertenencia se hacen sobre las categorías.
+
+El resultado es un reporte serializable:
+    {"valid", "source", "counts", "errors": [...], "warnings": [...], "elapsed_ms"}
+con cada problema como {"code", "file", "message", "count", "samples"}.
+"""
+
+import time
+from io import BytesIO
+from typing import Dict, List, Optional
+from zipfile import ZipFile
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Table, select
+
+from app.models.gtfs_models import Calendar, CalendarDate, Route, Shape, Stop, StopTime, Trip
+from app.services.metrics import stage_timer
+from app.utils.gtfs_time import parse_gtfs_time_series
+
+REQUIRED_FILES = ["agency.txt", "routes.txt", "stops.txt", "trips.txt", "stop_times.txt"]
+
+# Columnas que se leen de cada archivo (las demás ni se parsean)
+FILE_COLUMNS = {
+    "agency": ["agency_id", "agency_name"],
+    "routes": ["route_id", "route_type"],
+    "stops": ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+    "calendar": ["service_id", "start_date", "end_date"],
+    "calendar_dates": ["service_id", "date"],
+    "shapes": ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"],
+    "trips": ["trip_id", "route_id", "service_id", "shape_id"],
+    "stop_times": ["trip_id", "stop_id", "stop_sequence", "arrival_time", "departure_time"],
+}
+
+REQUIRED_COLUMNS = {
+    "agency": ["agency_name"],
+    "routes": ["route_id", "route_type"],
+    "stops": ["stop_id", "stop_lat", "stop_lon"],
+    "calendar": ["service_id", "start_date", "end_date"],
+    "calendar_dates": ["service_id", "date"],
+    "shapes": ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"],
+    "trips": ["trip_id", "route_id", "service_id"],
+    "stop_times": ["trip_id", "stop_id", "stop_sequence"],
+}
+
+# Columnas de stop_times con muchos valores repetidos: se leen como categorías
+CATEGORY_COLUMNS = ["trip_id", "stop_id", "stop_sequence", "arrival_time", "departure_time"]
+
+MAX_SAMPLES = 10
+# Paradas más lejos que esto de la mediana del feed se reportan como sospechosas
+MAX_STOP_DISTANCE_KM = 300.0
+EARTH_RADIUS_KM = 6371.0
+
+
+class ValidationReport:
+    """Acumula errores y advertencias con un conteo y algunas filas de muestra."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.errors: List[Dict] = []
+        self.warnings: List[Dict] = []
+        self.counts: Dict[str, int] = {}
+
+    def add(self, severity: str, code: str, file: str, message: str, count: int, samples=None) -> None:
+        if not count:
+            return
+        issue = {"code": code, "file": file, "message": message, "count": int(count), "samples": samples or []}
+        (self.errors if severity == "error" else self.warnings).append(issue)
+
+    def check(self, severity: str, code: str, file: str, message: str, df: pd.DataFrame, mask, columns) -> None:
+        """Registra las filas de df marcadas por mask (con las columnas dadas como muestra)."""
+        mask = np.asarray(mask, dtype=bool)
+        count = int(mask.sum())
+        if count:
+            self.add(severity, code, file, message, count, _samples(df.loc[mask, columns]))
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def to_dict(self) -> Dict:
+        return {
+            "valid": self.valid,
+            "source": self.source,
+            "counts": self.counts,
+            "errors": self.errors,
+            "warnings": self.warnings,
+        }
+
+
+def _samples(rows: pd.DataFrame) -> List[Dict]:
+    head = rows.head(MAX_SAMPLES).astype(object)
+    head = head.where(head.notna(), None)
+    return [
+        {key: (value.item() if isinstance(value, np.generic) else value) for key, value in record.items()}
+        for record in head.to_dict("records")
+    ]
+
+
+def _blank(series: pd.Series) -> np.ndarray:
+    """Nulos o cadenas vacías."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        blank = (pd.Series(series.cat.categories).astype(str).str.strip() == "").to_numpy()
+        return np.append(blank, True)[series.cat.codes.to_numpy()]
+    if series.dtype == object:
+        return (series.isna() | (series.astype(str).str.strip() == "")).to_numpy()
+    return series.isna().to_numpy()
+
+
+def _codes(series: pd.Series):
+    """Códigos enteros (-1 = nulo) y valores distintos de una columna."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), pd.Series(series.cat.categories)
+    codes, uniques = pd.factorize(series)
+    return codes, pd.Series(uniques)
+
+
+def _expand_categories(series: pd.Series, convert) -> np.ndarray:
+    """Aplica convert solo a los valores distintos de una columna categórica y expande por código."""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return np.asarray(convert(series), dtype="float64")
+    converted = np.asarray(convert(pd.Series(series.cat.categories)), dtype="float64")
+    # Código -1 (nulo) apunta al NaN agregado al final
+    return np.append(converted, np.nan)[series.cat.codes.to_numpy()]
+
+
+def _missing_reference(series: pd.Series, valid_values) -> np.ndarray:
+    """Filas con valor no vacío que no existe en valid_values."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        missing = ~pd.Series(series.cat.categories).isin(valid_values).to_numpy()
+        codes = series.cat.codes.to_numpy()
+        return np.append(missing, False)[codes]
+    return (series.notna() & ~series.isin(valid_values)).to_numpy()
+
+
+def _to_number(series: pd.Series) -> pd.Series:
+    return pd.to_numeric(series, errors="coerce")
+
+
+def _is_integer(values) -> np.ndarray:
+    values = np.asarray(values, dtype="float64")
+    return ~np.isnan(values) & (np.floor(values) == values)
+
+
+# --- Lectura ---
+
+def _read_zip_table(zip_ref: ZipFile, name: str, report: ValidationReport) -> Optional[pd.DataFrame]:
+    filename = f"{name}.txt"
+    if filename not in zip_ref.namelist():
+        return None
+    wanted = FILE_COLUMNS[name]
+    dtype = {col: "category" for col in CATEGORY_COLUMNS} if name == "stop_times" else str
+    with zip_ref.open(filename) as handle:
+        df = pd.read_csv(
+            handle,
+            dtype=dtype,
+            encoding="utf-8-sig",
+            usecols=lambda col: col.strip() in wanted,
+            skipinitialspace=True,
+            # Por bloques, cada bloque infiere y ordena sus propias categorías y luego se unen
+            low_memory=name != "stop_times",
+        )
+    df.columns = [col.strip() for col in df.columns]
+
+    missing = [col for col in REQUIRED_COLUMNS[name] if col not in df.columns]
+    if missing:
+        report.add("error", "missing_column", filename, f"Faltan columnas obligatorias: {', '.join(missing)}", len(missing))
+    for col in wanted:
+        if col not in df.columns:
+            df[col] = pd.Series(np.nan, index=df.index, dtype=object)
+    return df
+
+
+def read_feed_zip(zip_ref: ZipFile, report: ValidationReport) -> Dict[str, pd.DataFrame]:
+    """Lee del ZIP solo las columnas validadas; los tiempos quedan como texto."""
+    files = zip_ref.namelist()
+    missing = [f for f in REQUIRED_FILES if f not in files]
+    if missing:
+        report.add("error", "missing_file", "", f"Faltan archivos obligatorios: {', '.join(missing)}", len(missing),
+                   [{"file": f} for f in missing])
+    if "calendar.txt" not in files and "calendar_dates.txt" not in files:
+        report.add("error", "missing_file", "", "Se requiere calendar.txt o calendar_dates.txt", 1)
+
+    tables = {}
+    for name in FILE_COLUMNS:
+        df = _read_zip_table(zip_ref, name, report)
+        if df is not None:
+            tables[name] = df
+    return tables
+
+
+# Columnas leídas de la BD por tabla (los tiempos ya vienen en segundos)
+DATABASE_COLUMNS = {
+    "routes": ["route_id", "route_type"],
+    "stops": ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+    "calendar": ["service_id", "start_date", "end_date"],
+    "calendar_dates": ["service_id", "date"],
+    "shapes": ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"],
+    "trips": ["trip_id", "route_id", "service_id", "shape_id"],
+    "stop_times": ["trip_id", "stop_id", "stop_sequence", "arrival_seconds", "departure_seconds"],
+}
+
+
+def read_feed_database(bind, tables: Optional[Dict[str, Table]] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Lee el feed con las mismas columnas que el ZIP. Por defecto las tablas
+    vigentes; tables permite leer otras con el mismo esquema (staging).
+    """
+    if tables is None:
+        tables = {model.__tablename__: model.__table__ for model in (Route, Stop, Calendar, CalendarDate, Shape, Trip, StopTime)}
+    frames = {}
+    for name, columns in DATABASE_COLUMNS.items():
+        table = tables[name]
+        selected = [table.c[col] for col in columns]
+        if name == "stop_times":
+            selected[-2:] = [table.c.arrival_seconds.label("arrival_time"), table.c.departure_seconds.label("departure_time")]
+        frames[name] = pd.read_sql(select(*selected), bind)
+    return frames
+
+
+# --- Reglas ---
+
+def _check_duplicates(report, df, file, columns, label):
+    dup = df.duplicated(subset=columns, keep="first").to_numpy()
+    report.check("error", "duplicate_id", file, f"{label} duplicado", df, dup, columns)
+
+
+def _check_coordinates(report, df, file, lat_col, lon_col, id_cols):
+    lat = _to_number(df[lat_col]).to_numpy(dtype="float64")
+    lon = _to_number(df[lon_col]).to_numpy(dtype="float64")
+    invalid = np.isnan(lat) | np.isnan(lon) | (np.abs(lat) > 90) | (np.abs(lon) > 180)
+    report.check("error", "invalid_coordinates", file, "Coordenadas vacías, no numéricas o fuera de rango",
+                 df, invalid, id_cols + [lat_col, lon_col])
+    zero = ~invalid & (lat == 0) & (lon == 0)
+    report.check("warning", "zero_coordinates", file, "Coordenadas en (0, 0)", df, zero, id_cols + [lat_col, lon_col])
+    return lat, lon, invalid | zero
+
+
+def _check_stops(report, stops, is_zip):
+    _check_duplicates(report, stops, "stops.txt", ["stop_id"], "stop_id")
+    if is_zip:
+        # stops.stop_id es entero en la BD: el importador descartaría estas paradas
+        non_integer = ~_is_integer(_to_number(stops["stop_id"])) & ~_blank(stops["stop_id"])
+        report.check("error", "non_integer_stop_id", "stops.txt", "stop_id no numérico (la BD usa ids enteros)",
+                     stops, non_integer, ["stop_id"])
+    report.check("error", "missing_value", "stops.txt", "stop_name vacío",
+                 stops, _blank(stops["stop_name"]), ["stop_id"])
+
+    lat, lon, bad = _check_coordinates(report, stops, "stops.txt", "stop_lat", "stop_lon", ["stop_id"])
+    good = ~bad
+    if good.sum() >= 3:
+        center_lat = np.radians(np.median(lat[good]))
+        center_lon = np.radians(np.median(lon[good]))
+        lat_r, lon_r = np.radians(lat), np.radians(lon)
+        a = (np.sin((lat_r - center_lat) / 2) ** 2
+             + np.cos(center_lat) * np.cos(lat_r) * np.sin((lon_r - center_lon) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+        far = good & (distance > MAX_STOP_DISTANCE_KM)
+        report.check("warning", "stop_too_far", "stops.txt",
+                     f"Parada a más de {MAX_STOP_DISTANCE_KM:.0f} km de la mediana del feed",
+                     stops, far, ["stop_id", "stop_lat", "stop_lon"])
+
+
+def _check_routes(report, routes):
+    _check_duplicates(report, routes, "routes.txt", ["route_id"], "route_id")
+    report.check("error", "missing_value", "routes.txt", "route_id vacío", routes, _blank(routes["route_id"]), ["route_id"])
+    route_type = _to_number(routes["route_type"]).to_numpy(dtype="float64")
+    report.check("error", "invalid_route_type", "routes.txt", "route_type vacío o no entero",
+                 routes, ~_is_integer(route_type), ["route_id", "route_type"])
+
+
+def _service_ids(report, tables, is_zip) -> set:
+    services = set()
+    calendar = tables.get("calendar")
+    if calendar is not None:
+        _check_duplicates(report, calendar, "calendar.txt", ["service_id"], "service_id")
+        if is_zip:
+            start = pd.to_datetime(calendar["start_date"], format="%Y%m%d", errors="coerce")
+            end = pd.to_datetime(calendar["end_date"], format="%Y%m%d", errors="coerce")
+        else:
+            start = pd.to_datetime(calendar["start_date"], errors="coerce")
+            end = pd.to_datetime(calendar["end_date"], errors="coerce")
+        report.check("error", "invalid_date", "calendar.txt", "start_date/end_date inválida (YYYYMMDD)",
+                     calendar, (start.isna() | end.isna()).to_numpy(), ["service_id", "start_date", "end_date"])
+        report.check("error", "invalid_date_range", "calendar.txt", "start_date posterior a end_date",
+                     calendar, (start > end).to_numpy(), ["service_id", "start_date", "end_date"])
+        services.update(calendar["service_id"].dropna())
+
+    calendar_dates = tables.get("calendar_dates")
+    if calendar_dates is not None:
+        if is_zip:
+            dates = pd.to_datetime(calendar_dates["date"], format="%Y%m%d", errors="coerce")
+            report.check("error", "invalid_date", "calendar_dates.txt", "date inválida (YYYYMMDD)",
+                         calendar_dates, dates.isna().to_numpy(), ["service_id", "date"])
+        services.update(calendar_dates["service_id"].dropna())
+    return services
+
+
+def _check_shapes(report, shapes) -> set:
+    sequence = _to_number(shapes["shape_pt_sequence"]).to_numpy(dtype="float64")
+    report.check("error", "invalid_sequence", "shapes.txt", "shape_pt_sequence vacío o no entero",
+                 shapes, ~_is_integer(sequence), ["shape_id", "shape_pt_sequence"])
+    keyed = shapes.assign(shape_pt_sequence=sequence)
+    dup = keyed.duplicated(subset=["shape_id", "shape_pt_sequence"]).to_numpy() & ~np.isnan(sequence)
+    report.check("error", "duplicate_sequence", "shapes.txt", "shape_pt_sequence repetido en el mismo shape",
+                 shapes, dup, ["shape_id", "shape_pt_sequence"])
+    _check_coordinates(report, shapes, "shapes.txt", "shape_pt_lat", "shape_pt_lon", ["shape_id", "shape_pt_sequence"])
+    return set(shapes["shape_id"].dropna())
+
+
+def _check_trips(report, trips, route_ids, service_ids, shape_ids):
+    _check_duplicates(report, trips, "trips.txt", ["trip_id"], "trip_id")
+    report.check("error", "missing_value", "trips.txt", "trip_id vacío", trips, _blank(trips["trip_id"]), ["trip_id"])
+    report.check("error", "unknown_route", "trips.txt", "route_id inexistente en routes",
+                 trips, _missing_reference(trips["route_id"], route_ids) | _blank(trips["route_id"]),
+                 ["trip_id", "route_id"])
+    report.check("error", "unknown_service", "trips.txt", "service_id inexistente en calendar/calendar_dates",
+                 trips, _missing_reference(trips["service_id"], service_ids) | _blank(trips["service_id"]),
+                 ["trip_id", "service_id"])
+    has_shape = ~_blank(trips["shape_id"])
+    report.check("error", "unknown_shape", "trips.txt", "shape_id inexistente en shapes",
+                 trips, has_shape & _missing_reference(trips["shape_id"], shape_ids), ["trip_id", "shape_id"])
+
+
+def _check_stop_times(report, stop_times, trips, stop_ids, is_zip):
+    file = "stop_times.txt"
+    trip_ids = trips["trip_id"].dropna() if trips is not None else pd.Series([], dtype=object)
+
+    report.check("error", "unknown_trip", file, "trip_id inexistente en trips",
+                 stop_times, _missing_reference(stop_times["trip_id"], trip_ids) | _blank(stop_times["trip_id"]),
+                 ["trip_id", "stop_sequence"])
+    if stop_ids is not None:
+        report.check("error", "unknown_stop", file, "stop_id inexistente en stops",
+                     stop_times, _missing_reference(stop_times["stop_id"], stop_ids) | _blank(stop_times["stop_id"]),
+                     ["trip_id", "stop_sequence", "stop_id"])
+
+    sequence = _expand_categories(stop_times["stop_sequence"], _to_number)
+    report.check("error", "invalid_sequence", file, "stop_sequence vacío o no entero",
+                 stop_times, ~_is_integer(sequence), ["trip_id", "stop_sequence"])
+
+    if is_zip:
+        arrival = _expand_categories(stop_times["arrival_time"], lambda s: parse_gtfs_time_series(s).astype("float64"))
+        departure = _expand_categories(stop_times["departure_time"], lambda s: parse_gtfs_time_series(s).astype("float64"))
+        unreadable = (
+            (np.isnan(arrival) & ~_blank(stop_times["arrival_time"]))
+            | (np.isnan(departure) & ~_blank(stop_times["departure_time"]))
+        )
+        report.check("error", "invalid_time", file, "Hora ilegible (se espera HH:MM:SS)",
+                     stop_times, unreadable, ["trip_id", "stop_sequence", "arrival_time", "departure_time"])
+    else:
+        arrival = _to_number(stop_times["arrival_time"]).to_numpy(dtype="float64")
+        departure = _to_number(stop_times["departure_time"]).to_numpy(dtype="float64")
+
+    report.check("error", "departure_before_arrival", file, "departure_time anterior a arrival_time",
+                 stop_times, departure < arrival, ["trip_id", "stop_sequence", "arrival_time", "departure_time"])
+
+    # Orden por (trip, stop_sequence) sin reordenar el DataFrame: solo una permutación
+    trip_codes, trip_values = _codes(stop_times["trip_id"])
+    order = np.lexsort((sequence, trip_codes))
+    codes_sorted = trip_codes[order]
+    seq_sorted = sequence[order]
+    same_trip = np.zeros(len(order), dtype=bool)
+    same_trip[1:] = codes_sorted[1:] == codes_sorted[:-1]
+
+    dup_sorted = same_trip.copy()
+    dup_sorted[1:] &= seq_sorted[1:] == seq_sorted[:-1]
+    dup = np.zeros(len(order), dtype=bool)
+    dup[order] = dup_sorted & ~np.isnan(seq_sorted)
+    report.check("error", "duplicate_sequence", file, "stop_sequence repetido en el mismo trip",
+                 stop_times, dup, ["trip_id", "stop_sequence"])
+
+    # Hora de entrada/salida de cada parada (la otra si falta una) y última hora conocida del trip
+    time_in = np.where(np.isnan(arrival), departure, arrival)[order]
+    time_out = np.where(np.isnan(departure), arrival, departure)[order]
+    previous = pd.Series(time_out).groupby(codes_sorted).shift()
+    previous = previous.groupby(codes_sorted).ffill().to_numpy(dtype="float64")
+    backwards_sorted = same_trip & (time_in < previous)
+    backwards = np.zeros(len(order), dtype=bool)
+    backwards[order] = backwards_sorted
+    report.check("error", "time_travel", file,
+                 "La hora retrocede respecto a la parada anterior del trip (¿cruce de medianoche sin 24:00+?)",
+                 stop_times, backwards, ["trip_id", "stop_sequence", "arrival_time", "departure_time"])
+
+    # Primera y última parada de cada trip deben tener hora
+    is_first = ~same_trip
+    is_last = np.ones(len(order), dtype=bool)
+    is_last[:-1] = codes_sorted[1:] != codes_sorted[:-1]
+    endpoint_untimed = np.zeros(len(order), dtype=bool)
+    endpoint_untimed[order] = (is_first | is_last) & np.isnan(time_in)
+    report.check("error", "missing_endpoint_time", file, "Primera o última parada del trip sin hora",
+                 stop_times, endpoint_untimed, ["trip_id", "stop_sequence"])
+
+    if trips is not None:
+        stops_per_trip = np.bincount(trip_codes[trip_codes >= 0], minlength=len(trip_values))
+        no_times = ~trips["trip_id"].isin(trip_values[stops_per_trip > 0]).to_numpy()
+        report.check("warning", "trip_without_stop_times", "trips.txt", "Trip sin stop_times",
+                     trips, no_times, ["trip_id"])
+        single = trip_values[stops_per_trip == 1]
+        report.add("warning", "trip_single_stop", file, "Trip con una sola parada", len(single),
+                   [{"trip_id": trip_id} for trip_id in single.head(MAX_SAMPLES)])
+
+
+def validate_feed_tables(tables: Dict[str, pd.DataFrame], report: ValidationReport, is_zip: bool) -> ValidationReport:
+    """Aplica todas las reglas a las tablas ya leídas."""
+    for name, df in tables.items():
+        report.counts[name] = int(len(df))
+
+    routes = tables.get("routes")
+    stops = tables.get("stops")
+    trips = tables.get("trips")
+    stop_times = tables.get("stop_times")
+
+    if stops is not None:
+        _check_stops(report, stops, is_zip)
+    if routes is not None:
+        _check_routes(report, routes)
+    service_ids = _service_ids(report, tables, is_zip)
+    shape_ids = _check_shapes(report, tables["shapes"]) if tables.get("shapes") is not None else set()
+
+    if trips is not None:
+        route_ids = routes["route_id"].dropna() if routes is not None else []
+        _check_trips(report, trips, route_ids, service_ids, shape_ids)
+    if stop_times is not None:
+        stop_ids = stops["stop_id"].dropna() if stops is not None else None
+        _check_stop_times(report, stop_times, trips, stop_ids, is_zip)
+    return report
+
+
+# --- Puntos de entrada ---
+
+def validate_gtfs_zip(gtfs_zip) -> Dict:
+    """Valida un ZIP GTFS (bytes o archivo) sin tocar la BD."""
+    started = time.perf_counter()
+    report = ValidationReport("zip")
+    with stage_timer("gtfs_validate.zip"):
+        content = gtfs_zip.read() if hasattr(gtfs_zip, "read") else gtfs_zip
+        try:
+            with ZipFile(BytesIO(content)) as zip_ref:
+                tables = read_feed_zip(zip_ref, report)
+                validate_feed_tables(tables, report, is_zip=True)
+        except Exception as e:
+            report.add("error", "unreadable_feed", "", f"No se pudo leer el ZIP: {e}", 1)
+    result = report.to_dict()
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def validate_gtfs_database(bind) -> Dict:
+    """Valida el feed vigente en la BD con las mismas reglas."""
+    started = time.perf_counter()
+    report = ValidationReport("database")
+    with stage_timer("gtfs_validate.database"):
+        validate_feed_tables(read_feed_database(bind), report, is_zip=False)
+    result = report.to_dict()
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def summarize_report(report: Dict) -> str:
+    """Resumen de una línea para mensajes de error."""
+    if report["valid"]:
+        return "Feed válido"
+    parts = [f"{issue['file'] or 'feed'}: {issue['message']} ({issue['count']})" for issue in report["errors"][:5]]
+    more = len(report["errors"]) - 5
+    return "Feed inválido — " + "; ".join(parts) + (f"; y {more} más" if more > 0 else "")
@@ -2,13 +2,167 @@
 KML Processor Service
 Procesa archivos KML y los convierte en shapes GTFS
 """
+import io
 import xml.etree.ElementTree as ET
 import re
-from typing import List, Tuple, Dict
+from typing import IO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 from math import radians, cos, sin, asin, sqrt
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, func, insert
 from sqlalchemy.orm import Session
 
 from app.models.gtfs_models import Shape
+from app.services.feed_snapshot import invalidate_feed_snapshot
+from app.services.spatial_index import haversine_m, invalidate_spatial_index
+
+
+class KMLLine(NamedTuple):
+    """Un LineString del KML: nombre del Placemark (si lo hay) y coordenadas como arreglos."""
+    name: Optional[str]
+    lats: np.ndarray
+    lons: np.ndarray
+
+
+def _local_tag(tag: str) -> str:
+    """'{http://www.opengis.net/kml/2.2}LineString' -> 'LineString'"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_coordinate_array(coord_text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parsea texto de coordenadas KML ("lon,lat[,alt] lon,lat[,alt] ...") a arreglos (lats, lons).
+    Descarta puntos no numéricos o fuera de rango.
+    """
+    tokens = coord_text.split()
+    if not tokens:
+        return np.zeros(0), np.zeros(0)
+    parts = pd.Series(tokens).str.split(',', n=2, expand=True)
+    if parts.shape[1] < 2:
+        return np.zeros(0), np.zeros(0)
+    lons = pd.to_numeric(parts[0], errors='coerce').to_numpy(dtype='float64')
+    lats = pd.to_numeric(parts[1], errors='coerce').to_numpy(dtype='float64')
+    # Las comparaciones con NaN son False: los puntos inválidos quedan fuera
+    valid = (lons >= -180) & (lons <= 180) & (lats >= -90) & (lats <= 90)
+    return lats[valid], lons[valid]
+
+
+def iter_kml_lines(source: IO[bytes]) -> Iterator[KMLLine]:
+    """
+    Recorre el KML con iterparse y entrega cada LineString en orden de documento,
+    liberando cada Placemark al terminarlo (los archivos grandes no se cargan como árbol).
+    """
+    placemark_depth = 0
+    placemark_name = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        tag = _local_tag(elem.tag)
+        if event == 'start':
+            if tag == 'Placemark':
+                placemark_depth += 1
+                placemark_name = None
+            continue
+
+        if tag == 'name' and placemark_depth and placemark_name is None:
+            placemark_name = (elem.text or '').strip() or None
+        elif tag == 'LineString':
+            coords_elem = next((child for child in elem if _local_tag(child.tag) == 'coordinates'), None)
+            if coords_elem is not None and coords_elem.text:
+                lats, lons = parse_coordinate_array(coords_elem.text)
+                if len(lats):
+                    yield KMLLine(placemark_name, lats, lons)
+            elem.clear()
+        elif tag == 'Placemark':
+            placemark_depth -= 1
+            placemark_name = None
+            elem.clear()
+
+
+def parse_kml_lines(kml_content: Union[str, bytes, IO[bytes]]) -> List[KMLLine]:
+    """Todos los LineString del KML; si el XML está mal formado, extrae los bloques <coordinates> con regex."""
+    if isinstance(kml_content, str):
+        source = io.BytesIO(kml_content.strip().encode('utf-8'))
+    elif isinstance(kml_content, bytes):
+        source = io.BytesIO(kml_content.strip())
+    else:
+        source = kml_content
+    try:
+        return list(iter_kml_lines(source))
+    except ET.ParseError:
+        source.seek(0)
+        raw = source.read()
+        text = raw.decode('utf-8', errors='ignore') if isinstance(raw, bytes) else raw
+        lines = []
+        for block in re.findall(r'<coordinates>(.*?)</coordinates>', text, re.DOTALL | re.IGNORECASE):
+            lats, lons = parse_coordinate_array(block)
+            if len(lats):
+                lines.append(KMLLine(None, lats, lons))
+        if not lines:
+            raise ValueError("No se pudieron extraer coordenadas del KML")
+        return lines
+
+
+def cumulative_distances(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distancia acumulada (m) a lo largo de la polilínea; el primer punto es 0."""
+    if len(lats) < 2:
+        return np.zeros(len(lats))
+    segments = haversine_m(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    return np.concatenate(([0.0], np.cumsum(segments)))
+
+
+def build_shape_rows(shape_id: str, lats: np.ndarray, lons: np.ndarray, precision: int = 6) -> List[Dict]:
+    """Filas de shapes.txt (mappings para un INSERT masivo) con shape_dist_traveled calculado."""
+    dists = np.round(cumulative_distances(lats, lons), 3).tolist()
+    lats = np.round(lats, precision).tolist()
+    lons = np.round(lons, precision).tolist()
+    return [
+        {
+            'shape_id': shape_id,
+            'shape_pt_lat': lat,
+            'shape_pt_lon': lon,
+            'shape_pt_sequence': idx + 1,
+            'shape_dist_traveled': dist,
+        }
+        for idx, (lat, lon, dist) in enumerate(zip(lats, lons, dists))
+    ]
+
+
+def compute_shape_rows(shape_id: str, kml_content: bytes, precision: int = 8) -> List[Dict]:
+    """
+    Parsea un KML y devuelve las filas de su primer LineString. Función de módulo
+    (sin sesión) para poder ejecutarla en un pool de procesos.
+    """
+    lines = parse_kml_lines(kml_content)
+    if not lines:
+        raise ValueError("No se encontraron coordenadas válidas en el KML")
+    return build_shape_rows(shape_id, lines[0].lats, lines[0].lons, precision)
+
+
+def replace_shape_rows(db: Session, rows_by_shape: Dict[str, List[Dict]], replace_existing: bool = True) -> Dict[str, int]:
+    """
+    Borra (en una sola sentencia) los puntos anteriores de esos shape_id e inserta
+    los nuevos en bloque. No hace commit. Devuelve {shape_id: puntos_anteriores}.
+    """
+    shape_ids = list(rows_by_shape)
+    if not shape_ids:
+        return {}
+    existing = dict(
+        db.query(Shape.shape_id, func.count(Shape.id))
+        .filter(Shape.shape_id.in_(shape_ids))
+        .group_by(Shape.shape_id)
+        .all()
+    )
+    if existing:
+        if not replace_existing:
+            raise ValueError(
+                f"El shape_id {', '.join(sorted(existing))} ya existe. Use replace_existing=True para reemplazar."
+            )
+        db.execute(delete(Shape).where(Shape.shape_id.in_(shape_ids)).execution_options(synchronize_session=False))
+
+    rows = [row for shape_rows in rows_by_shape.values() for row in shape_rows]
+    if rows:
+        db.execute(insert(Shape), rows)
+    return {shape_id: existing.get(shape_id, 0) for shape_id in shape_ids}
 
 
 class KMLProcessor:
@@ -22,96 +176,32 @@ class KMLProcessor:
     def __init__(self, db: Session):
         self.db = db
     
-    def parse_kml_content(self, kml_content: str) -> List[Tuple[float, float]]:
+    def parse_kml_content(self, kml_content: Union[str, bytes, IO[bytes]]) -> List[Tuple[float, float]]:
         """
-        Extrae coordenadas de un archivo KML
+        Extrae coordenadas del primer LineString de un archivo KML
         
         Args:
-            kml_content: Contenido del archivo KML como string
+            kml_content: Contenido del archivo KML (str, bytes o archivo binario)
             
         Returns:
             Lista de tuplas (lat, lon)
         """
-        try:
-            # Limpiar contenido
-            kml_content = kml_content.strip()
-            
-            # Intentar parsear como XML
-            root = ET.fromstring(kml_content)
-            
-            # Buscar LineString
-            linestring = root.find('.//kml:LineString', self.NAMESPACES)
-            if linestring is not None:
-                coords_elem = linestring.find('kml:coordinates', self.NAMESPACES)
-                if coords_elem is not None and coords_elem.text:
-                    return self._parse_coordinates(coords_elem.text)
-            
-            # Si no se encontró con namespace, intentar sin él
-            linestring = root.find('.//LineString')
-            if linestring is not None:
-                coords_elem = linestring.find('coordinates')
-                if coords_elem is not None and coords_elem.text:
-                    return self._parse_coordinates(coords_elem.text)
-            
-            # Buscar en Placemark
-            for placemark in root.findall('.//Placemark'):
-                linestring = placemark.find('.//LineString')
-                if linestring is not None:
-                    coords_elem = linestring.find('coordinates')
-                    if coords_elem is not None and coords_elem.text:
-                        return self._parse_coordinates(coords_elem.text)
-            
+        lines = parse_kml_lines(kml_content)
+        if not lines:
             raise ValueError("No se encontró LineString en el KML")
-            
-        except ET.ParseError as e:
-            # Si falla el parsing XML, intentar extraer coordenadas con regex
-            return self._parse_coordinates_fallback(kml_content)
+        return list(zip(lines[0].lats.tolist(), lines[0].lons.tolist()))
+    
+    def parse_kml_lines(self, kml_content: Union[str, bytes, IO[bytes]]) -> List[KMLLine]:
+        """Todos los LineString del documento (uno por Placemark en KML multi-ruta)"""
+        return parse_kml_lines(kml_content)
     
     def _parse_coordinates(self, coord_text: str) -> List[Tuple[float, float]]:
         """
         Parsea texto de coordenadas KML
         Formato: "lon,lat,elevation lon,lat,elevation ..."
         """
-        coordinates = []
-        
-        # Limpiar texto
-        coord_text = coord_text.replace('\n', ' ').replace('\t', ' ').replace('\r', ' ')
-        coord_text = re.sub(r'\s+', ' ', coord_text).strip()
-        
-        # Dividir por espacios
-        points = coord_text.split(' ')
-        
-        for point in points:
-            point = point.strip()
-            if not point:
-                continue
-            
-            parts = point.split(',')
-            if len(parts) >= 2:
-                try:
-                    lon = float(parts[0])
-                    lat = float(parts[1])
-                    
-                    # Validar coordenadas razonables
-                    if -180 <= lon <= 180 and -90 <= lat <= 90:
-                        coordinates.append((lat, lon))
-                except (ValueError, IndexError):
-                    continue
-        
-        return coordinates
-    
-    def _parse_coordinates_fallback(self, kml_content: str) -> List[Tuple[float, float]]:
-        """
-        Extrae coordenadas usando regex cuando falla el parsing XML
-        """
-        # Buscar bloque de coordenadas
-        coord_match = re.search(r'<coordinates>(.*?)</coordinates>', kml_content, re.DOTALL | re.IGNORECASE)
-        
-        if coord_match:
-            coord_text = coord_match.group(1)
-            return self._parse_coordinates(coord_text)
-        
-        raise ValueError("No se pudieron extraer coordenadas del KML")
+        lats, lons = parse_coordinate_array(coord_text)
+        return list(zip(lats.tolist(), lons.tolist()))
     
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """
@@ -136,7 +226,7 @@ class KMLProcessor:
     
     def import_kml_to_shapes(
         self, 
-        kml_content: str, 
+        kml_content: Union[str, bytes, IO[bytes]], 
         shape_id: str,
         replace_existing: bool = True
     ) -> Dict:
@@ -154,69 +244,39 @@ class KMLProcessor:
         try:
             # Parsear coordenadas
             print(f"📥 Parseando KML para shape_id: {shape_id}")
-            coordinates = self.parse_kml_content(kml_content)
+            lines = parse_kml_lines(kml_content)
             
-            if not coordinates:
+            if not lines:
                 return {
                     'success': False,
                     'error': 'No se encontraron coordenadas válidas en el KML'
                 }
             
-            print(f"✅ Encontradas {len(coordinates)} coordenadas")
+            line = lines[0]
+            print(f"✅ Encontradas {len(line.lats)} coordenadas")
             
-            # Verificar si el shape_id ya existe
-            existing_shapes = self.db.query(Shape).filter(
-                Shape.shape_id == shape_id
-            ).all()
-            
-            if existing_shapes:
-                if replace_existing:
-                    print(f"🔄 Reemplazando {len(existing_shapes)} puntos existentes del shape {shape_id}")
-                    # Eliminar shapes existentes
-                    for shape in existing_shapes:
-                        self.db.delete(shape)
-                    self.db.commit()
-                else:
-                    return {
-                        'success': False,
-                        'error': f'El shape_id {shape_id} ya existe. Use replace_existing=True para reemplazar.'
-                    }
-            
-            # Crear nuevos shapes con distancias calculadas
-            cumulative_distance = 0.0
-            shapes_created = []
-            
-            for idx, (lat, lon) in enumerate(coordinates):
-                # Calcular distancia desde el punto anterior
-                if idx > 0:
-                    prev_lat, prev_lon = coordinates[idx - 1]
-                    segment_distance = self.calculate_distance(prev_lat, prev_lon, lat, lon)
-                    cumulative_distance += segment_distance
-                
-                # Crear shape point
-                shape = Shape(
-                    shape_id=shape_id,
-                    shape_pt_lat=round(lat, 6),
-                    shape_pt_lon=round(lon, 6),
-                    shape_pt_sequence=idx + 1,
-                    shape_dist_traveled=round(cumulative_distance, 3)
-                )
-                
-                self.db.add(shape)
-                shapes_created.append(shape)
-            
-            # Commit
+            rows = build_shape_rows(shape_id, line.lats, line.lons)
+            try:
+                previous = replace_shape_rows(self.db, {shape_id: rows}, replace_existing)
+            except ValueError as e:
+                self.db.rollback()
+                return {'success': False, 'error': str(e)}
             self.db.commit()
+            invalidate_feed_snapshot()
+            invalidate_spatial_index()
             
-            print(f"✅ Importados {len(shapes_created)} puntos del shape")
-            print(f"📏 Distancia total: {cumulative_distance:.3f} km")
+            total_distance = rows[-1]['shape_dist_traveled']
+            if previous[shape_id]:
+                print(f"🔄 Reemplazados {previous[shape_id]} puntos existentes del shape {shape_id}")
+            print(f"✅ Importados {len(rows)} puntos del shape")
+            print(f"📏 Distancia total: {total_distance:.3f} km")
             
             return {
                 'success': True,
                 'shape_id': shape_id,
-                'points_imported': len(shapes_created),
-                'total_distance_km': round(cumulative_distance, 3),
-                'replaced': len(existing_shapes) > 0
+                'points_imported': len(rows),
+                'total_distance_km': round(total_distance, 3),
+                'replaced': previous[shape_id] > 0
             }
             
         except Exception as e:
@@ -229,6 +289,70 @@ class KMLProcessor:
                 'error': str(e)
             }
     
+    def import_kml_document(
+        self,
+        kml_content: Union[str, bytes, IO[bytes]],
+        shape_ids: Optional[List[str]] = None,
+        shape_id_prefix: str = "shape",
+        replace_existing: bool = True
+    ) -> Dict:
+        """
+        Importa un KML con varios Placemarks (una ruta/sentido por LineString) en una sola transacción.
+        
+        El shape_id de cada línea sale de shape_ids (en orden), si no del nombre del
+        Placemark, y si no de "{shape_id_prefix}_{n}".
+        """
+        try:
+            lines = parse_kml_lines(kml_content)
+            if not lines:
+                return {'success': False, 'error': 'No se encontraron coordenadas válidas en el KML'}
+            if shape_ids is not None and len(shape_ids) != len(lines):
+                return {
+                    'success': False,
+                    'error': f'El KML tiene {len(lines)} líneas pero se indicaron {len(shape_ids)} shape_ids'
+                }
+            
+            rows_by_shape: Dict[str, List[Dict]] = {}
+            for n, line in enumerate(lines, start=1):
+                shape_id = shape_ids[n - 1] if shape_ids is not None else (line.name or f"{shape_id_prefix}_{n}")
+                # Nombres de Placemark repetidos: sufijo para no mezclar puntos de dos líneas
+                base, k = shape_id, 2
+                while shape_id in rows_by_shape:
+                    shape_id, k = f"{base}_{k}", k + 1
+                rows_by_shape[shape_id] = build_shape_rows(shape_id, line.lats, line.lons)
+            
+            print(f"📥 KML con {len(lines)} líneas -> shapes {', '.join(rows_by_shape)}")
+            try:
+                previous = replace_shape_rows(self.db, rows_by_shape, replace_existing)
+            except ValueError as e:
+                self.db.rollback()
+                return {'success': False, 'error': str(e)}
+            self.db.commit()
+            invalidate_feed_snapshot()
+            invalidate_spatial_index()
+            
+            shapes = [
+                {
+                    'shape_id': shape_id,
+                    'points_imported': len(rows),
+                    'total_distance_km': round(rows[-1]['shape_dist_traveled'], 3),
+                    'replaced': previous[shape_id] > 0
+                }
+                for shape_id, rows in rows_by_shape.items()
+            ]
+            print(f"✅ Importados {sum(s['points_imported'] for s in shapes)} puntos en {len(shapes)} shapes")
+            return {'success': True, 'shapes': shapes}
+        
+        except Exception as e:
+            self.db.rollback()
+            print(f"❌ Error importando KML: {e}")
+            import traceback
+            traceback.print_exc()
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
     def get_shape_info(self, shape_id: str) -> Dict:
         """
         Obtiene información de un shape existente
@@ -270,11 +394,8 @@ def validate_kml_content(kml_content: str) -> Dict:
             }
         
         # Calcular distancia total estimada
-        total_distance = 0.0
-        for i in range(1, len(coordinates)):
-            lat1, lon1 = coordinates[i-1]
-            lat2, lon2 = coordinates[i]
-            total_distance += processor.calculate_distance(lat1, lon1, lat2, lon2)
+        lats, lons = np.array(coordinates).T
+        total_distance = float(cumulative_distances(lats, lons)[-1])
         
         return {
             'valid': True,
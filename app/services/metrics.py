@@ -0,0 +1,218 @@
+# app/services/metrics.py
+
+"""
+Instrumentación de rendimiento expuesta en formato de texto de Prometheus.
+
+- http_request_duration_seconds: latencia por método, ruta (plantilla) y estado
+- stage_duration_seconds: etapas internas de los servicios (stage_timer)
+- db_statement_duration_seconds: sentencias SQL por engine y operación
+
+Registro propio en memoria (sin prometheus_client). Cada proceso de uvicorn
+tiene su propio registro; Prometheus suma las series de cada worker.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos; cubren desde un SELECT por PK hasta una importación completa
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# Operaciones SQL con etiqueta propia; el resto se agrupa en OTHER
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "CREATE", "DROP", "ALTER", "PRAGMA"}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_float(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """Histograma acumulado por combinación de etiquetas (seguro entre hilos)."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # etiquetas -> [conteos por bucket, suma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban etiquetas {self.labelnames}")
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(total de observaciones, suma) por combinación de etiquetas."""
+        with self._lock:
+            return {labels: (count, total) for labels, (_, total, count) in self._series.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total, count in sorted(snapshot):
+            pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels)]
+            base = ",".join(pairs)
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{_format_float(bound)}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            suffix = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {_format_float(total)}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP.", ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Duración de las etapas internas de los servicios.", ("stage",)
+)
+DB_STATEMENT_SECONDS = Histogram(
+    "db_statement_duration_seconds", "Duración de las sentencias SQL.", ("engine", "operation"), SQL_BUCKETS
+)
+
+REGISTRY = (HTTP_REQUEST_SECONDS, STAGE_SECONDS, DB_STATEMENT_SECONDS)
+
+
+def render_metrics() -> str:
+    """Todas las métricas en formato de exposición de texto de Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Temporizadores de etapa ---
+
+class stage_timer:
+    """
+    Mide una etapa y la registra en stage_duration_seconds.
+
+    Como context manager (expone .elapsed en segundos al salir):
+        with stage_timer("gtfs_import.stop_times") as timer:
+            ...
+        print(f"{timer.elapsed:.2f}s")
+
+    Como decorador:
+        @stage_timer("consolidate_sheet")
+        def consolidate_sheet(...): ...
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.elapsed: Optional[float] = None
+        self._started: Optional[float] = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._started
+        STAGE_SECONDS.observe(self.elapsed, self.stage)
+        return False
+
+    def __call__(self, func):
+        # Un temporizador nuevo por llamada: el decorador se comparte entre hilos
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(self.stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+# --- SQLAlchemy ---
+
+_instrumented_engines = set()
+
+
+def _sql_operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Registra duración y operación de cada sentencia ejecutada por el engine (síncrono)."""
+    if id(engine) in _instrumented_engines:
+        return
+    _instrumented_engines.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # El contexto es propio de cada ejecución; si la sentencia falla simplemente se descarta
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            DB_STATEMENT_SECONDS.observe(time.perf_counter() - started, name, _sql_operation(statement))
+
+
+# --- ASGI ---
+
+def _route_label(scope) -> str:
+    """Plantilla de la ruta resuelta (/api/stops/{stop_id}); acota la cardinalidad de la etiqueta."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que registra la latencia de cada petición HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # El router escribe la ruta resuelta en el mismo scope
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], _route_label(scope), str(status["code"])
+            )
@@ -0,0 +1,197 @@
+# app/services/scheduling_engine.py
+
+"""
+Motor nativo del libro de programación (Oferta Comercial / Flota Variable /
+Tiempos de ciclo).
+
+Reemplaza el viaje de ida y vuelta a Excel (xlwings): las tablas de entrada
+(1: horario, 2: flota variable, 3: tiempos de recorrido) se convierten en
+escalones ordenados y cada fórmula se evalúa en bloque con NumPy:
+
+- tabla4: intervalos de paso en Centro (headway = ciclo / buses vigentes)
+- tabla5: intervalos de paso en Barrio (llegadas desde Centro)
+- tabla6: tiempos Centro→Barrio agrupados
+- tabla7: tiempos Barrio→Centro agrupados
+
+Es el mismo modelo que IntervalProcessor (migración del VBA), sin bucles
+por minuto ni búsquedas binarias por salida.
+"""
+
+from datetime import datetime, time as dt_time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from app.utils.gtfs_time import parse_gtfs_time
+
+DEFAULT_HEADWAY = 60  # minutos, cuando no hay buses o ciclo vigente
+MAX_DEPARTURES = 500  # límite de seguridad (igual que IntervalProcessor)
+
+
+class Steps(NamedTuple):
+    """Función escalonada: valores[i] vigente desde breaks[i] (minutos)."""
+    breaks: np.ndarray
+    values: np.ndarray
+
+    def at(self, minutes) -> np.ndarray:
+        """Valor vigente en cada minuto; antes del primer escalón vale el primero."""
+        if not len(self.breaks):
+            return np.zeros(np.shape(minutes), dtype="int64")
+        idx = np.searchsorted(self.breaks, minutes, side="right") - 1
+        return self.values[np.clip(idx, 0, None)]
+
+
+class SchedulingInputs(NamedTuple):
+    start: int
+    end: int
+    end_barrio: Optional[int]
+    fleet: Steps
+    time_cb: Steps
+    time_bc: Steps
+
+
+def to_minutes(value: Any) -> int:
+    """
+    'HH:MM[:SS]', datetime/time o fracción de día (celda de Excel) → minutos.
+    Vacío o inválido → 0, como en la versión VBA.
+    """
+    if value is None or value == "":
+        return 0
+    if isinstance(value, (datetime, dt_time)):
+        return value.hour * 60 + value.minute
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(round(float(value) * 1440))
+    seconds = parse_gtfs_time(str(value).strip())
+    return seconds // 60 if seconds is not None else 0
+
+
+def minutes_to_time(minutes: int) -> str:
+    """90 -> '01:30' (admite más de 24 h)."""
+    minutes = int(minutes)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _steps(rows: Sequence[Dict[str, Any]], key_from: Sequence[str], key_value: Sequence[str], as_time: bool) -> Steps:
+    """Escalones ordenados (orden estable: con 'desde' repetido gana la última fila, igual que la búsqueda binaria)."""
+    def pick(row, keys):
+        return next((row[k] for k in keys if k in row), "")
+
+    breaks = np.array([to_minutes(pick(row, key_from)) for row in rows], dtype="int64")
+    if as_time:
+        values = np.array([to_minutes(pick(row, key_value)) for row in rows], dtype="int64")
+    else:
+        values = np.array([int(float(pick(row, key_value) or 0)) for row in rows], dtype="int64")
+    order = np.argsort(breaks, kind="stable")
+    return Steps(breaks[order], values[order])
+
+
+def normalize_parameters(parameters: Dict[str, Any]) -> SchedulingInputs:
+    """
+    Acepta los dos contratos de entrada:
+    - /scheduling: tabla2 {desde, buses}, tabla3 {desde, tiempoCB, tiempoBC}
+    - /excel:      tabla2 {hora, buses},  tabla3 {hora, tCicloAB, tCicloBA}
+    """
+    tabla1 = parameters.get("tabla1") or {}
+    tabla2 = parameters.get("tabla2") or []
+    tabla3 = parameters.get("tabla3") or []
+    end_barrio = tabla1.get("horaFinBarrio")
+    return SchedulingInputs(
+        start=to_minutes(tabla1.get("horaInicioCentro")),
+        end=to_minutes(tabla1.get("horaFinCentro")),
+        end_barrio=to_minutes(end_barrio) if end_barrio else None,
+        fleet=_steps(tabla2, ("desde", "hora"), ("buses",), as_time=False),
+        time_cb=_steps(tabla3, ("desde", "hora"), ("tiempoCB", "tCicloAB"), as_time=True),
+        time_bc=_steps(tabla3, ("desde", "hora"), ("tiempoBC", "tCicloBA"), as_time=True),
+    )
+
+
+# --- Fórmulas ---
+
+def centro_departures(inputs: SchedulingInputs):
+    """
+    Salidas desde Centro y su headway. El headway de cada minuto del día se
+    calcula en bloque; recorrer las salidas es solo indexar ese arreglo.
+    """
+    if inputs.end <= inputs.start:
+        return np.zeros(0, dtype="int64"), np.zeros(0, dtype="int64")
+
+    minutes = np.arange(inputs.start, inputs.end)
+    buses = inputs.fleet.at(minutes)
+    cycle = inputs.time_cb.at(minutes) + inputs.time_bc.at(minutes)
+    active = (buses > 0) & (cycle > 0)
+    headway = np.where(active, np.round(cycle / np.where(buses > 0, buses, 1)), DEFAULT_HEADWAY)
+    headway = np.maximum(headway, 1).astype("int64").tolist()
+
+    departures, headways = [], []
+    minute = inputs.start
+    while minute < inputs.end and len(departures) < MAX_DEPARTURES:
+        h = headway[minute - inputs.start]
+        departures.append(minute)
+        headways.append(h)
+        minute += h
+    if len(departures) >= MAX_DEPARTURES:
+        print(f"⚠️ Límite de {MAX_DEPARTURES} salidas alcanzado en Centro")
+    return np.array(departures, dtype="int64"), np.array(headways, dtype="int64")
+
+
+def barrio_arrivals(inputs: SchedulingInputs, departures: np.ndarray):
+    """Llegadas a Barrio (salida + tiempo CB vigente) y headway entre llegadas consecutivas."""
+    if not len(departures):
+        return departures, departures
+    arrivals = departures + inputs.time_cb.at(departures)
+    if len(arrivals) == 1:
+        return arrivals, np.array([DEFAULT_HEADWAY], dtype="int64")
+    gaps = np.maximum(np.diff(arrivals), 1)
+    # El último headway repite el anterior (como en VBA)
+    return arrivals, np.append(gaps, gaps[-1])
+
+
+def _group_starts(values: np.ndarray) -> np.ndarray:
+    """Índices donde empieza cada racha de valores iguales."""
+    return np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+
+
+def group_intervals(minutes: np.ndarray, headways: np.ndarray) -> List[Dict[str, Any]]:
+    """Rachas de headway igual; el "hasta" de un grupo es el "desde" del siguiente."""
+    if not len(minutes):
+        return []
+    starts = _group_starts(headways)
+    ends = np.append(minutes[starts[1:]], minutes[-1])
+    return [
+        {"desde": minutes_to_time(minutes[s]), "hasta": minutes_to_time(e), "headway": int(headways[s])}
+        for s, e in zip(starts.tolist(), ends.tolist())
+    ]
+
+
+def group_travel_times(minutes: np.ndarray, steps: Steps, last_until: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Rachas de tiempo de recorrido igual; el "hasta" es la última salida del grupo."""
+    if not len(minutes):
+        return []
+    times = steps.at(minutes)
+    starts = _group_starts(times)
+    ends = np.append(minutes[starts[1:] - 1], minutes[-1] if last_until is None else last_until)
+    return [
+        {"desde": minutes_to_time(minutes[s]), "hasta": minutes_to_time(e), "tiempo": minutes_to_time(times[s])}
+        for s, e in zip(starts.tolist(), ends.tolist())
+    ]
+
+
+def compute_schedule(parameters: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Tablas 4–7 a partir de las tablas 1–3."""
+    inputs = normalize_parameters(parameters)
+    departures, headways_centro = centro_departures(inputs)
+    arrivals, headways_barrio = barrio_arrivals(inputs, departures)
+    return {
+        "tabla4": group_intervals(departures, headways_centro),
+        "tabla5": group_intervals(arrivals, headways_barrio),
+        "tabla6": group_travel_times(departures, inputs.time_cb),
+        "tabla7": group_travel_times(arrivals, inputs.time_bc, inputs.end_barrio),
+    }
+
+
+def to_sheet_rows(tables: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[List[Any]]]:
+    """Formato de filas [desde, hasta, valor] que devolvía la lectura de rangos del libro."""
+    return {
+        name: [[row["desde"], row["hasta"], row.get("headway", row.get("tiempo"))] for row in rows]
+        for name, rows in tables.items()
+    }
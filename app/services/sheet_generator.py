@@ -2,6 +2,8 @@ import pandas as pd
 from datetime import datetime, time, timedelta
 from typing import List, Dict, Any, Optional
 
+from app.services.metrics import stage_timer
+
 # --- Constantes (valores por defecto) ---
 DEFAULT_IDLE_THRESHOLD_MIN = 30
 DEFAULT_MAX_WAIT_MINUTES_PAIRING = 15
@@ -193,6 +195,7 @@ class BusFleet:
 # FUNCIÓN 1: Generar Viajes Crudos (CON RASTREO DE BUSES)
 # -----------------------------------------------------------------
 
+@stage_timer("sheet.generate")
 def generate_sheet_from_tables(
     tabla1_data: Dict,
     headways_centro: List[Dict], # Tabla 4
@@ -241,7 +244,10 @@ def generate_sheet_from_tables(
             current_time = start_loop
             while current_time <= end_loop:
                 all_departures.add((current_time, "A"))
-                current_time = add_minutes(current_time, headway_min)
+                next_time = add_minutes(current_time, headway_min)
+                if next_time <= current_time:  # cruzó la medianoche: add_minutes da la vuelta
+                    break
+                current_time = next_time
 
     # Salidas B -> A (Barrio)
     if start_b and end_b:
@@ -259,13 +265,17 @@ def generate_sheet_from_tables(
             current_time = start_loop
             while current_time <= end_loop:
                 all_departures.add((current_time, "B"))
-                current_time = add_minutes(current_time, headway_min)
+                next_time = add_minutes(current_time, headway_min)
+                if next_time <= current_time:  # cruzó la medianoche: add_minutes da la vuelta
+                    break
+                current_time = next_time
     
     if not all_departures:
         return []
 
-    # 3. Ordenar partidas cronológicamente
-    sorted_departures = sorted(list(all_departures), key=lambda x: x[0])
+    # 3. Ordenar partidas cronológicamente (empates: Centro antes que Barrio; el orden
+    #    de iteración del set varía entre procesos y cambiaba la asignación de buses)
+    sorted_departures = sorted(all_departures)
 
     # 4. Inicializar flota de buses
     fleet = BusFleet(idle_threshold_min=idle_threshold)
@@ -331,6 +341,7 @@ def generate_sheet_from_tables(
 # FUNCIÓN 2: Consolidar Sábana (Puerto de ConsolidarTimetable)
 # -----------------------------------------------------------------
 
+@stage_timer("sheet.consolidate")
 def consolidate_sheet(raw_trips: List[Dict[str, Any]], max_wait_minutes: int = DEFAULT_MAX_WAIT_MINUTES_PAIRING) -> List[Dict[str, Any]]:
     """
     Consolida la lista de viajes crudos en una sábana final.
@@ -0,0 +1,313 @@
+# app/services/spatial_index.py
+
+"""
+Índice espacial para paradas y puntos de shape.
+
+Las coordenadas se proyectan a metros (equirectangular local) y se reparten en
+una grilla de celdas; una consulta solo revisa las celdas que cubren el radio
+buscado y calcula haversine exacto sobre esos candidatos. Así "paradas cerca
+de este punto" o "vértice de shape más cercano" dejan de recorrer toda la tabla.
+
+El índice se construye perezosamente (desde el snapshot del feed si existe,
+si no desde la BD) y se invalida al escribir stops / shapes; los demás workers
+lo reconstruyen al cambiar la versión compartida (cache_versions).
+"""
+
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.models.gtfs_models import Shape, Stop
+from app.services.cache_versions import SPATIAL_CACHE, SharedCacheVersion
+
+EARTH_RADIUS_M = 6371000.0
+DEFAULT_CELL_SIZE_M = 250.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distancia haversine en metros (acepta escalares o arreglos NumPy)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def nearest_point_index(lats: np.ndarray, lons: np.ndarray, lat: float, lon: float, start: int = 0) -> Tuple[Optional[int], float]:
+    """
+    Índice (>= start) del punto más cercano de una polilínea y su distancia en metros.
+    Ante empates devuelve el primero, igual que un recorrido secuencial con '<'.
+    """
+    if start >= len(lats):
+        return None, float("inf")
+    distances = haversine_m(lat, lon, lats[start:], lons[start:])
+    local = int(np.argmin(distances))
+    return start + local, float(distances[local])
+
+
+class GridIndex:
+    """Grilla de celdas sobre coordenadas proyectadas (metros)."""
+
+    def __init__(self, lats, lons, cell_size_m: float = DEFAULT_CELL_SIZE_M):
+        self.lats = np.asarray(lats, dtype="float64")
+        self.lons = np.asarray(lons, dtype="float64")
+        self.cell_size = float(cell_size_m)
+        valid = ~(np.isnan(self.lats) | np.isnan(self.lons))
+        self.cos_lat0 = math.cos(math.radians(float(np.mean(self.lats[valid])))) if valid.any() else 1.0
+
+        x, y = self._project(self.lats, self.lons)
+        cx = np.floor(x / self.cell_size).astype("int64")
+        cy = np.floor(y / self.cell_size).astype("int64")
+
+        # Índices agrupados por celda: order[start:end] son los puntos de la celda (cx, cy)
+        candidates = np.flatnonzero(valid)
+        order = candidates[np.lexsort((cy[candidates], cx[candidates]))]
+        self._order = order
+        self._cells: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        if len(order):
+            keys = np.stack((cx[order], cy[order]), axis=1)
+            boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(order)]))
+            for s, e in zip(starts.tolist(), ends.tolist()):
+                self._cells[(int(keys[s, 0]), int(keys[s, 1]))] = (s, e)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def _project(self, lats, lons):
+        x = np.radians(lons) * EARTH_RADIUS_M * self.cos_lat0
+        y = np.radians(lats) * EARTH_RADIUS_M
+        return x, y
+
+    def _candidates(self, lat: float, lon: float, radius_m: float) -> np.ndarray:
+        x, y = self._project(lat, lon)
+        # Margen: la proyección local difiere levemente de haversine lejos de lat0
+        reach = radius_m * 1.05 + self.cell_size
+        x0, x1 = int(math.floor((x - reach) / self.cell_size)), int(math.floor((x + reach) / self.cell_size))
+        y0, y1 = int(math.floor((y - reach) / self.cell_size)), int(math.floor((y + reach) / self.cell_size))
+
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            # Radio mayor que la red: más barato revisar celdas existentes
+            spans = [span for (cx, cy), span in self._cells.items() if x0 <= cx <= x1 and y0 <= cy <= y1]
+        else:
+            spans = [
+                self._cells[(cx, cy)]
+                for cx in range(x0, x1 + 1)
+                for cy in range(y0, y1 + 1)
+                if (cx, cy) in self._cells
+            ]
+        if not spans:
+            return np.zeros(0, dtype="int64")
+        return np.concatenate([self._order[s:e] for s, e in spans])
+
+    def within(self, lat: float, lon: float, radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(índices, distancias en m) de los puntos a <= radius_m, ordenados por distancia."""
+        candidates = self._candidates(lat, lon, radius_m)
+        if not len(candidates):
+            return candidates, np.zeros(0)
+        distances = haversine_m(lat, lon, self.lats[candidates], self.lons[candidates])
+        mask = distances <= radius_m
+        candidates, distances = candidates[mask], distances[mask]
+        order = np.argsort(distances, kind="stable")
+        return candidates[order], distances[order]
+
+    def nearest(self, lat: float, lon: float, k: int = 1, max_radius_m: Optional[float] = None):
+        """k vecinos más cercanos expandiendo el radio (duplicándolo) hasta tener k candidatos."""
+        if not len(self):
+            return np.zeros(0, dtype="int64"), np.zeros(0)
+        radius = self.cell_size
+        limit = max_radius_m if max_radius_m is not None else 2 * math.pi * EARTH_RADIUS_M
+        while True:
+            radius = min(radius, limit)
+            indices, distances = self.within(lat, lon, radius)
+            if len(indices) >= k or radius >= limit:
+                return indices[:k], distances[:k]
+            radius *= 2
+
+
+class SpatialIndex:
+    """Paradas + puntos de shape indexados; se construye una vez y se reutiliza."""
+
+    def __init__(self, stop_ids, stop_names, stop_lats, stop_lons, shape_ids, shape_offsets, shape_lats, shape_lons, shape_dists):
+        self.stop_ids = np.asarray(stop_ids)
+        self.stop_names = np.asarray(stop_names)
+        self.stops = GridIndex(stop_lats, stop_lons)
+
+        self.shape_ids = np.asarray(shape_ids)
+        self.shape_offsets = np.asarray(shape_offsets, dtype="int64")
+        self.shape_lats = np.asarray(shape_lats, dtype="float64")
+        self.shape_lons = np.asarray(shape_lons, dtype="float64")
+        self.shape_dists = np.asarray(shape_dists, dtype="float64")
+        self._shape_pos = {str(sid): i for i, sid in enumerate(self.shape_ids.tolist())}
+        # shape (código) de cada vértice, para la búsqueda global
+        self._vertex_shape = np.repeat(np.arange(len(self.shape_ids)), np.diff(self.shape_offsets)) if len(self.shape_ids) else np.zeros(0, dtype="int64")
+        self.shape_points = GridIndex(self.shape_lats, self.shape_lons)
+
+    # --- Paradas ---
+
+    def stops_nearby(self, lat: float, lon: float, radius_m: float, limit: int = 20) -> List[Dict]:
+        indices, distances = self.stops.within(lat, lon, radius_m)
+        return [self._stop_dict(i, d) for i, d in zip(indices[:limit].tolist(), distances[:limit].tolist())]
+
+    def nearest_stops(self, lat: float, lon: float, k: int = 1, max_radius_m: Optional[float] = None) -> List[Dict]:
+        indices, distances = self.stops.nearest(lat, lon, k, max_radius_m)
+        return [self._stop_dict(i, d) for i, d in zip(indices.tolist(), distances.tolist())]
+
+    def stop_coords(self, stop_id: int) -> Optional[Tuple[float, float]]:
+        """(lat, lon) de una parada; stop_ids viene ordenado, así que es una búsqueda binaria."""
+        pos = int(np.searchsorted(self.stop_ids, stop_id))
+        if pos >= len(self.stop_ids) or self.stop_ids[pos] != stop_id:
+            return None
+        lat, lon = float(self.stops.lats[pos]), float(self.stops.lons[pos])
+        if math.isnan(lat) or math.isnan(lon):
+            return None
+        return lat, lon
+
+    def _stop_dict(self, idx: int, distance: float) -> Dict:
+        return {
+            "stop_id": int(self.stop_ids[idx]),
+            "stop_name": str(self.stop_names[idx]),
+            "stop_lat": float(self.stops.lats[idx]),
+            "stop_lon": float(self.stops.lons[idx]),
+            "distance_m": round(float(distance), 1),
+        }
+
+    # --- Shapes ---
+
+    def shape_slice(self, shape_id: str):
+        pos = self._shape_pos.get(str(shape_id))
+        if pos is None:
+            return None
+        return self.shape_offsets[pos], self.shape_offsets[pos + 1]
+
+    def snap_to_shape(self, shape_id: str, lat: float, lon: float, start: int = 0) -> Optional[Dict]:
+        """Vértice más cercano del shape (desde el vértice 'start' en adelante)."""
+        bounds = self.shape_slice(shape_id)
+        if bounds is None:
+            return None
+        s, e = bounds
+        idx, distance = nearest_point_index(self.shape_lats[s:e], self.shape_lons[s:e], lat, lon, start)
+        if idx is None:
+            return None
+        return {
+            "shape_id": str(shape_id),
+            "vertex_index": idx,
+            "shape_pt_lat": float(self.shape_lats[s + idx]),
+            "shape_pt_lon": float(self.shape_lons[s + idx]),
+            "shape_dist_traveled": float(self.shape_dists[s + idx]) if not np.isnan(self.shape_dists[s + idx]) else None,
+            "distance_m": round(distance, 1),
+        }
+
+    def nearest_shape_vertex(self, lat: float, lon: float, max_radius_m: Optional[float] = None) -> Optional[Dict]:
+        """Vértice más cercano entre todos los shapes."""
+        indices, distances = self.shape_points.nearest(lat, lon, 1, max_radius_m)
+        if not len(indices):
+            return None
+        vertex = int(indices[0])
+        pos = int(self._vertex_shape[vertex])
+        return {
+            "shape_id": str(self.shape_ids[pos]),
+            "vertex_index": vertex - int(self.shape_offsets[pos]),
+            "shape_pt_lat": float(self.shape_lats[vertex]),
+            "shape_pt_lon": float(self.shape_lons[vertex]),
+            "distance_m": round(float(distances[0]), 1),
+        }
+
+
+def _from_snapshot(snapshot) -> SpatialIndex:
+    return SpatialIndex(
+        snapshot["stops_stop_id"], snapshot["stops_stop_name"], snapshot["stops_stop_lat"], snapshot["stops_stop_lon"],
+        snapshot["shapes_shape_id"], snapshot["shapes_offsets"], snapshot["shape_points_lat"],
+        snapshot["shape_points_lon"], snapshot["shape_points_dist"],
+    )
+
+
+def _from_rows(stop_rows, shape_rows) -> SpatialIndex:
+    stop_ids = [r[0] for r in stop_rows]
+    stop_names = [r[1] or "" for r in stop_rows]
+    stop_lats = [float(r[2]) if r[2] is not None else np.nan for r in stop_rows]
+    stop_lons = [float(r[3]) if r[3] is not None else np.nan for r in stop_rows]
+
+    shape_ids, offsets, lats, lons, dists = [], [0], [], [], []
+    current = None
+    for shape_id, lat, lon, dist in shape_rows:
+        if shape_id != current:
+            if current is not None:
+                offsets.append(len(lats))
+            shape_ids.append(str(shape_id))
+            current = shape_id
+        lats.append(float(lat) if lat is not None else np.nan)
+        lons.append(float(lon) if lon is not None else np.nan)
+        dists.append(float(dist) if dist is not None else np.nan)
+    if current is not None:
+        offsets.append(len(lats))
+    return SpatialIndex(stop_ids, stop_names, stop_lats, stop_lons, shape_ids, offsets, lats, lons, dists)
+
+
+def _stops_query():
+    return select(Stop.stop_id, Stop.stop_name, Stop.stop_lat, Stop.stop_lon).order_by(Stop.stop_id)
+
+
+def _shapes_query():
+    return (
+        select(Shape.shape_id, Shape.shape_pt_lat, Shape.shape_pt_lon, Shape.shape_dist_traveled)
+        .where(Shape.shape_id.isnot(None))
+        .order_by(Shape.shape_id, Shape.shape_pt_sequence)
+    )
+
+
+# --- Caché ---
+
+# (versión compartida con la que se construyó, índice)
+_index: Optional[Tuple[int, SpatialIndex]] = None
+_index_lock = threading.Lock()
+_shared_version = SharedCacheVersion(SPATIAL_CACHE)
+
+
+def invalidate_spatial_index() -> None:
+    """Llamar tras el commit que escribe stops / shapes (avisa también a los demás workers)."""
+    global _index
+    with _index_lock:
+        _index = None
+    _shared_version.bump()
+
+
+def _snapshot_index() -> Optional[SpatialIndex]:
+    from app.services.feed_snapshot import get_feed_snapshot
+    snapshot = get_feed_snapshot()
+    return _from_snapshot(snapshot) if snapshot is not None else None
+
+
+def get_spatial_index(db) -> SpatialIndex:
+    """Índice cacheado (sesión síncrona)."""
+    global _index
+    version = _shared_version.current(db)
+    with _index_lock:
+        if _index is None or _index[0] != version:
+            index = _snapshot_index() or _from_rows(db.execute(_stops_query()).all(), db.execute(_shapes_query()).all())
+            _index = (version, index)
+            print(f"🗺️ Índice espacial construido ({len(index.stops)} paradas, {len(index.shape_points)} puntos de shape)")
+        return _index[1]
+
+
+async def get_spatial_index_async(db) -> SpatialIndex:
+    """Índice cacheado (sesión async de lectura)."""
+    global _index
+    version = await _shared_version.current_async(db)
+    cached = _index
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    index = _snapshot_index()
+    if index is None:
+        stop_rows = (await db.execute(_stops_query())).all()
+        shape_rows = (await db.execute(_shapes_query())).all()
+        index = _from_rows(stop_rows, shape_rows)
+    with _index_lock:
+        if _index is None or _index[0] != version:
+            _index = (version, index)
+            print(f"🗺️ Índice espacial construido ({len(index.stops)} paradas, {len(index.shape_points)} puntos de shape)")
+        return _index[1]
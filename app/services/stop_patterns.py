@@ -0,0 +1,129 @@
+# app/services/stop_patterns.py
+
+"""
+Patrones canónicos de paradas por (ruta, sentido).
+
+El patrón de un sentido es la secuencia de paradas de su trip más largo.
+Se materializa en route_stop_patterns al escribir trips/stop_times, de modo
+que /api/route_stops/ lo lee con una consulta indexada; si aún no existe,
+se resuelve con una única consulta con ventana (ROW_NUMBER) sin listas IN.
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.gtfs_models import Stop, StopTime, Trip
+from app.models.pattern_models import RouteStopPattern
+
+
+def _longest_trips(route_ids: Optional[Iterable[str]] = None, direction_id: Optional[int] = None,
+                   per_direction: bool = True):
+    """
+    Subconsulta con el trip más largo (más stop_times) por ruta (y sentido).
+    Desempate por trip_id para que el resultado sea estable.
+    """
+    stop_count = func.count(StopTime.id)
+    partition = [Trip.route_id, Trip.direction_id] if per_direction else [Trip.route_id]
+    stmt = (
+        select(
+            Trip.route_id.label("route_id"),
+            Trip.direction_id.label("direction_id"),
+            StopTime.trip_id.label("trip_id"),
+            stop_count.label("stop_count"),
+            func.row_number().over(
+                partition_by=partition,
+                order_by=(stop_count.desc(), StopTime.trip_id)
+            ).label("rn"),
+        )
+        .join(Trip, Trip.trip_id == StopTime.trip_id)
+        .group_by(Trip.route_id, Trip.direction_id, StopTime.trip_id)
+    )
+    if route_ids is not None:
+        stmt = stmt.where(Trip.route_id.in_(list(route_ids)))
+    if direction_id is not None:
+        stmt = stmt.where(Trip.direction_id == direction_id)
+    return stmt.subquery("longest")
+
+
+def route_stops_fallback_query(route_id: str, direction_id: Optional[int] = None):
+    """Paradas del trip más largo de la ruta (o del sentido) en una sola consulta."""
+    longest = _longest_trips([route_id], direction_id, per_direction=False)
+    return (
+        select(
+            Stop.stop_id, Stop.stop_name, StopTime.stop_sequence, Stop.stop_lat, Stop.stop_lon
+        )
+        .select_from(longest)
+        .join(StopTime, StopTime.trip_id == longest.c.trip_id)
+        .join(Stop, Stop.stop_id == StopTime.stop_id)
+        .where(longest.c.rn == 1)
+        .order_by(StopTime.stop_sequence)
+    )
+
+
+def route_stops_pattern_query(route_id: str, direction_id: Optional[int] = None):
+    """
+    Paradas desde el patrón materializado. Sin sentido se usa el patrón más
+    largo de la ruta (equivale al trip más largo entre todos los sentidos).
+    """
+    stmt = (
+        select(
+            Stop.stop_id, Stop.stop_name, RouteStopPattern.stop_sequence, Stop.stop_lat, Stop.stop_lon
+        )
+        .join(Stop, Stop.stop_id == RouteStopPattern.stop_id)
+        .where(RouteStopPattern.route_id == route_id)
+    )
+    if direction_id is not None:
+        stmt = stmt.where(RouteStopPattern.direction_id == direction_id)
+    else:
+        best_trip = (
+            select(RouteStopPattern.trip_id)
+            .where(RouteStopPattern.route_id == route_id)
+            .order_by(RouteStopPattern.stop_count.desc(), RouteStopPattern.trip_id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        stmt = stmt.where(RouteStopPattern.trip_id == best_trip)
+    return stmt.order_by(RouteStopPattern.stop_sequence)
+
+
+def refresh_stop_patterns(db: Session, route_ids: Optional[Iterable[str]] = None) -> int:
+    """
+    Recalcula los patrones de las rutas indicadas (todas si route_ids es None)
+    con un DELETE + INSERT ... SELECT. No hace commit: se integra en la
+    transacción de la escritura que lo dispara.
+    """
+    if route_ids is not None:
+        route_ids = [str(r) for r in route_ids if r is not None]
+        if not route_ids:
+            return 0
+
+    delete_stmt = delete(RouteStopPattern)
+    if route_ids is not None:
+        delete_stmt = delete_stmt.where(RouteStopPattern.route_id.in_(route_ids))
+    db.execute(delete_stmt, execution_options={"synchronize_session": False})
+
+    longest = _longest_trips(route_ids)
+    source = (
+        select(
+            longest.c.route_id,
+            longest.c.direction_id,
+            longest.c.trip_id,
+            longest.c.stop_count,
+            StopTime.stop_sequence,
+            StopTime.stop_id,
+            func.current_timestamp(),
+        )
+        .select_from(longest)
+        .join(StopTime, StopTime.trip_id == longest.c.trip_id)
+        .where(longest.c.rn == 1, StopTime.stop_id.isnot(None))
+    )
+    result = db.execute(
+        insert(RouteStopPattern).from_select(
+            ["route_id", "direction_id", "trip_id", "stop_count", "stop_sequence", "stop_id", "updated_at"],
+            source
+        )
+    )
+    print(f"🧭 Patrones de paradas recalculados ({result.rowcount} filas)")
+    return result.rowcount
@@ -0,0 +1,223 @@
+# app/services/timetable_engine.py
+
+"""
+Motor columnar para horarios empalmados (IDA/VUELTA).
+
+Los stop_times llegan como tuplas (trip_id, stop_id, segundos) y se pivotan
+una sola vez a una matriz trips × paradas. Cada horario se arma reindexando
+esa matriz con el orden de corridas y se formatea columna a columna, en bloque.
+La misma matriz sirve para la respuesta JSON y para la descarga CSV/XLSX.
+"""
+
+import io
+import re
+from collections import defaultdict, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from app.utils.gtfs_time import format_gtfs_time_series
+
+
+def get_bus_number_from_block(block_id: Optional[str]) -> Optional[int]:
+    if not block_id:
+        return None
+    try:
+        block_str = str(block_id)
+
+        # Buscar patrón: número después de punto (.) o guión bajo (_)
+        # Ejemplos: "block_1.5" -> 5, "block_1_5" -> 5, "R1_05" -> 5
+
+        # Primero intenta con punto
+        match_dot = re.search(r'\.(\d+)$', block_str)
+        if match_dot:
+            return int(match_dot.group(1))
+
+        # Si no hay punto, intenta con guión bajo
+        match_underscore = re.search(r'_(\d+)$', block_str)
+        if match_underscore:
+            return int(match_underscore.group(1))
+
+        # Si no encuentra ninguno, devolver None
+        return None
+    except:
+        return None
+
+
+def pivot_stop_times(rows: Iterable[Tuple[str, Any, Optional[int]]]):
+    """
+    Pivota tuplas (trip_id, stop_id, segundos), ordenadas por trip y stop_sequence,
+    a una matriz trip_id × stop_id (str).
+
+    Devuelve (matriz, primera_hora_por_trip). Si una parada se repite en un trip
+    gana la última pasada, igual que el armado por diccionarios anterior.
+    """
+    df = pd.DataFrame(list(rows), columns=['trip_id', 'stop_id', 'seconds'])
+    df = df.dropna(subset=['seconds'])
+    if df.empty:
+        return pd.DataFrame(dtype='float64'), {}
+
+    df['stop_id'] = df['stop_id'].astype(str)
+    first_times = df.groupby('trip_id', sort=False)['seconds'].first().astype(int).to_dict()
+    wide = df.drop_duplicates(['trip_id', 'stop_id'], keep='last').pivot(
+        index='trip_id', columns='stop_id', values='seconds'
+    )
+    return wide, first_times
+
+
+def build_column_layout(
+    all_stops_s1: List[str],
+    all_stops_s2: List[str],
+    selected_stop_ids: List[str],
+    stops_dict: Dict[str, str]
+):
+    """Encabezados y claves de columna: solo las paradas seleccionadas, en el orden de cada sentido."""
+    selected = set(selected_stop_ids)
+    headers = ["Corridas", "Bus"]
+    column_keys = []
+
+    for prefix, suffix, stops in (("s1", "S1", all_stops_s1), ("s2", "S2", all_stops_s2)):
+        for stop_id in stops:
+            key = f"{prefix}_{stop_id}"
+            # Una parada repetida en el patrón (bucles) comparte columna
+            if stop_id in selected and key not in column_keys:
+                headers.append(f"{stops_dict[stop_id]} ({suffix})")
+                column_keys.append(key)
+
+    return headers, column_keys
+
+
+def chain_trips(trips_ida: List[Dict[str, Any]], trips_vuelta: List[Dict[str, Any]]):
+    """
+    Empalma cada IDA con la primera VUELTA libre del mismo block que sale después.
+
+    Ambas listas deben venir ordenadas por start_time. Cada block tiene una cola
+    ordenada de VUELTAs: las que salen antes (o a la vez) que la IDA actual ya no
+    pueden empalmarse con ninguna IDA posterior, así que se descartan de la cola
+    (quedan como "VUELTA sin IDA"). Coste O(ida + vuelta) en lugar de O(ida × vuelta).
+
+    Devuelve pares (ida, vuelta) ordenados por hora de salida; cualquiera de los dos puede ser None.
+    """
+    vuelta_queues = defaultdict(deque)
+    for vtrip in trips_vuelta:
+        vuelta_queues[vtrip["block_id"]].append(vtrip)
+
+    pairs = []
+    used_vuelta = set()
+    for ida_trip in trips_ida:
+        queue = vuelta_queues.get(ida_trip["block_id"])
+        vuelta_trip = None
+        if queue:
+            while queue and queue[0]["start_time"] <= ida_trip["start_time"]:
+                queue.popleft()
+            if queue:
+                vuelta_trip = queue.popleft()
+                used_vuelta.add(vuelta_trip["trip_id"])
+        pairs.append((ida_trip, vuelta_trip))
+
+    # VUELTA sin IDA
+    for vuelta_trip in trips_vuelta:
+        if vuelta_trip["trip_id"] not in used_vuelta:
+            pairs.append((None, vuelta_trip))
+
+    # Orden estable por hora de salida de la corrida (IDA si existe, si no la VUELTA)
+    pairs.sort(key=lambda pair: (pair[0] or pair[1])["start_time"])
+    return pairs
+
+
+def build_timetable_matrix(
+    trips: List[Dict[str, Any]],
+    wide: pd.DataFrame,
+    first_times: Dict[str, int],
+    column_keys: List[str]
+):
+    """
+    Separa por sentido, empalma y arma la matriz corridas × columnas (segundos).
+
+    Devuelve (pares, matriz). La matriz usa column_keys como columnas y tiene
+    una fila por corrida, en el orden final.
+    """
+    trips_ida = []
+    trips_vuelta = []
+    for trip in trips:
+        if trip["trip_id"] not in first_times:
+            continue
+        trip["start_time"] = first_times[trip["trip_id"]]
+        if trip["direction_id"] == 0:
+            trips_ida.append(trip)
+        else:
+            trips_vuelta.append(trip)
+
+    trips_ida.sort(key=lambda t: t["start_time"])
+    trips_vuelta.sort(key=lambda t: t["start_time"])
+
+    print(f"✅ IDA: {len(trips_ida)}, VUELTA: {len(trips_vuelta)}")
+
+    pairs = chain_trips(trips_ida, trips_vuelta)
+
+    blocks = []
+    for prefix, side in (("s1_", 0), ("s2_", 1)):
+        keys = [key for key in column_keys if key.startswith(prefix)]
+        row_ids = [pair[side]["trip_id"] if pair[side] else None for pair in pairs]
+        block = wide.reindex(index=row_ids, columns=[key[len(prefix):] for key in keys])
+        block.columns = keys
+        blocks.append(block.reset_index(drop=True))
+
+    matrix = pd.concat(blocks, axis=1).reindex(columns=column_keys)
+    return pairs, matrix
+
+
+def format_matrix(matrix: pd.DataFrame) -> pd.DataFrame:
+    """Formatea la matriz de segundos a "HH:MM" en bloque; las celdas vacías quedan en None."""
+    formatted = pd.DataFrame(
+        {key: format_gtfs_time_series(matrix[key], with_seconds=False) for key in matrix.columns},
+        index=matrix.index,
+        columns=matrix.columns
+    ).astype(object)
+    return formatted.where(formatted != '', None)
+
+
+def build_corridas(pairs, formatted: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Filas del horario en el formato JSON que consume el frontend."""
+    records = formatted.to_dict('records')
+    corridas = []
+    for idx, ((ida_trip, vuelta_trip), times) in enumerate(zip(pairs, records)):
+        lead = ida_trip or vuelta_trip
+        corridas.append({
+            "id": f"ida_{ida_trip['trip_id']}" if ida_trip else f"vuelta_{vuelta_trip['trip_id']}",
+            "bus": get_bus_number_from_block(lead["block_id"]),
+            "times": times,
+            "corrida_num": idx + 1,
+        })
+    return corridas
+
+
+def timetable_to_frame(timetable: Dict[str, Any]) -> pd.DataFrame:
+    """Tabla imprimible (encabezados legibles) a partir de un horario ya calculado."""
+    headers = timetable["headers"]
+    column_keys = timetable["stop_ids_ordered"]
+    rows = [
+        [corrida["corrida_num"], corrida["bus"]] + [corrida["times"].get(key) for key in column_keys]
+        for corrida in timetable["corridas"]
+    ]
+    return pd.DataFrame(rows, columns=headers)
+
+
+def export_timetables(timetables: List[Dict[str, Any]], file_format: str) -> bytes:
+    """Serializa uno o varios horarios a CSV (una sección por servicio) o XLSX (una hoja por servicio)."""
+    if file_format == "xlsx":
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            for timetable in timetables:
+                # Nombres de hoja: máx. 31 caracteres y sin caracteres reservados
+                sheet_name = re.sub(r'[\[\]:*?/\\]', '_', str(timetable["service_id"]))[:31] or "Horario"
+                timetable_to_frame(timetable).to_excel(writer, sheet_name=sheet_name, index=False)
+        return buffer.getvalue()
+
+    frames = []
+    for timetable in timetables:
+        frame = timetable_to_frame(timetable)
+        if len(timetables) > 1:
+            frame.insert(0, "Servicio", timetable["service_id"])
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True).to_csv(index=False, na_rep="").encode("utf-8-sig")
@@ -0,0 +1,111 @@
+# app/utils/gtfs_time.py
+
+"""
+Conversión entre tiempos GTFS ("HH:MM:SS", admite horas >= 24) y segundos
+enteros desde el inicio del día de servicio.
+
+Los stop_times se almacenan como enteros (segundos), por lo que ordenar,
+filtrar por rangos y hacer aritmética se resuelve directamente en SQL.
+"""
+
+import re
+from datetime import time, timedelta
+from typing import Any, Optional
+
+SECONDS_PER_DAY = 24 * 3600
+
+_TIME_PATTERN = re.compile(r'^\s*(\d{1,3})[:_](\d{1,2})(?:[:_](\d{1,2}))?(?:\.\d+)?\s*$')
+
+
+def parse_gtfs_time(value: Any) -> Optional[int]:
+    """
+    Convierte un tiempo GTFS a segundos totales (sin normalizar a 24h).
+
+    Acepta strings "HH:MM" / "HH:MM:SS" (también con '_' como separador),
+    objetos time/timedelta y números (interpretados como segundos).
+    Devuelve None para valores vacíos o inválidos.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    if isinstance(value, (int, float)):
+        if value != value:  # NaN
+            return None
+        return int(value)
+
+    match = _TIME_PATTERN.match(str(value))
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds or 0)
+
+
+def format_gtfs_time(total_seconds: Optional[int], with_seconds: bool = True) -> Optional[str]:
+    """Convierte segundos totales a "HH:MM:SS" (o "HH:MM"); las horas pueden ser >= 24."""
+    if total_seconds is None:
+        return None
+    try:
+        total_seconds = int(total_seconds)
+    except (TypeError, ValueError):
+        return None
+    if total_seconds < 0:
+        return None
+
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    if not with_seconds:
+        return f"{hours:02d}:{minutes:02d}"
+    seconds = total_seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def parse_gtfs_time_series(series):
+    """
+    Versión vectorizada de parse_gtfs_time para una Serie de pandas de strings.
+    Devuelve una Serie Int64 (nullable) con los segundos totales.
+    """
+    import pandas as pd
+
+    parts = series.astype('string').str.extract(
+        r'^\s*(\d{1,3})[:_](\d{1,2})(?:[:_](\d{1,2}))?(?:\.\d+)?\s*$'
+    )
+    hours = pd.to_numeric(parts[0], errors='coerce')
+    minutes = pd.to_numeric(parts[1], errors='coerce')
+    seconds = pd.to_numeric(parts[2], errors='coerce').fillna(0)
+    return (hours * 3600 + minutes * 60 + seconds).astype('Int64')
+
+
+def format_gtfs_time_series(series, with_seconds: bool = True):
+    """
+    Versión vectorizada de format_gtfs_time. Los nulos se convierten en ''.
+    """
+    import pandas as pd
+
+    values = pd.to_numeric(series, errors='coerce').astype('Int64')
+    valid = (values.fillna(-1) >= 0).astype(bool)
+    safe = values.where(valid, 0).astype('int64')
+
+    hours = (safe // 3600).astype(str).str.zfill(2)
+    minutes = ((safe % 3600) // 60).astype(str).str.zfill(2)
+    formatted = hours + ':' + minutes
+    if with_seconds:
+        formatted = formatted + ':' + (safe % 60).astype(str).str.zfill(2)
+    return formatted.where(valid, '')
+
+
+def unwrap_midnight_series(seconds, groups):
+    """
+    Corrige, una sola vez al importar, tiempos que "retroceden" dentro de un
+    mismo viaje (p. ej. 23:50 -> 00:10) sumando 24h desde el retroceso en adelante.
+
+    'seconds' y 'groups' (trip_id) deben venir ordenados por trip y stop_sequence.
+    """
+    previous = seconds.groupby(groups).shift().groupby(groups).ffill()
+    wrapped = (seconds < previous).fillna(False).astype(int)
+    wraps = wrapped.groupby(groups).cumsum()
+    return seconds + wraps * SECONDS_PER_DAY
@@ -0,0 +1,65 @@
+# app/utils/xlsx_reader.py
+
+"""
+Lectura en streaming de hojas XLSX a columnas.
+
+openpyxl en modo read-only entrega las filas una a una sin cargar el árbol
+completo del libro; cada valor se agrega al búfer de su columna (solo las
+columnas pedidas) y al final se arma un DataFrame de texto. Equivale a
+pd.read_excel(..., dtype=str) con una fracción de la memoria.
+"""
+
+import io
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+
+def _cell_text(value: Any):
+    """Texto de una celda con las mismas reglas que read_excel(dtype=str); vacía → NaN."""
+    if value is None or value == "":
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def read_xlsx_columns(
+    content: bytes,
+    columns: Optional[Iterable[str]] = None,
+    sheet_name: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Lee la hoja (activa por defecto) como DataFrame de texto; celdas vacías → NaN.
+
+    Si se indican columns, solo se guardan esas columnas (las que existan en el
+    encabezado); las filas completamente vacías se descartan.
+    """
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.active
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame(columns=list(columns or []), dtype=object)
+
+        names = [str(value).strip() if value is not None else "" for value in header]
+        wanted = set(columns) if columns is not None else {name for name in names if name}
+        positions = [(i, name) for i, name in enumerate(names) if name in wanted]
+        # Primera aparición de cada encabezado
+        seen = set()
+        positions = [(i, name) for i, name in positions if not (name in seen or seen.add(name))]
+
+        buffers: Dict[str, List[Any]] = {name: [] for _, name in positions}
+        for row in rows:
+            values = [_cell_text(row[i]) if i < len(row) else np.nan for i, _ in positions]
+            if all(v is np.nan for v in values):
+                continue
+            for (_, name), value in zip(positions, values):
+                buffers[name].append(value)
+    finally:
+        workbook.close()
+
+    return pd.DataFrame({name: pd.Series(values, dtype=object) for name, values in buffers.items()})
@@ -0,0 +1 @@
+# Benchmarks y generador de feeds sintéticos
@@ -0,0 +1,315 @@
+# benchmarks/run_benchmarks.py
+
+"""
+Suite de benchmarks de extremo a extremo sobre feeds sintéticos.
+
+Por cada escala se lanza un proceso nuevo con su propia BD SQLite temporal
+(la configuración se lee al importar app.*, y así el pico de RSS es el de esa
+escala). En cada proceso:
+
+1. importación del ZIP (GTFSImporter.import_gtfs)
+2. exportación (export_gtfs_zip)
+3. endpoints de lectura: routes-with-details, route_stops, departures,
+   generate_chained_timetable (una llamada en frío + N repeticiones)
+
+Resultado en JSON: throughput, latencias (frío, media, p50, p95), etapas
+internas (stage_timer), sentencias SQL y pico de RSS.
+
+Uso:
+    python benchmarks/run_benchmarks.py --scales small,medium -o bench.json
+    python benchmarks/run_benchmarks.py --scales small --compare bench_base.json
+    python benchmarks/run_benchmarks.py --scales medium --no-snapshot   # lecturas desde la BD
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.synthetic_feed import SCALES, build_gtfs_zip, describe
+
+DEFAULT_REPEAT = 5
+SERVICE_DATE = "2025-03-03"  # lunes dentro del calendario sintético
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso (None si la plataforma no lo expone)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KiB; macOS, bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def latency_summary(samples):
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+    }
+
+
+# --- Proceso por escala ---
+
+async def _call_with_async_db(endpoint, **kwargs):
+    from app.database import get_async_db
+
+    sessions = get_async_db()
+    db = await sessions.__anext__()
+    try:
+        return await endpoint(db=db, **kwargs)
+    finally:
+        await sessions.aclose()
+
+
+async def _export(export_endpoint, db) -> int:
+    """Genera el ZIP y consume la respuesta en streaming; devuelve su tamaño."""
+    response = await export_endpoint(db=db)
+    size = 0
+    async for chunk in response.body_iterator:
+        size += len(chunk)
+    return size
+
+
+async def _measure(call, repeat):
+    """Una llamada en frío y `repeat` en caliente (call devuelve una corrutina)."""
+    started = time.perf_counter()
+    await call()
+    cold = time.perf_counter() - started
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return {"cold_ms": round(cold * 1000, 2), **latency_summary(samples)}
+
+
+async def _measure_endpoints(calls, repeat):
+    # Un solo event loop: las conexiones async del pool quedan ligadas al loop que las abrió
+    return {name: await _measure(call, repeat) for name, call in calls.items()}
+
+
+def run_scale(scale: str, repeat: int) -> dict:
+    """Ejecuta la suite para una escala (en el proceso actual, con la BD ya configurada por entorno)."""
+    from sqlalchemy import select
+
+    from app.main import create_tables
+    from app.database import SessionLocal
+    from app.models.gtfs_models import Route, StopTime, Trip
+    from app.services.gtfs_importer import GTFSImporter
+    from app.services.metrics import DB_STATEMENT_SECONDS, STAGE_SECONDS
+    from app.api.export_gtfs import export_gtfs_zip
+    from app.api.gtfs import get_routes_with_details
+    from app.api.timetables import generate_chained_timetable, get_route_stops, get_stop_departures
+
+    spec = SCALES[scale]
+    sizes = describe(spec)
+    started = time.perf_counter()
+    feed = build_gtfs_zip(spec)
+    result = {
+        "spec": spec._asdict(),
+        "feed": {**sizes, "zip_bytes": len(feed), "generate_s": round(time.perf_counter() - started, 2)},
+    }
+    print(f"📦 [{scale}] feed sintético: {sizes}")
+
+    create_tables()
+    STAGE_SECONDS.clear()
+    DB_STATEMENT_SECONDS.clear()
+
+    # 1. Importación
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        outcome = GTFSImporter(db).import_gtfs(feed)
+        elapsed = time.perf_counter() - started
+        if outcome.get("status") != "success":
+            raise RuntimeError(f"La importación falló: {outcome}")
+        result["import"] = {
+            "seconds": round(elapsed, 3),
+            "stop_times_per_s": round(sizes["stop_times"] / elapsed),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        print(f"📥 [{scale}] importación: {elapsed:.2f}s")
+
+        # 2. Exportación
+        started = time.perf_counter()
+        zip_size = asyncio.run(_export(export_gtfs_zip, db))
+        elapsed = time.perf_counter() - started
+        result["export"] = {
+            "seconds": round(elapsed, 3),
+            "stop_times_per_s": round(sizes["stop_times"] / elapsed),
+            "zip_bytes": zip_size,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        print(f"📤 [{scale}] exportación: {elapsed:.2f}s")
+
+        # Parámetros de lectura: primera ruta y paradas de su sentido 0
+        route_id = db.execute(select(Route.route_id).order_by(Route.route_id)).scalars().first()
+        trip_id = db.execute(
+            select(Trip.trip_id).where(Trip.route_id == route_id, Trip.direction_id == 0).order_by(Trip.trip_id)
+        ).scalars().first()
+        pattern = [
+            str(stop_id) for stop_id in db.execute(
+                select(StopTime.stop_id).where(StopTime.trip_id == trip_id).order_by(StopTime.stop_sequence)
+            ).scalars()
+        ]
+    finally:
+        db.close()
+
+    selected = [pattern[0], pattern[len(pattern) // 2], pattern[-1]]
+    # Los endpoints se llaman directamente: hay que pasar todos los parámetros (los Query() no aplican)
+    calls = {
+        "routes_with_details": lambda: _call_with_async_db(get_routes_with_details),
+        "route_stops": lambda: _call_with_async_db(get_route_stops, route_id=route_id, direction_id=0),
+        "stop_departures": lambda: _call_with_async_db(
+            get_stop_departures, stop_id=int(pattern[0]), after="07:00",
+            service_date=SERVICE_DATE, limit=10, route_id=None
+        ),
+        "generate_chained_timetable": lambda: _call_with_async_db(
+            generate_chained_timetable, route_id=route_id, service_id=["LV"], selected_stop_ids=selected
+        ),
+    }
+    result["endpoints"] = asyncio.run(_measure_endpoints(calls, repeat))
+    for name, metrics in result["endpoints"].items():
+        print(f"⏱️ [{scale}] {name}: frío {metrics['cold_ms']}ms, p50 {metrics['p50_ms']}ms")
+
+    result["stages"] = {
+        labels[0]: {"count": count, "seconds": round(total, 3)}
+        for labels, (count, total) in sorted(STAGE_SECONDS.totals().items())
+    }
+    result["sql"] = {
+        f"{engine}.{operation}": {"count": count, "seconds": round(total, 3)}
+        for (engine, operation), (count, total) in sorted(DB_STATEMENT_SECONDS.totals().items())
+    }
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+# --- Orquestación ---
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def spawn_scale(scale: str, repeat: int, snapshot: bool) -> dict:
+    """Corre una escala en un proceso hijo con BD y snapshot temporales."""
+    with tempfile.TemporaryDirectory(prefix=f"bench_{scale}_", ignore_cleanup_errors=True) as workdir:
+        workdir = Path(workdir)
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{(workdir / 'bench.db').as_posix()}",
+            "DATABASE_READ_URL": f"sqlite:///{(workdir / 'bench.db').as_posix()}",
+            "FEED_SNAPSHOT_DIR": str(workdir / "feed_snapshot"),
+            "FEED_SNAPSHOT_ENABLED": "true" if snapshot else "false",
+            "SECRET_KEY": env.get("SECRET_KEY", "benchmark"),
+        })
+        output = workdir / "result.json"
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--worker", scale,
+               "--repeat", str(repeat), "--worker-output", str(output)]
+        completed = subprocess.run(cmd, env=env, cwd=ROOT)
+        if completed.returncode != 0:
+            return {"error": f"el proceso terminó con código {completed.returncode}"}
+        return json.loads(output.read_text(encoding="utf-8"))
+
+
+def _flatten(data, prefix=""):
+    """{'import': {'seconds': 1}} -> {'import.seconds': 1} (solo números)."""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+COMPARED_SUFFIXES = ("seconds", "_ms", "peak_rss_mb", "_per_s")
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """Imprime la variación de cada métrica respecto a una corrida anterior."""
+    print("=" * 70)
+    print(f"Comparación con {baseline.get('commit') or 'línea base'} ({baseline.get('timestamp')})")
+    for scale, result in current["scales"].items():
+        base = baseline.get("scales", {}).get(scale)
+        if not base or "error" in result or "error" in base:
+            continue
+        print(f"\n[{scale}]")
+        now_flat, base_flat = _flatten(result), _flatten(base)
+        for name, value in now_flat.items():
+            if name.startswith(("spec.", "feed.", "stages.", "sql.")) or not name.endswith(COMPARED_SUFFIXES):
+                continue
+            previous = base_flat.get(name)
+            if not previous:
+                continue
+            change = (value - previous) / previous * 100
+            # Para throughput, subir es mejorar
+            better = change > 0 if name.endswith("_per_s") else change < 0
+            marker = "✅" if abs(change) < 5 or better else "⚠️"
+            print(f"  {marker} {name}: {previous} -> {value} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de importación, exportación y lectura")
+    parser.add_argument("--scales", default="small", help=f"Lista separada por comas de: {', '.join(SCALES)}")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--no-snapshot", action="store_true", help="Desactiva el snapshot compilado del feed")
+    parser.add_argument("-o", "--output", default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--compare", default=None, help="JSON de una corrida anterior")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = run_scale(args.worker, args.repeat)
+        Path(args.worker_output).write_text(json.dumps(result, indent=2), encoding="utf-8")
+        return 0
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"Escalas desconocidas: {', '.join(unknown)}")
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "snapshot": not args.no_snapshot,
+        "repeat": args.repeat,
+        "scales": {scale: spawn_scale(scale, args.repeat, not args.no_snapshot) for scale in scales},
+    }
+
+    output = args.output or f"bench_{report['commit'] or 'local'}.json"
+    Path(output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"💾 Resultados en {output}")
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+    return 1 if any("error" in r for r in report["scales"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
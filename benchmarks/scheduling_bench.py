@@ -0,0 +1,242 @@
+# benchmarks/scheduling_bench.py
+
+"""
+Micro-benchmark y corpus de paridad del núcleo de programación (port del VBA).
+
+Cada caso de data/scheduling_corpus/*.json guarda tablas 1–3 con forma real y
+las salidas "golden" de cada etapa:
+
+    intervals   IntervalProcessor.calculate_intervals      -> tablas 4–7
+    raw_trips   generate_sheet_from_tables (+ BusFleet)     -> viajes crudos
+    sheet       consolidate_sheet                           -> sábana final
+
+Por caso se informa el tiempo de cada etapa (mínimo de N repeticiones) y se
+compara contra el golden; cualquier diferencia termina con código 1. La etapa
+"fleet" repite solo la asignación de buses de BusFleet sobre los viajes crudos.
+
+Uso:
+    python benchmarks/scheduling_bench.py                 # paridad + tiempos
+    python benchmarks/scheduling_bench.py --scaling 2,4,8,16,32,48
+    python benchmarks/scheduling_bench.py --update        # regrabar goldens (cambio intencional)
+    python benchmarks/scheduling_bench.py -o sched.json   # guardar tiempos y curva
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+from datetime import time as dt_time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(ROOT))
+
+from app.services.interval_processor import IntervalProcessor
+from app.services.sheet_generator import (
+    DEFAULT_IDLE_THRESHOLD_MIN,
+    DEFAULT_MAX_WAIT_MINUTES_PAIRING,
+    BusFleet,
+    consolidate_sheet,
+    generate_sheet_from_tables,
+)
+
+CORPUS_DIR = ROOT / "data" / "scheduling_corpus"
+INTERVAL_TABLES = ("tabla4", "tabla5", "tabla6", "tabla7")
+STAGES = ("intervals", "generate", "fleet", "consolidate")
+DEFAULT_REPEAT = 3
+
+
+def _serialize(value):
+    return value.strftime("%H:%M") if isinstance(value, dt_time) else value
+
+
+def serialize_trips(raw_trips):
+    return [{key: _serialize(value) for key, value in trip.items()} for trip in raw_trips]
+
+
+def replay_fleet(raw_trips, idle_threshold):
+    """Repite solo la asignación de buses (BusFleet) en el orden de generación; devuelve los BusID."""
+    fleet = BusFleet(idle_threshold_min=idle_threshold)
+    bus_ids = []
+    for trip in raw_trips:
+        other = "B" if trip["Origin"] == "A" else "A"
+        bus_id = fleet.find_best_available_bus(trip["DepartureTime"], trip["Origin"])
+        if bus_id is None:
+            bus_id = fleet.create_bus(other, trip["DepartFromDest"])
+        else:
+            fleet.update_bus(bus_id, other, trip["DepartFromDest"])
+        bus_ids.append(bus_id)
+    return bus_ids
+
+
+def run_pipeline(parameters):
+    """Corre las cuatro etapas una vez; devuelve (salidas serializables, segundos por etapa)."""
+    tabla1 = parameters["tabla1"]
+    timings = {}
+    processor = IntervalProcessor()
+    processor.debug = False
+
+    # Los print() de las etapas no deben pesar en la medición
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        intervals = processor.calculate_intervals(parameters)
+        timings["intervals"] = time.perf_counter() - started
+        if not intervals["success"]:
+            raise ValueError(intervals.get("error"))
+
+        started = time.perf_counter()
+        raw_trips = generate_sheet_from_tables(tabla1, *(intervals[name] for name in INTERVAL_TABLES))
+        timings["generate"] = time.perf_counter() - started
+        # consolidate_sheet reordena la lista en su lugar
+        raw_snapshot = serialize_trips(raw_trips)
+
+        started = time.perf_counter()
+        fleet_ids = replay_fleet(raw_trips, int(tabla1.get("idle_threshold", DEFAULT_IDLE_THRESHOLD_MIN)))
+        timings["fleet"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        sheet = consolidate_sheet(raw_trips, int(tabla1.get("max_wait_minutes_pairing", DEFAULT_MAX_WAIT_MINUTES_PAIRING)))
+        timings["consolidate"] = time.perf_counter() - started
+
+    outputs = {
+        "intervals": {name: intervals[name] for name in INTERVAL_TABLES},
+        "raw_trips": raw_snapshot,
+        "sheet": sheet,
+        "buses": max((trip["BusID"] for trip in raw_snapshot), default=0),
+    }
+    if fleet_ids != [trip["BusID"] for trip in raw_snapshot]:
+        outputs["fleet_mismatch"] = True
+    return outputs, timings
+
+
+def benchmark(parameters, repeat):
+    """Salidas de la primera corrida y el mínimo por etapa de `repeat` corridas."""
+    outputs, best = run_pipeline(parameters)
+    for _ in range(repeat - 1):
+        _, timings = run_pipeline(parameters)
+        best = {stage: min(best[stage], timings[stage]) for stage in STAGES}
+    return outputs, best
+
+
+def _first_difference(expected, actual, path=""):
+    """Ruta y valores de la primera diferencia (None si son iguales)."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in list(expected) + [k for k in actual if k not in expected]:
+            diff = _first_difference(expected.get(key), actual.get(key), f"{path}.{key}" if path else key)
+            if diff:
+                return diff
+        return None
+    if isinstance(expected, list) and isinstance(actual, list):
+        for i, (exp, act) in enumerate(zip(expected, actual)):
+            diff = _first_difference(exp, act, f"{path}[{i}]")
+            if diff:
+                return diff
+        if len(expected) != len(actual):
+            return f"{path}: {len(actual)} elementos, se esperaban {len(expected)}"
+        return None
+    if expected != actual:
+        return f"{path}: {actual!r} != {expected!r} (esperado)"
+    return None
+
+
+def check_corpus(cases_dir: Path, repeat: int, update: bool):
+    """Paridad y tiempos de cada caso; devuelve (número de fallas, filas del reporte)."""
+    failures = 0
+    report = []
+    for path in sorted(cases_dir.glob("*.json")):
+        case = json.loads(path.read_text(encoding="utf-8"))
+        outputs, timings = benchmark(case["parameters"], repeat)
+        row = {
+            "case": path.stem,
+            "departures": len(outputs["raw_trips"]),
+            "buses": outputs["buses"],
+            **{f"{stage}_ms": round(timings[stage] * 1000, 3) for stage in STAGES},
+        }
+        report.append(row)
+
+        if outputs.pop("fleet_mismatch", False):
+            failures += 1
+            print(f"❌ {path.stem}: BusFleet asignó buses distintos a generate_sheet_from_tables")
+            continue
+
+        if update:
+            case["expected"] = outputs
+            path.write_text(json.dumps(case, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+            print(f"💾 {path.stem}: golden actualizado ({row['departures']} viajes, {row['buses']} buses)")
+            continue
+
+        diff = _first_difference(case.get("expected", {}), outputs)
+        if diff:
+            failures += 1
+            print(f"❌ {path.stem}: {diff}")
+        else:
+            stage_times = ", ".join(f"{stage} {row[f'{stage}_ms']:.1f}ms" for stage in STAGES)
+            print(f"✅ {path.stem}: {row['departures']} viajes, {row['buses']} buses — {stage_times}")
+    return failures, report
+
+
+def scaling_parameters(buses: int):
+    """Día de 05:00 a 23:00 con flota constante: más buses => más salidas."""
+    return {
+        "tabla1": {
+            "horaInicioCentro": "05:00", "horaFinCentro": "23:00",
+            "horaInicioBarrio": "05:45", "horaFinBarrio": "23:45",
+            "dwellCentro": 5, "dwellBarrio": 5,
+        },
+        "tabla2": [{"desde": "05:00", "buses": buses}],
+        "tabla3": [
+            {"desde": "05:00", "tiempoCB": "00:45", "tiempoBC": "00:40"},
+            {"desde": "07:00", "tiempoCB": "00:55", "tiempoBC": "00:50"},
+            {"desde": "10:00", "tiempoCB": "00:45", "tiempoBC": "00:40"},
+            {"desde": "17:00", "tiempoCB": "00:58", "tiempoBC": "00:52"},
+            {"desde": "20:00", "tiempoCB": "00:40", "tiempoBC": "00:35"},
+        ],
+    }
+
+
+def scaling_curve(bus_counts, repeat):
+    """Salidas vs. tiempo por etapa al aumentar la flota."""
+    curve = []
+    print(f"\n{'buses':>6} {'viajes':>7} " + " ".join(f"{stage + ' ms':>15}" for stage in STAGES))
+    for buses in bus_counts:
+        outputs, timings = benchmark(scaling_parameters(buses), repeat)
+        point = {"buses": buses, "departures": len(outputs["raw_trips"]),
+                 **{f"{stage}_ms": round(timings[stage] * 1000, 3) for stage in STAGES}}
+        curve.append(point)
+        print(f"{buses:>6} {point['departures']:>7} " + " ".join(f"{point[f'{stage}_ms']:>15.2f}" for stage in STAGES))
+    return curve
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark y paridad del núcleo de programación")
+    parser.add_argument("cases_dir", nargs="?", default=str(CORPUS_DIR))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--update", action="store_true", help="Regraba las salidas golden con el código actual")
+    parser.add_argument("--scaling", default=None, help="Flotas para la curva de escalado, p. ej. 2,4,8,16,32")
+    parser.add_argument("-o", "--output", default=None, help="Archivo JSON con tiempos y curva")
+    args = parser.parse_args(argv)
+
+    cases_dir = Path(args.cases_dir)
+    if not any(cases_dir.glob("*.json")):
+        print(f"⚠️ No hay casos en {cases_dir}")
+        return 1
+
+    failures, report = check_corpus(cases_dir, max(1, args.repeat), args.update)
+    curve = scaling_curve([int(b) for b in args.scaling.split(",")], max(1, args.repeat)) if args.scaling else None
+
+    total = len(report)
+    print("=" * 70)
+    print(f"{total - failures}/{total} casos con paridad")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"cases": report, "scaling": curve}, indent=2), encoding="utf-8")
+        print(f"💾 Resultados en {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+# benchmarks/synthetic_feed.py
+
+"""
+Generador determinista de feeds GTFS sintéticos para benchmarks.
+
+Con la misma especificación (y semilla) produce siempre el mismo ZIP:
+- stops: nube de paradas alrededor de un centro urbano
+- routes: corredores rectos que recorren las paradas más cercanas a una línea
+- shapes: trazado por sentido, densificado entre paradas
+- trips/stop_times: salidas uniformes entre 05:00 y 23:00 por sentido
+
+Uso:
+    python benchmarks/synthetic_feed.py --scale medium -o feed.zip
+    python benchmarks/synthetic_feed.py --routes 40 --stops 3000 --trips-per-day 120 -o feed.zip
+"""
+
+import argparse
+import io
+import sys
+import zipfile
+from pathlib import Path
+from typing import Dict, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.gtfs_time import format_gtfs_time_series
+
+CENTER_LAT, CENTER_LON = 19.4326, -99.1332
+METERS_PER_DEG_LAT = 111_320.0
+SERVICE_START = 5 * 3600
+SERVICE_END = 23 * 3600
+SPEED_MPS = 20 / 3.6
+DWELL_SECONDS = 20
+
+
+class FeedSpec(NamedTuple):
+    routes: int = 10
+    stops: int = 500
+    trips_per_day: int = 100      # por ruta, ambos sentidos, servicio entre semana
+    stops_per_trip: int = 25
+    shape_points_per_segment: int = 5  # puntos del trazado entre paradas consecutivas
+    radius_km: float = 12.0
+    seed: int = 42
+
+
+SCALES: Dict[str, FeedSpec] = {
+    "small": FeedSpec(routes=5, stops=200, trips_per_day=40, stops_per_trip=15),
+    "medium": FeedSpec(routes=30, stops=2000, trips_per_day=120, stops_per_trip=30),
+    "large": FeedSpec(routes=120, stops=8000, trips_per_day=200, stops_per_trip=40, shape_points_per_segment=8),
+}
+
+
+def _to_meters(lat, lon):
+    x = (lon - CENTER_LON) * METERS_PER_DEG_LAT * np.cos(np.radians(CENTER_LAT))
+    y = (lat - CENTER_LAT) * METERS_PER_DEG_LAT
+    return x, y
+
+
+def _stops(spec: FeedSpec, rng) -> pd.DataFrame:
+    # Exponente > 0.5: más paradas cerca del centro (0.5 sería uniforme por área)
+    radius = spec.radius_km * 1000 * rng.random(spec.stops) ** 0.75
+    angle = rng.random(spec.stops) * 2 * np.pi
+    lat = CENTER_LAT + radius * np.sin(angle) / METERS_PER_DEG_LAT
+    lon = CENTER_LON + radius * np.cos(angle) / (METERS_PER_DEG_LAT * np.cos(np.radians(CENTER_LAT)))
+    stop_ids = np.arange(1, spec.stops + 1)
+    return pd.DataFrame({
+        "stop_id": stop_ids,
+        "stop_name": [f"Parada {i}" for i in stop_ids],
+        "stop_lat": lat.round(6),
+        "stop_lon": lon.round(6),
+        "wheelchair_boarding": rng.integers(0, 3, spec.stops),
+    })
+
+
+def _corridor(stops: pd.DataFrame, count: int, rng) -> np.ndarray:
+    """Índices de las `count` paradas más cercanas a una recta aleatoria, ordenadas a lo largo de ella."""
+    x, y = _to_meters(stops["stop_lat"].to_numpy(), stops["stop_lon"].to_numpy())
+    anchor = rng.integers(len(stops))
+    theta = rng.random() * np.pi
+    dx, dy = x - x[anchor], y - y[anchor]
+    along = dx * np.cos(theta) + dy * np.sin(theta)
+    across = np.abs(-dx * np.sin(theta) + dy * np.cos(theta))
+    chosen = np.argpartition(across, count - 1)[:count] if count < len(stops) else np.arange(len(stops))
+    return chosen[np.argsort(along[chosen], kind="stable")]
+
+
+def _shape(lats: np.ndarray, lons: np.ndarray, points_per_segment: int, rng):
+    """Trazado que pasa por las paradas con puntos intermedios (ligero ruido) y distancia acumulada en km."""
+    steps = np.arange(points_per_segment) / points_per_segment
+    seg_lat = lats[:-1, None] + (lats[1:] - lats[:-1])[:, None] * steps[None, :]
+    seg_lon = lons[:-1, None] + (lons[1:] - lons[:-1])[:, None] * steps[None, :]
+    jitter = np.zeros_like(seg_lat)
+    jitter[:, 1:] = rng.normal(0, 0.00005, (len(seg_lat), points_per_segment - 1))
+    shape_lat = np.append((seg_lat + jitter).ravel(), lats[-1])
+    shape_lon = np.append((seg_lon + jitter).ravel(), lons[-1])
+    x, y = _to_meters(shape_lat, shape_lon)
+    dist = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    return shape_lat, shape_lon, dist / 1000
+
+
+def generate_feed(spec: FeedSpec) -> Dict[str, pd.DataFrame]:
+    """Tablas del feed como DataFrames (nombre de archivo sin extensión -> tabla)."""
+    rng = np.random.default_rng(spec.seed)
+    stops = _stops(spec, rng)
+    stop_lats = stops["stop_lat"].to_numpy()
+    stop_lons = stops["stop_lon"].to_numpy()
+    per_trip = max(2, min(spec.stops_per_trip, spec.stops))
+    services = (("LV", spec.trips_per_day), ("FS", max(2, spec.trips_per_day // 2)))
+
+    routes, shapes, trips, stop_times = [], [], [], []
+    for r in range(spec.routes):
+        route_id = f"R{r + 1:03d}"
+        routes.append({
+            "route_id": route_id,
+            "route_short_name": str(r + 1),
+            "route_long_name": f"Corredor sintético {r + 1}",
+            "route_type": 3,
+            "route_color": f"{rng.integers(0, 0xFFFFFF):06X}",
+            "route_text_color": "FFFFFF",
+        })
+        corridor = _corridor(stops, per_trip, rng)
+
+        for direction in (0, 1):
+            order = corridor if direction == 0 else corridor[::-1]
+            shape_id = f"{route_id}_{direction}"
+            shape_lat, shape_lon, shape_dist = _shape(stop_lats[order], stop_lons[order], spec.shape_points_per_segment, rng)
+            shapes.append(pd.DataFrame({
+                "shape_id": shape_id,
+                "shape_pt_lat": shape_lat.round(6),
+                "shape_pt_lon": shape_lon.round(6),
+                "shape_pt_sequence": np.arange(1, len(shape_lat) + 1),
+                "shape_dist_traveled": shape_dist.round(3),
+            }))
+
+            # Tiempo de cada parada respecto a la salida: distancia / velocidad + permanencia
+            stop_dist = shape_dist[::spec.shape_points_per_segment]
+            offsets = np.round(stop_dist * 1000 / SPEED_MPS).astype("int64") + DWELL_SECONDS * np.arange(len(order))
+
+            for service_id, trips_per_day in services:
+                count = max(1, trips_per_day // 2 + (direction == 0 and trips_per_day % 2))
+                departures = np.linspace(SERVICE_START, SERVICE_END, count).round().astype("int64")
+                trip_ids = [f"{route_id}_{service_id}_{direction}_{k + 1:04d}" for k in range(count)]
+                trips.append(pd.DataFrame({
+                    "route_id": route_id,
+                    "service_id": service_id,
+                    "trip_id": trip_ids,
+                    "trip_headsign": f"Parada {stops['stop_id'].iloc[order[-1]]}",
+                    "direction_id": direction,
+                    "shape_id": shape_id,
+                    "wheelchair_accessible": 1,
+                    "bikes_allowed": 0,
+                }))
+
+                arrivals = departures[:, None] + offsets[None, :]
+                stop_times.append(pd.DataFrame({
+                    "trip_id": np.repeat(trip_ids, len(order)),
+                    "arrival_seconds": arrivals.ravel(),
+                    "departure_seconds": (arrivals + DWELL_SECONDS).ravel(),
+                    "stop_id": np.tile(stops["stop_id"].to_numpy()[order], count),
+                    "stop_sequence": np.tile(np.arange(1, len(order) + 1), count),
+                    "timepoint": 1,
+                    "shape_dist_traveled": np.tile(stop_dist.round(3), count),
+                }))
+
+    stop_times = pd.concat(stop_times, ignore_index=True)
+    stop_times.insert(1, "arrival_time", format_gtfs_time_series(stop_times.pop("arrival_seconds")))
+    stop_times.insert(2, "departure_time", format_gtfs_time_series(stop_times.pop("departure_seconds")))
+
+    weekday = dict(monday=1, tuesday=1, wednesday=1, thursday=1, friday=1, saturday=0, sunday=0)
+    weekend = {day: 1 - value for day, value in weekday.items()}
+    return {
+        "agency": pd.DataFrame([{
+            "agency_id": 1, "agency_name": "Agencia Sintética", "agency_url": "https://example.com",
+            "agency_timezone": "America/Mexico_City", "agency_phone": "",
+        }]),
+        "calendar": pd.DataFrame([
+            {"service_id": "LV", **weekday, "start_date": "20250101", "end_date": "20251231"},
+            {"service_id": "FS", **weekend, "start_date": "20250101", "end_date": "20251231"},
+        ]),
+        "routes": pd.DataFrame(routes),
+        "stops": stops,
+        "shapes": pd.concat(shapes, ignore_index=True),
+        "trips": pd.concat(trips, ignore_index=True),
+        "stop_times": stop_times,
+        "feed_info": pd.DataFrame([{
+            "feed_publisher_name": "Benchmarks", "feed_publisher_url": "https://example.com",
+            "feed_lang": "es", "feed_start_date": "20250101", "feed_end_date": "20251231",
+            "feed_version": f"synthetic-{spec.seed}",
+        }]),
+    }
+
+
+def build_gtfs_zip(spec: FeedSpec) -> bytes:
+    """ZIP GTFS en memoria para la especificación dada."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for name, frame in generate_feed(spec).items():
+            zip_file.writestr(f"{name}.txt", frame.to_csv(index=False))
+    return buffer.getvalue()
+
+
+def describe(spec: FeedSpec) -> Dict[str, int]:
+    """Tamaño esperado del feed (sin generarlo)."""
+    per_trip = max(2, min(spec.stops_per_trip, spec.stops))
+    trips_per_route = sum(
+        max(1, n // 2 + (d == 0 and n % 2))
+        for n in (spec.trips_per_day, max(2, spec.trips_per_day // 2)) for d in (0, 1)
+    )
+    return {
+        "routes": spec.routes,
+        "stops": spec.stops,
+        "trips": spec.routes * trips_per_route,
+        "stop_times": spec.routes * trips_per_route * per_trip,
+        "shape_points": spec.routes * 2 * ((per_trip - 1) * spec.shape_points_per_segment + 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un feed GTFS sintético determinista")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    for field in FeedSpec._fields:
+        flag = "--" + field.replace("_", "-")
+        parser.add_argument(flag, type=type(FeedSpec._field_defaults[field]), default=None)
+    parser.add_argument("-o", "--output", default="synthetic_gtfs.zip")
+    args = parser.parse_args(argv)
+
+    overrides = {field: getattr(args, field) for field in FeedSpec._fields if getattr(args, field) is not None}
+    spec = SCALES[args.scale]._replace(**overrides)
+    Path(args.output).write_bytes(build_gtfs_zip(spec))
+    print(f"💾 {args.output}: {describe(spec)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
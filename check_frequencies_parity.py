@@ -0,0 +1,217 @@
+# check_frequencies_parity.py
+
+"""
+Paridad de frequencies: la misma sábana generada con trips explícitos y con
+use_frequencies=True debe producir los mismos horarios para los consumidores.
+
+Sobre una BD SQLite temporal (no toca DATABASE_URL) se genera una ruta
+sintética de alta frecuencia dos veces y se compara:
+- horario empalmado (generate_chained_timetable): encabezados, bus y tiempos
+  de cada corrida
+- tablero de salidas: todas las salidas de cada parada
+- exportación GTFS expandida (?expand_frequencies=true): stop_times por parada
+
+Uso:
+    python check_frequencies_parity.py
+"""
+
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import zipfile
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+ROUTE_ID = "1"
+SERVICE_ID = "LV"
+STOPS_PER_DIRECTION = 12
+BUSES = 6
+
+
+def _hm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def build_sheet():
+    """
+    Sábana consolidada: headway de 10 min por la mañana (recorrido de 40 min) y
+    de 15 min al mediodía (35 min); cada bus sale cada BUSES corridas. Las dos
+    últimas salidas quedan fuera de cualquier periodo constante.
+    """
+    departures = list(range(6 * 60, 9 * 60, 10)) + list(range(9 * 60, 13 * 60, 15)) + [13 * 60 + 7, 13 * 60 + 20]
+    sheet = []
+    for k, start in enumerate(departures):
+        travel = 40 if start < 9 * 60 else 35
+        sheet.append({
+            "BusID": k % BUSES + 1,
+            "Salida en Centro": _hm(start),
+            "Llegada en Barrio": _hm(start + travel),
+            "Salida en Barrio": _hm(start + travel + 5),
+            "Llegada en Centro": _hm(start + 2 * travel + 5),
+        })
+    return sheet
+
+
+def build_stops_data():
+    stop_ids = [str(100 + i) for i in range(STOPS_PER_DIRECTION)]
+    return (
+        [{"stop_id": s, "stop_sequence": i + 1, "direction_id": 0, "shape_id": "SH1"}
+         for i, s in enumerate(stop_ids)]
+        + [{"stop_id": s, "stop_sequence": i + 1, "direction_id": 1, "shape_id": "SH2"}
+           for i, s in enumerate(reversed(stop_ids))]
+    )
+
+
+def seed(db):
+    from app.models.gtfs_models import Agency, Calendar, Route, Shape, Stop
+
+    db.add(Agency(agency_id=1, agency_name="Paridad"))
+    db.add(Route(route_id=ROUTE_ID, route_short_name=ROUTE_ID, route_type=3, agency_id=1))
+    db.add(Calendar(
+        service_id=SERVICE_ID, monday=True, tuesday=True, wednesday=True, thursday=True, friday=True,
+        start_date=date(2025, 1, 1), end_date=date(2025, 12, 31)
+    ))
+    for i in range(STOPS_PER_DIRECTION):
+        db.add(Stop(stop_id=100 + i, stop_name=f"Parada {i + 1}",
+                    stop_lat=Decimal("20.9") + Decimal(i) / 1000, stop_lon=Decimal("-89.6")))
+    for shape_id, order in (("SH1", range(STOPS_PER_DIRECTION)), ("SH2", reversed(range(STOPS_PER_DIRECTION)))):
+        for seq, i in enumerate(order):
+            db.add(Shape(shape_id=shape_id, shape_pt_sequence=seq, shape_pt_lat=Decimal("20.9") + Decimal(i) / 1000,
+                         shape_pt_lon=Decimal("-89.6"), shape_dist_traveled=seq * 110.0))
+    db.commit()
+
+
+def clear_trips(db):
+    from app.models.gtfs_models import Frequency, StopTime, Trip
+    from app.services.departure_board import departure_index
+
+    db.query(StopTime).delete(synchronize_session=False)
+    db.query(Frequency).delete(synchronize_session=False)
+    db.query(Trip).delete(synchronize_session=False)
+    db.commit()
+    departure_index.invalidate_all()
+
+
+async def _chained_timetable(selected_stop_ids):
+    from app.api.timetables import compute_chained_timetables
+    from app.database import get_async_db
+
+    sessions = get_async_db()
+    db = await sessions.__anext__()
+    try:
+        return (await compute_chained_timetables(db, ROUTE_ID, [SERVICE_ID], selected_stop_ids))[0]
+    finally:
+        await sessions.aclose()
+
+
+async def _export_zip(db):
+    from app.api.export_gtfs import export_gtfs_zip
+
+    response = await export_gtfs_zip(expand_frequencies=True, db=db)
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def capture(db, use_frequencies: bool) -> dict:
+    """Genera la ruta y devuelve lo que ven los consumidores (sin trip_ids, que cambian al expandir)."""
+    import pandas as pd
+
+    from app.models.gtfs_models import Frequency, Trip
+    from app.services.departure_board import departure_index
+    from app.services.gtfs_from_sheet import GTFSFromSheetGenerator
+    from app.utils.gtfs_time import parse_gtfs_time_series
+
+    clear_trips(db)
+    result = GTFSFromSheetGenerator(db).generate(
+        build_sheet(), ROUTE_ID, "Paridad", SERVICE_ID, "Lunes-Viernes", "SH1", "SH2",
+        build_stops_data(), use_frequencies=use_frequencies
+    )
+    if not result["success"]:
+        raise RuntimeError(f"El generador falló: {result['errors']}")
+
+    stop_ids = [str(100 + i) for i in range(STOPS_PER_DIRECTION)]
+    timetable = asyncio.run(_chained_timetable([stop_ids[0], stop_ids[len(stop_ids) // 2], stop_ids[-1]]))
+
+    board = {
+        stop_id: sorted(d.seconds for d in departure_index.get_stop(db, int(stop_id)).departures)
+        for stop_id in stop_ids
+    }
+
+    with zipfile.ZipFile(io.BytesIO(asyncio.run(_export_zip(db)))) as feed:
+        stop_times = pd.read_csv(feed.open("stop_times.txt"), dtype=str)
+    exported = sorted(zip(stop_times["stop_id"], parse_gtfs_time_series(stop_times["departure_time"]).astype(int)))
+
+    return {
+        "stored_trips": db.query(Trip).count(),
+        "frequencies": db.query(Frequency).count(),
+        "headers": timetable["headers"],
+        "corridas": [(c["bus"], c["times"]) for c in timetable["corridas"]],
+        "board": board,
+        "export": exported,
+    }
+
+
+def compare(explicit: dict, compressed: dict) -> list:
+    diffs = []
+    if explicit["headers"] != compressed["headers"]:
+        diffs.append(f"encabezados: {compressed['headers']} != {explicit['headers']}")
+    if len(explicit["corridas"]) != len(compressed["corridas"]):
+        diffs.append(f"horario: {len(compressed['corridas'])} corridas, se esperaban {len(explicit['corridas'])}")
+    for i, (exp, act) in enumerate(zip(explicit["corridas"], compressed["corridas"])):
+        if exp != act:
+            diffs.append(f"horario corrida {i + 1}: {act} != {exp} (explícito)")
+            break
+    for stop_id, departures in explicit["board"].items():
+        if compressed["board"].get(stop_id) != departures:
+            diffs.append(f"tablero parada {stop_id}: salidas distintas")
+            break
+    if explicit["export"] != compressed["export"]:
+        diffs.append("exportación expandida: stop_times distintos")
+    return diffs
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory(prefix="frequencies_parity_", ignore_cleanup_errors=True) as workdir:
+        database_url = f"sqlite:///{(Path(workdir) / 'parity.db').as_posix()}"
+        # La configuración se lee al importar app.*: hay que fijarla antes
+        os.environ.update({
+            "DATABASE_URL": database_url,
+            "DATABASE_READ_URL": database_url,
+            "FEED_SNAPSHOT_DIR": str(Path(workdir) / "feed_snapshot"),
+            "SECRET_KEY": os.environ.get("SECRET_KEY", "parity"),
+        })
+
+        from app.database import SessionLocal
+        from app.schema_version import upgrade_schema
+
+        upgrade_schema()
+        db = SessionLocal()
+        try:
+            seed(db)
+            explicit = capture(db, use_frequencies=False)
+            compressed = capture(db, use_frequencies=True)
+        finally:
+            db.close()
+
+    print("=" * 70)
+    print(f"📦 Explícito: {explicit['stored_trips']} trips")
+    print(f"📦 Frequencies: {compressed['stored_trips']} trips + {compressed['frequencies']} periodos")
+    diffs = compare(explicit, compressed)
+    if compressed["frequencies"] == 0:
+        diffs.append("no se generó ningún periodo de frequencies")
+    if diffs:
+        print("❌ Sin paridad")
+        for diff in diffs:
+            print(f"   - {diff}")
+        return 1
+    print(f"✅ Paridad: {len(explicit['corridas'])} corridas, tablero y exportación expandida idénticos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# check_scheduling_parity.py
+
+"""
+Arnés de paridad: motor nativo de programación vs. salidas del libro de Excel.
+
+Cada caso es un JSON en el directorio de casos:
+    {"parameters": {"tabla1": {...}, "tabla2": [...], "tabla3": [...]},
+     "expected":   {"tabla4": [[desde, hasta, valor], ...], ..., "tabla7": [...]}}
+
+- Comparar (cualquier servidor):
+    python check_scheduling_parity.py [directorio_casos]
+- Capturar "expected" desde el libro (Windows con Excel + xlwings):
+    python check_scheduling_parity.py --capture ruta/al/libro.xlsx [directorio_casos]
+
+Los valores del libro pueden venir como fracción de día, datetime o texto
+"HH:MM"; ambos lados se normalizan a minutos antes de comparar.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.excel_processor import process_scheduling_parameters
+from app.services.scheduling_engine import to_minutes
+
+DEFAULT_CASES_DIR = Path(__file__).parent / "data" / "scheduling_parity"
+TABLES = ("tabla4", "tabla5", "tabla6", "tabla7")
+# tabla4/5: [desde, hasta, headway en minutos]; tabla6/7: [desde, hasta, tiempo]
+HEADWAY_TABLES = {"tabla4", "tabla5"}
+
+
+def _headway_minutes(value):
+    """Headway como número de minutos (o fracción de día si la celda tenía formato de hora)."""
+    if isinstance(value, str):
+        return to_minutes(value) if ":" in value else int(float(value))
+    if isinstance(value, float) and value < 1:
+        return to_minutes(value)
+    return int(value)
+
+
+def normalize_table(name, rows):
+    normalized = []
+    for row in rows:
+        desde, hasta, value = (list(row) + [None] * 3)[:3]
+        value = _headway_minutes(value) if name in HEADWAY_TABLES else to_minutes(value)
+        normalized.append((to_minutes(desde), to_minutes(hasta), value))
+    return normalized
+
+
+def compare_case(path: Path) -> list:
+    case = json.loads(path.read_text(encoding="utf-8"))
+    actual = process_scheduling_parameters(case["parameters"])
+    if not actual["success"]:
+        return [f"error del motor: {actual['error']}"]
+
+    diffs = []
+    for name in TABLES:
+        expected_rows = normalize_table(name, case["expected"].get(name, []))
+        actual_rows = normalize_table(name, actual[name])
+        if len(expected_rows) != len(actual_rows):
+            diffs.append(f"{name}: {len(actual_rows)} filas, se esperaban {len(expected_rows)}")
+        for i, (exp, act) in enumerate(zip(expected_rows, actual_rows)):
+            if exp != act:
+                diffs.append(f"{name} fila {i + 1}: {act} != {exp} (esperado)")
+                break
+    return diffs
+
+
+def capture(workbook: Path, cases_dir: Path):
+    """Recalcula cada caso en el libro (xlwings) y guarda sus tablas 4–7 como 'expected'."""
+    for path in sorted(cases_dir.glob("*.json")):
+        case = json.loads(path.read_text(encoding="utf-8"))
+        result = process_scheduling_parameters(case["parameters"], excel_path=str(workbook))
+        if not result["success"]:
+            print(f"❌ {path.name}: {result['error']}")
+            continue
+        case["source"] = f"libro {workbook.name}"
+        case["expected"] = {name: result[name] for name in TABLES}
+        path.write_text(json.dumps(case, indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+        print(f"💾 {path.name}: salidas del libro capturadas")
+
+
+def main(argv):
+    if argv[:1] == ["--capture"]:
+        if len(argv) < 2:
+            print("Uso: python check_scheduling_parity.py --capture libro.xlsx [directorio_casos]")
+            return 2
+        capture(Path(argv[1]).resolve(), Path(argv[2]) if len(argv) > 2 else DEFAULT_CASES_DIR)
+        return 0
+
+    cases_dir = Path(argv[0]) if argv else DEFAULT_CASES_DIR
+    cases = sorted(cases_dir.glob("*.json"))
+    if not cases:
+        print(f"⚠️ No hay casos en {cases_dir}")
+        return 1
+
+    failures = 0
+    for path in cases:
+        diffs = compare_case(path)
+        if diffs:
+            failures += 1
+            print(f"❌ {path.name}")
+            for diff in diffs:
+                print(f"   - {diff}")
+        else:
+            print(f"✅ {path.name}")
+
+    print("=" * 70)
+    print(f"{len(cases) - failures}/{len(cases)} casos con paridad")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,106 @@
+# check_stops_import_parity.py
+
+"""
+Paridad de la importación de paradas: el mismo contenido subido como CSV y
+como XLSX debe dar las mismas paradas válidas, los mismos errores por fila y
+las mismas filas omitidas.
+
+Incluye los casos que distinguen celdas vacías de texto: una fila válida con
+wheelchair_boarding vacío, una fila completamente vacía (se salta sin error),
+una fila sin stop_id (omitida), un stop_id repetido y una latitud inválida.
+No usa la BD: solo lectura (read_*_frame) y validación (validate_stops_frame).
+
+Uso:
+    python check_stops_import_parity.py
+"""
+
+import csv
+import io
+import os
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+HEADERS = ["stop_id", "stop_name", "stop_lat", "stop_lon", "wheelchair_boarding"]
+ROWS = [
+    [5, "Centro", 20.97, -89.62, 1],
+    [6, "G", 20.5, -89.5, None],            # wheelchair_boarding vacío: válida
+    [None, None, None, None, None],          # fila vacía: se salta sin error
+    [None, "Sin id", 20.1, -89.1, 0],        # sin stop_id: omitida
+    [5, "Repetida", 20.2, -89.2, 0],         # stop_id repetido: gana la primera
+    [7, "Fuera de rango", 95, -89.3, 2],     # latitud inválida: error
+    [8, "Última", 21.0, -89.0, 0],
+]
+EXPECTED_STOP_IDS = [5, 6, 8]
+EXPECTED_SKIPPED = 2
+EXPECTED_ERRORS = ["Error en fila 7: stop_lat '95' inválida (debe estar entre -90 y 90)"]
+
+
+def build_csv() -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    for row in ROWS:
+        writer.writerow(["" if value is None else value for value in row])
+    return buffer.getvalue().encode("utf-8")
+
+
+def build_xlsx() -> bytes:
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(HEADERS)
+    for row in ROWS:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def capture(processor, frame) -> dict:
+    stops, errors, skipped = processor.validate_stops_frame(frame)
+    return {
+        "stops": stops.reset_index(drop=True).astype(str).to_dict("records"),
+        "errors": errors,
+        "skipped": skipped,
+    }
+
+
+def main() -> int:
+    # La configuración se lee al importar app.*; no se abre ninguna conexión
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    os.environ.setdefault("SECRET_KEY", "parity")
+
+    from app.services.csv_processor import FileProcessor
+
+    processor = FileProcessor(None)
+    from_csv = capture(processor, processor.read_csv_frame(build_csv()))
+    from_xlsx = capture(processor, processor.read_xlsx_frame(build_xlsx()))
+
+    diffs = []
+    for key in ("stops", "errors", "skipped"):
+        if from_csv[key] != from_xlsx[key]:
+            diffs.append(f"{key}: XLSX {from_xlsx[key]} != CSV {from_csv[key]}")
+    stop_ids = [int(stop["stop_id"]) for stop in from_xlsx["stops"]]
+    if stop_ids != EXPECTED_STOP_IDS:
+        diffs.append(f"paradas válidas: {stop_ids}, se esperaban {EXPECTED_STOP_IDS}")
+    if from_xlsx["errors"] != EXPECTED_ERRORS:
+        diffs.append(f"errores: {from_xlsx['errors']}, se esperaban {EXPECTED_ERRORS}")
+    if from_xlsx["skipped"] != EXPECTED_SKIPPED:
+        diffs.append(f"omitidas: {from_xlsx['skipped']}, se esperaban {EXPECTED_SKIPPED}")
+
+    print("=" * 70)
+    if diffs:
+        print("❌ Sin paridad")
+        for diff in diffs:
+            print(f"   - {diff}")
+        return 1
+    print(f"✅ Paridad CSV/XLSX: {len(stop_ids)} paradas, {len(EXPECTED_ERRORS)} error, {EXPECTED_SKIPPED} omitidas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
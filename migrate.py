@@ -0,0 +1,54 @@
+# migrate.py
+
+"""
+Aplica las migraciones de Alembic (migrations/) a la BD de DATABASE_URL.
+
+Pensado para correr en el despliegue, antes de arrancar los workers: con el
+advisory lock y lock_timeout de app.schema_version es seguro lanzarlo con la
+versión anterior de la app todavía atendiendo peticiones.
+
+BDs creadas antes de Alembic (create_all): la revisión 0001 es idempotente,
+así que se adoptan con el mismo `upgrade` sin recrear nada.
+
+Uso:
+    python migrate.py                # upgrade a head
+    python migrate.py upgrade 0002   # hasta una revisión concreta
+    python migrate.py current        # revisión actual y head
+    python migrate.py check          # código 1 si hay migraciones pendientes
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.schema_version import current_revision, head_revision, upgrade_schema
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Migraciones del esquema (Alembic)")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=("upgrade", "current", "check"))
+    parser.add_argument("revision", nargs="?", default="head")
+    args = parser.parse_args(argv)
+
+    head = head_revision()
+    if args.command == "upgrade":
+        print("=" * 70)
+        print(f"🔧 MIGRANDO ESQUEMA A {args.revision}")
+        print("=" * 70)
+        revision = upgrade_schema(revision=args.revision)
+        print(f"🎉 Esquema en revisión {revision} (head {head})")
+        return 0
+
+    current = current_revision()
+    print(f"📋 Revisión actual: {current or 'sin versión'} — head: {head}")
+    if args.command == "check" and current != head:
+        print("⚠️ Hay migraciones pendientes: python migrate.py")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
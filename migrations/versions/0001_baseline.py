@@ -0,0 +1,209 @@
+"""Esquema base: tablas GTFS, patrones y parámetros de programación
+
+Refleja el esquema que creaba create_all antes de Alembic. Es idempotente:
+en una BD existente solo crea lo que falta, así que sirve tanto para BDs
+nuevas como para adoptar las que ya estaban en producción.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _existing_tables():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _create_table(existing, name, *columns):
+    if name in existing:
+        return False
+    op.create_table(name, *columns)
+    return True
+
+
+def _create_indexes(table, indexes):
+    present = {idx["name"] for idx in sa.inspect(op.get_bind()).get_indexes(table)}
+    for name, columns in indexes:
+        if name not in present:
+            op.create_index(name, table, columns)
+
+
+def upgrade() -> None:
+    existing = _existing_tables()
+
+    _create_table(
+        existing, "agencies",
+        sa.Column("agency_id", sa.Integer(), primary_key=True),
+        sa.Column("agency_name", sa.String(255), nullable=False),
+        sa.Column("agency_url", sa.String(500), nullable=True),
+        sa.Column("agency_timezone", sa.String(50), nullable=True),
+        sa.Column("agency_phone", sa.String(50), nullable=True),
+    )
+    _create_table(
+        existing, "calendar",
+        sa.Column("service_id", sa.String(50), primary_key=True),
+        sa.Column("monday", sa.Boolean(), nullable=True),
+        sa.Column("tuesday", sa.Boolean(), nullable=True),
+        sa.Column("wednesday", sa.Boolean(), nullable=True),
+        sa.Column("thursday", sa.Boolean(), nullable=True),
+        sa.Column("friday", sa.Boolean(), nullable=True),
+        sa.Column("saturday", sa.Boolean(), nullable=True),
+        sa.Column("sunday", sa.Boolean(), nullable=True),
+        sa.Column("start_date", sa.Date(), nullable=True),
+        sa.Column("end_date", sa.Date(), nullable=True),
+    )
+    _create_table(
+        existing, "calendar_dates",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("service_id", sa.String(50), sa.ForeignKey("calendar.service_id"), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("exception_type", sa.Integer(), nullable=False),
+    )
+    _create_table(
+        existing, "feed_info",
+        sa.Column("feed_info_id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("feed_publisher_name", sa.String(255), nullable=False),
+        sa.Column("feed_publisher_url", sa.String(500), nullable=True),
+        sa.Column("feed_lang", sa.String(10), nullable=True),
+        sa.Column("feed_start_date", sa.Date(), nullable=True),
+        sa.Column("feed_end_date", sa.Date(), nullable=True),
+        sa.Column("feed_version", sa.String(50), nullable=True),
+        sa.Column("default_lang", sa.String(10), nullable=True),
+        sa.Column("feed_contact_url", sa.String(500), nullable=True),
+        sa.Column("feed_contact_email", sa.String(255), nullable=True),
+    )
+    _create_table(
+        existing, "fare_attributes",
+        sa.Column("fare_id", sa.String(50), primary_key=True),
+        sa.Column("price", sa.DECIMAL(10, 2), nullable=True),
+        sa.Column("currency_type", sa.String(3), nullable=True),
+        sa.Column("payment_method", sa.Integer(), nullable=True),
+        sa.Column("transfers", sa.Integer(), nullable=True),
+    )
+    _create_table(
+        existing, "routes",
+        sa.Column("route_id", sa.String(50), primary_key=True),
+        sa.Column("route_short_name", sa.String(50), nullable=True),
+        sa.Column("route_long_name", sa.String(255), nullable=True),
+        sa.Column("route_type", sa.Integer(), nullable=True),
+        sa.Column("route_color", sa.String(6), nullable=True),
+        sa.Column("route_text_color", sa.String(6), nullable=True),
+        sa.Column("agency_id", sa.Integer(), sa.ForeignKey("agencies.agency_id"), nullable=True),
+    )
+    _create_table(
+        existing, "fare_rules",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("fare_id", sa.String(50), sa.ForeignKey("fare_attributes.fare_id"), nullable=True),
+        sa.Column("route_id", sa.String(50), sa.ForeignKey("routes.route_id"), nullable=True),
+    )
+    _create_table(
+        existing, "shapes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("shape_id", sa.String(50), nullable=True),
+        sa.Column("shape_pt_sequence", sa.Integer(), nullable=True),
+        sa.Column("shape_pt_lat", sa.DECIMAL(10, 8), nullable=True),
+        sa.Column("shape_pt_lon", sa.DECIMAL(11, 8), nullable=True),
+        sa.Column("shape_dist_traveled", sa.Float(), nullable=True),
+    )
+    _create_table(
+        existing, "stops",
+        sa.Column("stop_id", sa.Integer(), primary_key=True),
+        sa.Column("stop_name", sa.String(255), nullable=False),
+        sa.Column("stop_lat", sa.DECIMAL(10, 8), nullable=False),
+        sa.Column("stop_lon", sa.DECIMAL(11, 8), nullable=False),
+        sa.Column("wheelchair_boarding", sa.Integer(), nullable=True),
+    )
+    _create_table(
+        existing, "trips",
+        sa.Column("trip_id", sa.String(50), primary_key=True),
+        sa.Column("route_id", sa.String(50), sa.ForeignKey("routes.route_id"), nullable=True),
+        sa.Column("service_id", sa.String(50), sa.ForeignKey("calendar.service_id"), nullable=True),
+        sa.Column("trip_headsign", sa.String(255), nullable=True),
+        sa.Column("direction_id", sa.Integer(), nullable=True),
+        sa.Column("block_id", sa.String(50), nullable=True),
+        sa.Column("shape_id", sa.String(50), nullable=True),
+        sa.Column("wheelchair_accessible", sa.Integer(), nullable=True),
+        sa.Column("bikes_allowed", sa.Integer(), nullable=True),
+    )
+    # Las columnas en segundos y su índice llegan en 0002 (también para BDs antiguas)
+    _create_table(
+        existing, "stop_times",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("trip_id", sa.String(50), sa.ForeignKey("trips.trip_id"), nullable=True),
+        sa.Column("stop_id", sa.Integer(), sa.ForeignKey("stops.stop_id"), nullable=True),
+        sa.Column("timepoint", sa.Integer(), nullable=True),
+        sa.Column("stop_sequence", sa.Integer(), nullable=True),
+        sa.Column("shape_dist_traveled", sa.Float(), nullable=True),
+    )
+    _create_table(
+        existing, "route_stop_patterns",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("route_id", sa.String(50), nullable=False),
+        sa.Column("direction_id", sa.Integer(), nullable=True),
+        sa.Column("trip_id", sa.String(50), nullable=False),
+        sa.Column("stop_count", sa.Integer(), nullable=False),
+        sa.Column("stop_sequence", sa.Integer(), nullable=True),
+        sa.Column("stop_id", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        existing, "scheduling_parameters",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("route_id", sa.String(50), nullable=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("tabla1", sa.JSON(), nullable=False),
+        sa.Column("tabla2", sa.JSON(), nullable=True),
+        sa.Column("tabla3", sa.JSON(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+
+    # Índices de columna (index=True) con los nombres que generaba create_all
+    _create_indexes("agencies", [("ix_agencies_agency_id", ["agency_id"])])
+    _create_indexes("calendar", [("ix_calendar_service_id", ["service_id"])])
+    _create_indexes("calendar_dates", [
+        ("ix_calendar_dates_id", ["id"]),
+        ("ix_calendar_dates_service_id", ["service_id"]),
+    ])
+    _create_indexes("feed_info", [("ix_feed_info_feed_info_id", ["feed_info_id"])])
+    _create_indexes("fare_attributes", [("ix_fare_attributes_fare_id", ["fare_id"])])
+    _create_indexes("fare_rules", [("ix_fare_rules_id", ["id"])])
+    _create_indexes("routes", [("ix_routes_route_id", ["route_id"])])
+    _create_indexes("shapes", [("ix_shapes_id", ["id"]), ("ix_shapes_shape_id", ["shape_id"])])
+    _create_indexes("stops", [("ix_stops_stop_id", ["stop_id"])])
+    _create_indexes("trips", [("ix_trips_trip_id", ["trip_id"]), ("ix_trips_route_id", ["route_id"])])
+    _create_indexes("stop_times", [
+        ("ix_stop_times_id", ["id"]),
+        ("ix_stop_times_trip_id", ["trip_id"]),
+        ("ix_stop_times_stop_id", ["stop_id"]),
+    ])
+    _create_indexes("route_stop_patterns", [
+        ("ix_route_stop_patterns_id", ["id"]),
+        ("ix_route_stop_patterns_route_direction", ["route_id", "direction_id", "stop_sequence"]),
+    ])
+    _create_indexes("scheduling_parameters", [
+        ("ix_scheduling_parameters_id", ["id"]),
+        ("ix_scheduling_parameters_route_id", ["route_id"]),
+    ])
+
+    # El marcador de huella del arranque anterior queda reemplazado por alembic_version
+    if "app_schema_marker" in existing:
+        op.drop_table("app_schema_marker")
+
+
+def downgrade() -> None:
+    for table in (
+        "scheduling_parameters", "route_stop_patterns", "stop_times", "trips", "stops",
+        "shapes", "fare_rules", "routes", "fare_attributes", "feed_info",
+        "calendar_dates", "calendar", "agencies",
+    ):
+        op.drop_table(table)
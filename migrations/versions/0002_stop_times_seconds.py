@@ -0,0 +1,111 @@
+"""stop_times en segundos enteros (arrival_seconds / departure_seconds)
+
+Incorpora migrate_stop_times_to_seconds.py: agrega las columnas si faltan,
+convierte las columnas Time antiguas corrigiendo por trip los cruces de
+medianoche (23:50 -> 00:10 pasa a 24:10) y crea el índice de
+departure_seconds al final, una vez cargados los datos.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.gtfs_time import parse_gtfs_time, SECONDS_PER_DAY
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def _unwrap(seconds, previous, wraps):
+    """Suma 24h por cada retroceso detectado dentro del trip."""
+    if seconds is None:
+        return None, previous, wraps
+    if previous is not None and seconds < previous:
+        wraps += 1
+    return seconds + wraps * SECONDS_PER_DAY, seconds, wraps
+
+
+def _convert_legacy_times(conn, columns) -> int:
+    legacy_arrival = "arrival_time" if "arrival_time" in columns else "NULL"
+    legacy_departure = "departure_time" if "departure_time" in columns else "NULL"
+
+    select_stmt = sa.text(
+        f"SELECT id, trip_id, {legacy_arrival}, {legacy_departure} FROM stop_times "
+        "WHERE arrival_seconds IS NULL AND departure_seconds IS NULL "
+        "ORDER BY trip_id, stop_sequence"
+    )
+    update_stmt = sa.text(
+        "UPDATE stop_times SET arrival_seconds = :arrival, departure_seconds = :departure "
+        "WHERE id = :id"
+    )
+
+    converted = 0
+    current_trip = None
+    prev_arr = prev_dep = None
+    wraps_arr = wraps_dep = 0
+    batch = []
+    # Se lee todo antes de escribir: el cursor abierto y los UPDATE comparten conexión
+    for row_id, trip_id, arrival, departure in conn.execute(select_stmt).all():
+        if trip_id != current_trip:
+            current_trip = trip_id
+            prev_arr = prev_dep = None
+            wraps_arr = wraps_dep = 0
+
+        arr_seconds, prev_arr, wraps_arr = _unwrap(parse_gtfs_time(arrival), prev_arr, wraps_arr)
+        dep_seconds, prev_dep, wraps_dep = _unwrap(parse_gtfs_time(departure), prev_dep, wraps_dep)
+        if arr_seconds is None and dep_seconds is None:
+            continue
+
+        batch.append({"id": row_id, "arrival": arr_seconds, "departure": dep_seconds})
+        if len(batch) >= BATCH_SIZE:
+            conn.execute(update_stmt, batch)
+            converted += len(batch)
+            print(f"  ↪ {converted} filas convertidas...")
+            batch = []
+
+    if batch:
+        conn.execute(update_stmt, batch)
+        converted += len(batch)
+    return converted
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = {col["name"] for col in inspector.get_columns("stop_times")}
+    indexes = {idx["name"] for idx in inspector.get_indexes("stop_times")}
+
+    # Columnas nulas sin valor por defecto: ALTER instantáneo también en PostgreSQL
+    for col_name in ("arrival_seconds", "departure_seconds"):
+        if col_name not in columns:
+            op.add_column("stop_times", sa.Column(col_name, sa.Integer(), nullable=True))
+
+    if "arrival_time" in columns or "departure_time" in columns:
+        converted = _convert_legacy_times(conn, columns)
+        print(f"✅ {converted} stop_times convertidos a segundos")
+        print("💡 Las columnas arrival_time/departure_time antiguas ya no se usan y pueden eliminarse")
+
+    if "ix_stop_times_departure_seconds" not in indexes:
+        if conn.dialect.name == "postgresql":
+            # CONCURRENTLY no bloquea escrituras, pero no puede correr dentro de una transacción
+            with op.get_context().autocommit_block():
+                op.create_index(
+                    "ix_stop_times_departure_seconds", "stop_times", ["departure_seconds"],
+                    postgresql_concurrently=True,
+                )
+        else:
+            op.create_index("ix_stop_times_departure_seconds", "stop_times", ["departure_seconds"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stop_times_departure_seconds", table_name="stop_times")
+    with op.batch_alter_table("stop_times") as batch_op:
+        batch_op.drop_column("departure_seconds")
+        batch_op.drop_column("arrival_seconds")
@@ -0,0 +1,70 @@
+"""Índices compuestos para las consultas calientes
+
+- stop_times (trip_id, stop_sequence): paradas de un trip en orden
+  (exportación, patrones, snapshot del feed)
+- stop_times (stop_id, departure_seconds): tablero de salidas por parada
+- trips (route_id, direction_id): patrones y horarios por sentido
+- trips (service_id): filtros por servicio (timetables, bulk)
+- shapes (shape_id, shape_pt_sequence): lectura ordenada de shapes
+- calendar_dates (service_id, date): excepciones del calendario activo
+
+En PostgreSQL se crean con CONCURRENTLY para no bloquear escrituras.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_stop_times_trip_sequence", "stop_times", ["trip_id", "stop_sequence"]),
+    ("ix_stop_times_stop_departure", "stop_times", ["stop_id", "departure_seconds"]),
+    ("ix_trips_route_direction", "trips", ["route_id", "direction_id"]),
+    ("ix_trips_service_id", "trips", ["service_id"]),
+    ("ix_shapes_shape_sequence", "shapes", ["shape_id", "shape_pt_sequence"]),
+    ("ix_calendar_dates_service_date", "calendar_dates", ["service_id", "date"]),
+]
+
+
+def _invalid_postgres_indexes(conn):
+    """Índices que dejó a medias un CREATE INDEX CONCURRENTLY interrumpido."""
+    rows = conn.execute(sa.text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE NOT i.indisvalid"
+    ))
+    return {row[0] for row in rows}
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    is_postgres = conn.dialect.name == "postgresql"
+    invalid = _invalid_postgres_indexes(conn) if is_postgres else set()
+    missing = [
+        (name, table, columns) for name, table, columns in INDEXES
+        if name in invalid or name not in {idx["name"] for idx in inspector.get_indexes(table)}
+    ]
+    if not missing:
+        return
+
+    if is_postgres:
+        with op.get_context().autocommit_block():
+            for name, table, columns in missing:
+                if name in invalid:
+                    op.drop_index(name, table_name=table, postgresql_concurrently=True)
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+    else:
+        for name, table, columns in missing:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
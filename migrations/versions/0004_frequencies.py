@@ -0,0 +1,49 @@
+"""frequencies: trips plantilla con headway constante (frequencies.txt)
+
+Tiempos en segundos desde el inicio del día de servicio, como stop_times.
+Idempotente igual que 0001: solo crea lo que falta.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_frequencies_id", ["id"]),
+    ("ix_frequencies_trip_id", ["trip_id"]),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if "frequencies" not in inspector.get_table_names():
+        op.create_table(
+            "frequencies",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("trip_id", sa.String(50), sa.ForeignKey("trips.trip_id"), nullable=False),
+            sa.Column("start_seconds", sa.Integer(), nullable=False),
+            sa.Column("end_seconds", sa.Integer(), nullable=False),
+            sa.Column("headway_secs", sa.Integer(), nullable=False),
+            sa.Column("exact_times", sa.Integer(), nullable=True),
+        )
+        present = set()
+    else:
+        present = {idx["name"] for idx in inspector.get_indexes("frequencies")}
+
+    for name, columns in INDEXES:
+        if name not in present:
+            op.create_index(name, "frequencies", columns)
+
+
+def downgrade() -> None:
+    for name, _ in reversed(INDEXES):
+        op.drop_index(name, table_name="frequencies")
+    op.drop_table("frequencies")
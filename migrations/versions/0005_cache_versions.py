@@ -0,0 +1,41 @@
+"""cache_versions: versión compartida de los cachés en memoria de cada worker
+
+Una fila por caché; las escrituras la incrementan y los demás workers de
+uvicorn reconstruyen su copia al ver el cambio. Idempotente igual que 0001.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+CACHE_NAMES = ["calendar", "departures", "spatial"]
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if "cache_versions" not in sa.inspect(conn).get_table_names():
+        op.create_table(
+            "cache_versions",
+            sa.Column("name", sa.String(50), primary_key=True),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+        )
+
+    # Filas iniciales: el primer incremento es un UPDATE, sin carreras de INSERT entre workers
+    table = sa.table("cache_versions", sa.column("name", sa.String), sa.column("version", sa.Integer))
+    present = {row[0] for row in conn.execute(sa.select(table.c.name))}
+    missing = [{"name": name, "version": 0} for name in CACHE_NAMES if name not in present]
+    if missing:
+        op.bulk_insert(table, missing)
+
+
+def downgrade() -> None:
+    op.drop_table("cache_versions")